@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark do custo de reportar progresso de upload.
+Simula um upload (recebimento, extração e envio das músicas) e mede
+quanto tempo é gasto em update_progress / UploadProgressTracker.
+"""
+import sys
+import time
+import tracemalloc
+
+from routes import upload_progress as progress_module
+
+
+def bench_update_progress(iterations):
+    upload_id = "bench-update-progress"
+    start = time.perf_counter()
+    for i in range(iterations):
+        progress_module.update_progress(upload_id, i % 100, "bench", bytes_done=i, bytes_total=iterations)
+    progress_module.wait_for_writes()
+    elapsed = time.perf_counter() - start
+    progress_module.progress_store.delete(upload_id)
+    return elapsed
+
+
+def bench_tracker(archive_mb, songs):
+    """Simula um upload de `archive_mb` MB com `songs` músicas em chunks de 1MB."""
+    upload_id = "bench-tracker"
+    chunk = 1024 * 1024
+    total = archive_mb * chunk
+    song_size = total // songs
+
+    tracker = progress_module.UploadProgressTracker(upload_id)
+    start = time.perf_counter()
+
+    tracker.set_total("recebendo_arquivo", total)
+    for _ in range(archive_mb):
+        tracker.advance("recebendo_arquivo", chunk, "lendo_arquivo")
+    tracker.finish_stage("recebendo_arquivo", "extraindo_arquivo")
+
+    tracker.set_total("extraindo_arquivo", total)
+    for _ in range(songs):
+        tracker.advance("extraindo_arquivo", song_size, "extraindo_zip")
+    tracker.finish_stage("extraindo_arquivo", "zip_extraido")
+
+    tracker.finish_stage("criando_album", "video_youtube_criado")
+
+    tracker.set_total("enviando_musicas", song_size * songs)
+    for idx in range(1, songs + 1):
+        tracker.report(f"enviando_musica_{idx}", force=True)
+        tracker.advance("enviando_musicas", song_size, f"musica_{idx}_concluida")
+        tracker.report(f"musica_{idx}_registrada", force=True)
+    tracker.finish_stage("enviando_musicas", "atualizando_contagem_musicas")
+    tracker.finish_stage("finalizando", "concluido")
+    progress_module.complete_progress(upload_id)
+    progress_module.wait_for_writes()
+
+    elapsed = time.perf_counter() - start
+    kept = progress_module.progress_store.updates_since(upload_id, 0)
+    updates = [update.to_dict() for update in kept]
+    published = kept[-1].seq if kept else 0
+    progress_module.progress_store.delete(upload_id)
+    return elapsed, updates, published
+
+
+def bench_memory(uploads, updates_per_upload):
+    """Memória ocupada por `uploads` uploads rastreados com muitas atualizações cada."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for u in range(uploads):
+        upload_id = f"bench-memory-{u}"
+        for i in range(updates_per_upload):
+            progress_module.update_progress(upload_id, i % 100, "enviando_musicas",
+                                            stage="enviando_musicas", bytes_done=i, bytes_total=updates_per_upload,
+                                            bytes_per_second=1024, eta_seconds=10)
+    progress_module.wait_for_writes()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for u in range(uploads):
+        progress_module.progress_store.delete(f"bench-memory-{u}")
+    return (after - before) / uploads
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("[*] Benchmark de progresso de upload")
+    print("=" * 60)
+
+    elapsed = bench_update_progress(iterations)
+    print(f"update_progress: {iterations} chamadas em {elapsed * 1000:.1f}ms "
+          f"({elapsed / iterations * 1e6:.2f}us/chamada)")
+
+    for archive_mb, songs in ((50, 12), (500, 40)):
+        elapsed, updates, published = bench_tracker(archive_mb, songs)
+        progresses = [u["progress"] for u in updates]
+        monotonic = all(a <= b for a, b in zip(progresses, progresses[1:]))
+        print(f"tracker ({archive_mb}MB, {songs} musicas): {elapsed * 1000:.2f}ms, "
+              f"{published} updates publicados, monotonico={monotonic}, final={progresses[-1] if progresses else None}")
+
+    for updates_per_upload in (50, 500):
+        per_upload = bench_memory(500, updates_per_upload)
+        print(f"memoria: {per_upload / 1024:.1f}KB por upload ({updates_per_upload} updates cada)")
+
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
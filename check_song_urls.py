@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Script para verificar quais músicas têm URLs preenchidas
-e quais estão sem URL (causando ZIP vazio)
+Script para verificar a integridade do catálogo de músicas:
+quais músicas têm URLs preenchidas e se os arquivos existem no storage.
+
+Percorre a tabela songs em páginas (keyset por id), faz HEAD nos arquivos
+com concorrência limitada e grava um relatório NDJSON incremental (uma linha
+por música com status, tamanho e content-type). Pode ser interrompido e
+retomado: o cursor e o tamanho do relatório ficam num checkpoint.
 """
 import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import httpx
+from datetime import datetime, timezone
 from supabase import create_client
 from dotenv import load_dotenv
 from collections import defaultdict
+from routes import checkpoints
 
 load_dotenv()
 
@@ -16,104 +29,245 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def check_song_urls():
-    print("[*] Verificando URLs das músicas")
-    print("=" * 80)
-    
+# Checkpoint (routes.checkpoints) com o cursor e o tamanho do relatório já gravado
+CHECKPOINT_NAME = "check_song_urls"
+PAGE_SIZE = 1000
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REPORT = "check_song_urls_report.ndjson"
+
+def song_url(song):
+    """(campo, URL completa) da música, na ordem de preferência file_url, audio_url, url."""
+    for field in ('file_url', 'audio_url', 'url'):
+        value = song.get(field)
+        if value:
+            # Se a URL é relativa, construir a URL completa do Supabase Storage
+            if not value.startswith("http"):
+                value = f"{SUPABASE_URL}/storage/v1/object/public/{value}"
+            return field, value
+    return None, None
+
+def get_songs_page(after_id=None, limit=PAGE_SIZE):
+    """Próxima página de músicas (ordenada por id) depois de `after_id`."""
+    query = supabase.table('songs').select('id, title, album_id, file_url, audio_url, url, track_number')
+    if after_id:
+        query = query.gt('id', after_id)
+    response = query.order('id').limit(limit).execute()
+    return response.data if response.data else []
+
+async def check_object(client, url, semaphore):
+    """HEAD no arquivo (GET do primeiro byte se o servidor não aceitar HEAD)."""
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            response = await client.head(url)
+            if response.status_code == 405:
+                response = await client.get(url, headers={"Range": "bytes=0-0"})
+            size = response.headers.get('content-length')
+            content_range = response.headers.get('content-range')
+            if content_range and '/' in content_range:
+                size = content_range.rsplit('/', 1)[-1]
+            return {
+                'status': response.status_code,
+                'ok': response.status_code in (200, 206),
+                'size': int(size) if size and size.isdigit() else None,
+                'content_type': response.headers.get('content-type'),
+                'elapsed_ms': int((time.monotonic() - started) * 1000),
+            }
+        except httpx.HTTPError as e:
+            return {'status': None, 'ok': False, 'error': str(e)[:200] or type(e).__name__,
+                    'elapsed_ms': int((time.monotonic() - started) * 1000)}
+
+async def check_song(client, song, semaphore, check_objects):
+    field, url = song_url(song)
+    record = {
+        'song_id': song['id'],
+        'album_id': song.get('album_id'),
+        'title': song.get('title'),
+        'track_number': song.get('track_number'),
+        'url_field': field,
+        'url': url,
+    }
+    if url and check_objects:
+        record.update(await check_object(client, url, semaphore))
+    elif not url:
+        record['ok'] = False
+    record['checked_at'] = datetime.now(timezone.utc).isoformat()
+    return record
+
+class ReportMismatch(Exception):
+    """O relatório em disco não corresponde ao checkpoint (apagado ou truncado)."""
+
+async def scan(report_path, concurrency=DEFAULT_CONCURRENCY, check_objects=True, restart=False, max_songs=None):
+    """
+    Percorre as músicas e grava o relatório. Retoma do checkpoint, a não ser
+    com restart. Retorna True se chegou ao fim da tabela.
+    """
+    cursor = {} if restart else (checkpoints.load_checkpoint(CHECKPOINT_NAME) or {})
+    if cursor.get('report_path') not in (None, report_path):
+        print(f"Checkpoint é de outro relatório ({cursor['report_path']}), recomeçando")
+        cursor = {}
+
+    if cursor:
+        size = os.path.getsize(report_path) if os.path.exists(report_path) else None
+        if size is None or size < cursor['report_bytes']:
+            found = "não existe" if size is None else f"tem {size} bytes"
+            raise ReportMismatch(
+                f"O relatório {report_path} {found}, mas o checkpoint espera {cursor['report_bytes']} bytes. "
+                f"Use --restart para recomeçar a verificação."
+            )
+        print(f"Continuando depois da música {cursor['after_id']} ({cursor['songs']} já verificadas)")
+        report = open(report_path, 'r+b')
+        # Descarta linhas gravadas depois do último checkpoint (página incompleta)
+        report.truncate(cursor['report_bytes'])
+        report.seek(cursor['report_bytes'])
+    else:
+        checkpoints.clear_checkpoint(CHECKPOINT_NAME)
+        report = open(report_path, 'wb')
+        cursor = {'after_id': None, 'songs': 0, 'report_bytes': 0, 'report_path': report_path}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    checked = 0
+    done = False
     try:
-        # Buscar todas as músicas com todos os campos de URL
-        response = supabase.table('songs').select('id, title, album_id, file_url, audio_url, url, track_number').execute()
-        songs = response.data if response.data else []
-        
-        print(f"Total de músicas encontradas: {len(songs)}\n")
-        
-        # Estatísticas
-        stats = defaultdict(int)
-        songs_without_url = []
-        songs_by_album = defaultdict(list)
-        
-        for song in songs:
-            file_url = song.get('file_url')
-            audio_url = song.get('audio_url')
-            url = song.get('url')
-            
-            # Verificar qual URL está preenchida
-            if file_url:
-                stats['file_url'] += 1
-            elif audio_url:
-                stats['audio_url'] += 1
-            elif url:
-                stats['url'] += 1
-            else:
-                stats['nenhuma_url'] += 1
-                songs_without_url.append({
-                    'id': song['id'],
-                    'title': song['title'],
-                    'album_id': song['album_id'],
-                    'track_number': song['track_number']
-                })
-            
-            # Agrupar por album para análise
-            album_id = song['album_id']
-            has_url = file_url or audio_url or url
-            songs_by_album[album_id].append({
-                'id': song['id'],
-                'title': song['title'],
-                'has_url': has_url
-            })
-        
-        print("ESTATÍSTICAS DE URLs:")
+        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+            while True:
+                songs = await asyncio.to_thread(get_songs_page, cursor['after_id'])
+                if not songs:
+                    done = True
+                    break
+
+                records = await asyncio.gather(*(check_song(client, song, semaphore, check_objects) for song in songs))
+                for record in records:
+                    report.write((json.dumps(record, ensure_ascii=False) + "\n").encode())
+                report.flush()
+                os.fsync(report.fileno())
+
+                checked += len(songs)
+                cursor.update(after_id=songs[-1]['id'], songs=cursor['songs'] + len(songs), report_bytes=report.tell())
+                checkpoints.save_checkpoint(CHECKPOINT_NAME, cursor)
+
+                rate = checked / (time.monotonic() - started)
+                print(f"  {cursor['songs']} músicas verificadas ({rate:.0f}/s)")
+
+                if len(songs) < PAGE_SIZE:
+                    done = True
+                    break
+                if max_songs and checked >= max_songs:
+                    break
+    finally:
+        report.close()
+
+    if done:
+        checkpoints.clear_checkpoint(CHECKPOINT_NAME)
+    else:
+        print("Interrompido. Rode de novo para continuar de onde parou.")
+    return done
+
+def summarize(report_path):
+    """Estatísticas lidas do relatório NDJSON (inclui execuções anteriores retomadas)."""
+    stats = defaultdict(int)
+    status_counts = defaultdict(int)
+    songs_without_url = []
+    broken_objects = []
+    albums = defaultdict(lambda: [0, 0])  # album_id -> [total, ok]
+    total_bytes = 0
+
+    with open(report_path, encoding='utf-8') as report:
+        for line in report:
+            record = json.loads(line)
+            stats[record['url_field'] or 'nenhuma_url'] += 1
+            album = albums[record['album_id']]
+            album[0] += 1
+            if record.get('ok') or (record['url_field'] and 'status' not in record and 'error' not in record):
+                album[1] += 1
+            if not record['url_field']:
+                songs_without_url.append(record)
+            elif 'status' in record or 'error' in record:
+                status_counts[record.get('status') or 'erro'] += 1
+                if record.get('ok'):
+                    total_bytes += record.get('size') or 0
+                else:
+                    broken_objects.append(record)
+
+    total = sum(stats.values())
+    print(f"Total de músicas verificadas: {total}\n")
+
+    print("ESTATÍSTICAS DE URLs:")
+    print("-" * 80)
+    print(f"  ✅ Com file_url:    {stats['file_url']:6d}")
+    print(f"  ✅ Com audio_url:   {stats['audio_url']:6d}")
+    print(f"  ✅ Com url:         {stats['url']:6d}")
+    print(f"  ❌ Sem nenhuma URL: {stats['nenhuma_url']:6d}")
+    print()
+
+    if status_counts:
+        print("ARQUIVOS NO STORAGE (HEAD):")
         print("-" * 80)
-        print(f"  ✅ Com file_url:    {stats['file_url']:6d}")
-        print(f"  ✅ Com audio_url:   {stats['audio_url']:6d}")
-        print(f"  ✅ Com url:         {stats['url']:6d}")
-        print(f"  ❌ Sem nenhuma URL: {stats['nenhuma_url']:6d}")
+        for status, count in sorted(status_counts.items(), key=lambda item: str(item[0])):
+            print(f"  {'✅' if status in (200, 206) else '❌'} {status}: {count:6d}")
+        print(f"  Tamanho total dos arquivos encontrados: {total_bytes / 1024 / 1024 / 1024:.2f}GB")
         print()
-        
-        if songs_without_url:
-            print(f"MÚSICAS SEM URL ({len(songs_without_url)}):")
+
+    for label, songs in (("MÚSICAS SEM URL", songs_without_url), ("ARQUIVOS COM PROBLEMA", broken_objects)):
+        if songs:
+            print(f"{label} ({len(songs)}):")
             print("-" * 80)
-            for song in songs_without_url[:10]:  # Mostrar as 10 primeiras
-                print(f"  [{song['track_number']}] {song['title']} (Album: {song['album_id']})")
-            if len(songs_without_url) > 10:
-                print(f"  ... e mais {len(songs_without_url) - 10}")
+            for song in songs[:10]:  # Mostrar as 10 primeiras
+                problem = f" -> {song.get('status') or song.get('error')}" if song['url_field'] else ""
+                print(f"  [{song['track_number']}] {song['title']} (Album: {song['album_id']}){problem}")
+            if len(songs) > 10:
+                print(f"  ... e mais {len(songs) - 10}")
             print()
-        
-        # Análise por álbum
-        print("ÁLBUNS COM PROBLEMAS:")
-        print("-" * 80)
-        albums_with_issues = []
-        for album_id, album_songs in songs_by_album.items():
-            total = len(album_songs)
-            with_url = sum(1 for s in album_songs if s['has_url'])
-            without_url = total - with_url
-            
-            if without_url > 0:
-                albums_with_issues.append({
-                    'album_id': album_id,
-                    'total': total,
-                    'with_url': with_url,
-                    'without_url': without_url,
-                    'percentage': (with_url / total * 100) if total > 0 else 0
-                })
-        
-        if albums_with_issues:
-            albums_with_issues.sort(key=lambda x: x['percentage'])
-            for album in albums_with_issues[:20]:  # Top 20
-                print(f"  Album {album['album_id']}: {album['with_url']}/{album['total']} " +
-                      f"({album['percentage']:.1f}%)")
-            if len(albums_with_issues) > 20:
-                print(f"  ... e mais {len(albums_with_issues) - 20} álbuns")
-        else:
-            print("  ✅ Todos os álbuns têm URLs completas!")
-        
+
+    # Análise por álbum
+    print("ÁLBUNS COM PROBLEMAS:")
+    print("-" * 80)
+    albums_with_issues = [
+        {'album_id': album_id, 'total': total, 'ok': ok, 'percentage': ok / total * 100}
+        for album_id, (total, ok) in albums.items() if ok < total
+    ]
+    if albums_with_issues:
+        albums_with_issues.sort(key=lambda x: x['percentage'])
+        for album in albums_with_issues[:20]:  # Top 20
+            print(f"  Album {album['album_id']}: {album['ok']}/{album['total']} ({album['percentage']:.1f}%)")
+        if len(albums_with_issues) > 20:
+            print(f"  ... e mais {len(albums_with_issues) - 20} álbuns")
+    else:
+        print("  ✅ Todos os álbuns têm URLs completas!")
+
+def check_song_urls(report_path=DEFAULT_REPORT, concurrency=DEFAULT_CONCURRENCY, check_objects=True,
+                    restart=False, max_songs=None):
+    print("[*] Verificando URLs das músicas")
+    print("=" * 80)
+
+    try:
+        done = asyncio.run(scan(report_path, concurrency, check_objects, restart, max_songs))
+        print()
+        summarize(report_path)
         print()
+        print(f"Relatório: {report_path}" + ("" if done else " (parcial)"))
         print("=" * 80)
-        
+        return done
+    except ReportMismatch as e:
+        print(f"❌ {e}")
+        return False
     except Exception as e:
         print(f"❌ Erro ao verificar: {str(e)}")
         import traceback
         traceback.print_exc()
+        return False
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica URLs e arquivos das músicas")
+    parser.add_argument('--report', default=DEFAULT_REPORT, help="Arquivo NDJSON do relatório")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Requisições HEAD em paralelo")
+    parser.add_argument('--urls-only', action='store_true', help="Só verificar se as URLs estão preenchidas")
+    parser.add_argument('--max-songs', type=int, default=None, help="Parar depois de N músicas (continua na próxima)")
+    parser.add_argument('--restart', action='store_true', help="Ignorar o checkpoint e recomeçar o relatório")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    check_song_urls()
+    args = parse_args()
+    ok = check_song_urls(args.report, args.concurrency, not args.urls_only, args.restart, args.max_songs)
+    sys.exit(0 if ok else 1)
@@ -2,16 +2,23 @@
 # -*- coding: utf-8 -*-
 """
 Script para gerar archives ZIP para albuns
-Simples e eficiente
+Vários álbuns em paralelo, músicas baixadas em streaming para disco e ZIP
+montado em arquivo temporário (memória constante)
 """
 import os
-import io
 import sys
+import time
+import asyncio
+import argparse
+import contextvars
+import tempfile
 import zipfile
 import httpx
+from collections import deque
 from datetime import datetime
 from supabase import create_client
 from dotenv import load_dotenv
+from routes import archive_fingerprint, checkpoints, resumable_upload, storage_utils
 
 load_dotenv()
 
@@ -20,136 +27,371 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def get_albums_without_archive():
-    try:
-        response = supabase.table('albums').select('*').or_('archive_url.is.null,archive_url.eq.""').execute()
-        return response.data if response.data else []
-    except Exception as e:
-        print(f"Erro ao buscar albuns: {str(e)}")
-        return []
+# Checkpoint (routes.checkpoints) com o cursor do último álbum processado
+CHECKPOINT_NAME = "generate_album_archives"
+STALE_CHECKPOINT_NAME = "generate_album_archives.stale"
+PAGE_SIZE = 100
+
+# Álbuns processados ao mesmo tempo e downloads de músicas em paralelo (total)
+ALBUM_CONCURRENCY = int(os.getenv('ARCHIVE_ALBUM_CONCURRENCY', '3'))
+DOWNLOAD_CONCURRENCY = int(os.getenv('ARCHIVE_DOWNLOAD_CONCURRENCY', '8'))
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Job (routes.archive_jobs) executando o script: recebe a saída, o progresso e pode cancelar
+_current_job = contextvars.ContextVar('current_job', default=None)
+
+def log(*args, end='\n', flush=False):
+    """print() que também envia a saída para o job em execução"""
+    print(*args, end=end, flush=flush)
+    job = _current_job.get()
+    if job is not None:
+        job.write(' '.join(str(arg) for arg in args), end)
+
+def get_albums_without_archive(after_id=None, limit=PAGE_SIZE):
+    """
+    Próxima página (ordenada por id) de álbuns sem archive, depois de `after_id`.
+    Erros do banco sobem: uma lista vazia significa fim da tabela.
+    """
+    query = supabase.table('albums').select('id, title').or_('archive_url.is.null,archive_url.eq.""')
+    if after_id:
+        query = query.gt('id', after_id)
+    response = query.order('id').limit(limit).execute()
+    return response.data if response.data else []
+
+def get_albums_with_archive(after_id=None, limit=PAGE_SIZE):
+    """
+    Próxima página (ordenada por id) de álbuns que já têm archive, depois de `after_id`.
+    Erros do banco sobem: uma lista vazia significa fim da tabela.
+    """
+    query = supabase.table('albums').select('id, title, archive_url, archive_fingerprint').not_.is_('archive_url', 'null').neq('archive_url', '')
+    if after_id:
+        query = query.gt('id', after_id)
+    response = query.order('id').limit(limit).execute()
+    return response.data if response.data else []
 
 def get_album_songs(album_id):
     try:
-        response = supabase.table('songs').select('id, title, audio_url, file_url, url, track_number').eq('album_id', album_id).order('track_number', desc=False).execute()
-        return response.data if response.data else []
+        # Mesma ordem usada no fingerprint (track_number, depois id)
+        return archive_fingerprint.fetch_album_songs(album_id)
     except Exception as e:
-        print(f"Erro ao buscar musicas: {str(e)}")
+        log(f"Erro ao buscar musicas: {str(e)}")
         return []
 
-def create_album_zip(album_id, album_title, songs):
+def song_download_url(song):
+    """URL do áudio (file_url é a preferida, depois audio_url, depois url)."""
+    song_url = song.get('file_url') or song.get('audio_url') or song.get('url')
+    # Se a URL é relativa, construir a URL completa do Supabase Storage
+    if song_url and not song_url.startswith("http"):
+        song_url = f"{SUPABASE_URL}/storage/v1/object/public/{song_url}"
+    return song_url
+
+async def download_song(client, song_url, dest_path, semaphore):
+    """Baixa uma música em streaming para um arquivo temporário. Retorna (status, bytes)."""
+    async with semaphore:
+        async with client.stream('GET', song_url) as response:
+            if response.status_code != 200:
+                return response.status_code, 0
+            size = 0
+            with open(dest_path, 'wb') as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            return 200, size
+
+def write_zip(zip_path, entries):
+    """Monta o ZIP a partir dos arquivos baixados, sem carregar as músicas em memória."""
+    # Usar ZIP_STORED (sem compressão) para ser mais rápido
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zip_file:
+        for file_path, filename in entries:
+            zip_file.write(file_path, filename)
+
+async def create_album_zip(client, album_title, songs, work_dir, semaphore):
+    """Baixa as músicas em paralelo e grava o ZIP em work_dir. Retorna o caminho do ZIP ou None."""
     if not songs:
         return None
     
-    try:
-        zip_buffer = io.BytesIO()
-        
-        # Usar ZIP_STORED (sem compressão) para ser mais rápido
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED) as zip_file:
-            with httpx.Client(timeout=60.0) as client:
-                for idx, song in enumerate(songs, 1):
-                    try:
-                        # Tentar múltiplas URLs (file_url é a preferida, depois audio_url, depois url)
-                        song_url = song.get('file_url') or song.get('audio_url') or song.get('url')
-                        
-                        if song_url:
-                            # Se a URL é relativa, construir a URL completa do Supabase Storage
-                            if not song_url.startswith("http"):
-                                song_url = f"{SUPABASE_URL}/storage/v1/object/public/{song_url}"
-                            
-                            title = song.get('title', f'track_{idx}')[:40]
-                            print(f"    Baixando: {title}", end=' ... ', flush=True)
-                            response = client.get(song_url, follow_redirects=True)
-                            if response.status_code == 200:
-                                track_num = song.get('track_number', 0)
-                                filename = f"{track_num:02d} - {song.get('title', 'track')}.mp3"
-                                zip_file.writestr(filename, response.content)
-                                size_kb = len(response.content) // 1024
-                                print(f"[OK - {size_kb}KB]")
-                            else:
-                                print(f"[{response.status_code}]")
-                        else:
-                            title = song.get('title', f'track_{idx}')[:40]
-                            print(f"    {title}", end=' ... ', flush=True)
-                            print("[SEM URL]")
-                    except httpx.TimeoutException:
-                        print("[TIMEOUT]")
-                    except Exception as e:
-                        print(f"[ERRO: {str(e)[:20]}]")
-        
-        zip_buffer.seek(0)
-        return zip_buffer.getvalue()
+    async def fetch(idx, song):
+        title = song.get('title', f'track_{idx}')[:40]
+        song_url = song_download_url(song)
+        if not song_url:
+            log(f"    [{album_title}] {title} ... [SEM URL]")
+            return None
+        dest_path = os.path.join(work_dir, f"track_{idx:04d}.part")
+        try:
+            status, size = await download_song(client, song_url, dest_path, semaphore)
+        except httpx.TimeoutException:
+            log(f"    [{album_title}] {title} ... [TIMEOUT]")
+            return None
+        except Exception as e:
+            log(f"    [{album_title}] {title} ... [ERRO: {str(e)[:20]}]")
+            return None
+        if status != 200:
+            log(f"    [{album_title}] {title} ... [{status}]")
+            return None
+        log(f"    [{album_title}] {title} ... [OK - {size // 1024}KB]")
+        track_num = song.get('track_number') or 0
+        return dest_path, f"{track_num:02d} - {song.get('title', 'track')}.mp3"
     
+    try:
+        results = await asyncio.gather(*(fetch(idx, song) for idx, song in enumerate(songs, 1)))
+        # Ordem das faixas preservada (gather mantém a ordem das músicas)
+        entries = [entry for entry in results if entry]
+        if not entries:
+            return None
+        zip_path = os.path.join(work_dir, 'album.zip')
+        await asyncio.to_thread(write_zip, zip_path, entries)
+        return zip_path
     except Exception as e:
-        print(f"Erro ao criar ZIP: {str(e)}")
+        log(f"Erro ao criar ZIP: {str(e)}")
         return None
 
-def upload_archive_to_storage(album_id, album_title, zip_content):
+def upload_archive_to_storage(album_id, album_title, zip_path):
+    """Envia o ZIP direto do disco (memória constante). Retorna a URL pública."""
     try:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_path = f"albums/{album_id}/{album_title}_{timestamp}.zip"
         
-        size_mb = len(zip_content) / 1024 / 1024
-        print(f"    Upload ({size_mb:.1f}MB)", end=' ... ', flush=True)
-        
-        # Upload direto
-        supabase.storage.from_('musica').upload(file_path, zip_content)
+        size_mb = os.path.getsize(zip_path) / 1024 / 1024
+        # Archives grandes vão em chunks resumíveis (TUS), com retry por chunk
+        resumable_upload.upload_object(zip_path, 'musica', file_path, 'application/zip')
         
         # Obter URL publica
         public_url = supabase.storage.from_('musica').get_public_url(file_path)
-        url = public_url.get('publicUrl') if public_url else None
+        url = public_url.get('publicUrl') if isinstance(public_url, dict) else public_url
         
-        print("[OK]")
+        log(f"    [{album_title}] Upload ({size_mb:.1f}MB) ... [OK]")
         return url
     
     except Exception as e:
-        print(f"[ERRO: {str(e)[:40]}]")
+        log(f"    [{album_title}] Upload ... [ERRO: {str(e)[:40]}]")
         return None
 
-def update_album_archive_url(album_id, archive_url):
+def update_album_archive_url(album_id, archive_url, fingerprint=None):
     try:
-        print(f"    Atualizando BD", end=' ... ', flush=True)
-        supabase.table('albums').update({'archive_url': archive_url}).eq('id', album_id).execute()
-        print("[OK]")
+        supabase.table('albums').update({
+            'archive_url': archive_url,
+            'archive_fingerprint': fingerprint
+        }).eq('id', album_id).execute()
         return True
     except Exception as e:
-        print(f"[ERRO]")
+        log(f"    Erro ao atualizar BD do album {album_id}: {str(e)[:40]}")
         return False
 
-def main():
-    print("[*] Gerando Archives para Albuns")
-    print("=" * 60)
+def remove_old_archive(album_title, old_url, new_url):
+    """Apaga do storage o ZIP substituído (cada geração usa um nome novo)."""
+    old_path = storage_utils.object_path(old_url)
+    if not old_path or old_path == storage_utils.object_path(new_url):
+        return
+    try:
+        storage_utils.remove_paths([old_path])
+    except Exception as e:
+        # Fica para o reconcile_storage (zip_antigo)
+        log(f"    [{album_title}] Remover archive antigo ... [ERRO: {str(e)[:40]}]")
+
+async def process_album(client, album, semaphore, stale_only=False):
+    """
+    Gera e publica o archive de um álbum. Retorna True em caso de sucesso.
+    Com stale_only, retorna None (sem regerar) se o fingerprint não mudou.
+    """
+    album_id = album['id']
+    album_title = album.get('title', f'album_{album_id}')[:50].replace('/', '_').replace('\\', '_')
     
-    albums = get_albums_without_archive()
-    print(f"Encontrados {len(albums)} albuns\n")
+    songs = await asyncio.to_thread(get_album_songs, album_id)
+    if not songs:
+        log(f"  [{album_title}] Musicas: 0")
+        return False
     
-    if not albums:
-        return
+    # Calculado antes dos downloads: se as faixas mudarem durante a geração,
+    # o archive fica com o fingerprint antigo e será regerado na próxima vez
+    fingerprint = await asyncio.to_thread(archive_fingerprint.album_fingerprint, album_id, songs)
+    if stale_only and fingerprint == album.get('archive_fingerprint'):
+        log(f"  [{album_title}] Archive atualizado")
+        return None
+    log(f"  [{album_title}] Musicas: {len(songs)}")
     
-    success_count = 0
+    # ZIP e músicas ficam em disco (memória constante), apagados ao final
+    with tempfile.TemporaryDirectory(prefix='album_archive_') as work_dir:
+        zip_path = await create_album_zip(client, album_title, songs, work_dir, semaphore)
+        if not zip_path:
+            return False
+        archive_url = await asyncio.to_thread(upload_archive_to_storage, album_id, album_title, zip_path)
     
-    for i, album in enumerate(albums, 1):
-        album_id = album['id']
-        album_title = album.get('title', f'album_{album_id}')[:50].replace('/', '_').replace('\\', '_')
-        
-        print(f"[{i}/{len(albums)}] {album_title}")
-        
-        songs = get_album_songs(album_id)
-        print(f"  Musicas: {len(songs)}")
-        
-        if songs:
-            print(f"  Criando ZIP...")
-            zip_content = create_album_zip(album_id, album_title, songs)
+    if not archive_url:
+        return False
+    if not await asyncio.to_thread(update_album_archive_url, album_id, archive_url, fingerprint):
+        return False
+    # Só depois do banco apontar para o novo: o antigo não é mais servido
+    if album.get('archive_url'):
+        await asyncio.to_thread(remove_old_archive, album_title, album['archive_url'], archive_url)
+    return True
+
+async def main_async(time_budget=None, max_items=None, resume_token=None, restart=False, job=None, stale=False):
+    """
+    Gera archives para os álbuns sem archive_url, em ordem de id.
+    Com stale, percorre os álbuns que já têm archive e regera só aqueles cujo
+    fingerprint (músicas, ordem e ETags) mudou ou não foi registrado.
+    
+    Até ALBUM_CONCURRENCY álbuns são processados ao mesmo tempo, com no máximo
+    DOWNLOAD_CONCURRENCY downloads de músicas em paralelo no total.
+    
+    Com time_budget (segundos) ou max_items, para de iniciar álbuns depois do
+    limite e salva o cursor; a próxima execução continua dali. O cursor só
+    avança sobre álbuns já concluídos (em ordem de id), então os que estavam
+    em andamento numa interrupção são refeitos. Álbuns já processados ganham
+    archive_url e não voltam na busca, então repetir um álbum é seguro.
+    
+    Com job (routes.archive_jobs.ArchiveJob), a saída e o progresso vão para
+    o job, e um cancelamento para de iniciar novos álbuns (com o cursor salvo).
+    
+    Um erro ao buscar a próxima página também para a geração sem limpar o
+    cursor; a exceção é relançada depois que os álbuns em andamento terminam.
+    
+    Retorna: dict com processed, success_count, unchanged_count, done,
+    cancelled, albums_per_minute e continuation_token
+    """
+    _current_job.set(job)
+    checkpoint_name = STALE_CHECKPOINT_NAME if stale else CHECKPOINT_NAME
+    get_albums = get_albums_with_archive if stale else get_albums_without_archive
+    log("[*] Regerando Archives desatualizados" if stale else "[*] Gerando Archives para Albuns")
+    log("=" * 60)
+    
+    if resume_token:
+        cursor = checkpoints.decode_token(resume_token)
+    elif not restart:
+        cursor = checkpoints.load_checkpoint(checkpoint_name) or {}
+    else:
+        cursor = {}
+    if cursor.get('after_id'):
+        log(f"Continuando depois do album {cursor['after_id']}")
+    
+    budget = checkpoints.Budget(time_budget, max_items)
+    album_slots = asyncio.Semaphore(ALBUM_CONCURRENCY)
+    download_slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    in_flight = deque()  # (album_id, task) na ordem de início
+    started = time.monotonic()
+    stats = {'processed': 0, 'success_count': 0, 'unchanged_count': 0, 'album_seconds': 0.0}
+    done = False
+    cancelled = False
+    query_error = None
+    
+    def albums_per_minute():
+        elapsed = time.monotonic() - started
+        return round(stats['processed'] * 60 / elapsed, 2) if elapsed > 0 else 0.0
+    
+    def advance_cursor():
+        nonlocal cursor
+        moved = False
+        while in_flight and in_flight[0][1].done():
+            album_id, _ = in_flight.popleft()
+            cursor = {'after_id': album_id}
+            moved = True
+        if moved:
+            checkpoints.save_checkpoint(checkpoint_name, cursor)
+    
+    async def run_album(album, number):
+        album_started = time.monotonic()
+        try:
+            log(f"[{number}] {album.get('title', album['id'])[:50]}")
+            ok = await process_album(client, album, download_slots, stale_only=stale)
+        except Exception as e:
+            log(f"[{number}] Erro: {str(e)[:60]}")
+            ok = False
+        finally:
+            album_slots.release()
+        stats['processed'] += 1
+        if ok is None:
+            stats['unchanged_count'] += 1
+        elif ok:
+            stats['success_count'] += 1
+        seconds = time.monotonic() - album_started
+        # Média móvel da duração de um álbum, usada para não passar do time_budget
+        stats['album_seconds'] = seconds if not stats['album_seconds'] else 0.7 * stats['album_seconds'] + 0.3 * seconds
+        if job is not None:
+            job.update_progress(processed=stats['processed'], succeeded=stats['success_count'],
+                                unchanged=stats['unchanged_count'],
+                                failed=stats['processed'] - stats['success_count'] - stats['unchanged_count'],
+                                albums_per_minute=albums_per_minute())
+    
+    launched = 0
+    after_id = cursor.get('after_id')
+    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
+        stop = False
+        while not stop:
+            try:
+                albums = await asyncio.to_thread(get_albums, after_id)
+            except Exception as e:
+                # Para sem marcar como concluído: o cursor fica salvo para continuar
+                log(f"Erro ao buscar albuns: {str(e)}")
+                query_error = e
+                break
+            if not albums:
+                done = True
+                break
             
-            if zip_content:
-                archive_url = upload_archive_to_storage(album_id, album_title, zip_content)
-                
-                if archive_url:
-                    if update_album_archive_url(album_id, archive_url):
-                        success_count += 1
-        print()
+            for album in albums:
+                await album_slots.acquire()
+                advance_cursor()
+                if budget.exhausted(stats['album_seconds']):
+                    stop = True
+                elif job is not None and job.is_cancelled():
+                    log("[CANCELADO] Geração cancelada")
+                    stop = cancelled = True
+                if stop:
+                    album_slots.release()
+                    break
+                launched += 1
+                budget.consume()
+                in_flight.append((album['id'], asyncio.create_task(run_album(album, launched))))
+                after_id = album['id']
+            else:
+                if len(albums) < PAGE_SIZE:
+                    done = True
+                    break
+        
+        if in_flight:
+            await asyncio.gather(*(task for _, task in in_flight))
+        advance_cursor()
+    
+    if done:
+        # Próxima execução recomeça do início (tentando de novo os que falharam)
+        checkpoints.clear_checkpoint(checkpoint_name)
+    
+    rate = albums_per_minute()
+    log("=" * 60)
+    log(f"Concluido: {stats['success_count']}/{stats['processed']} albuns "
+        f"em {time.monotonic() - started:.1f}s ({rate} albuns/min)")
+    if stale:
+        log(f"Sem mudancas: {stats['unchanged_count']} albuns")
+    continuation_token = None if done else checkpoints.encode_token(cursor)
+    if continuation_token:
+        motivo = "Cancelado" if cancelled else "Erro ao buscar albuns" if query_error else "Limite atingido"
+        log(f"{motivo}. Continuar com: --resume-token {continuation_token}")
+    if query_error is not None:
+        raise query_error
     
-    print("=" * 60)
-    print(f"Concluido: {success_count}/{len(albums)} albuns")
+    return {
+        'processed': stats['processed'],
+        'success_count': stats['success_count'],
+        'unchanged_count': stats['unchanged_count'],
+        'done': done,
+        'cancelled': cancelled,
+        'albums_per_minute': rate,
+        'continuation_token': continuation_token
+    }
+
+def main(time_budget=None, max_items=None, resume_token=None, restart=False, job=None, stale=False):
+    """Executa main_async num event loop próprio (CLI e jobs em thread)."""
+    return asyncio.run(main_async(time_budget, max_items, resume_token, restart, job, stale))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Gera archives ZIP para albuns")
+    parser.add_argument('--time-budget', type=float, default=None, help="Parar depois de N segundos")
+    parser.add_argument('--max-items', type=int, default=None, help="Processar no maximo N albuns")
+    parser.add_argument('--resume-token', default=None, help="Continuar a partir de um token anterior")
+    parser.add_argument('--restart', action='store_true', help="Ignorar o cursor salvo e recomecar")
+    parser.add_argument('--stale', action='store_true', help="Regerar so os archives com fingerprint desatualizado")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(args.time_budget, args.max_items, args.resume_token, args.restart, stale=args.stale)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Executor de migrações de dados (scripts fix_*).
+
+Uma migração só declara:
+  - select: filtros do PostgREST que escolhem as linhas (aplicados no servidor)
+  - transform: função linha -> campos a alterar (ou None para não mexer)
+
+O executor lê a tabela em páginas (keyset por id), calcula o patch de cada
+linha, descarta campos que já têm o valor novo e agrupa linhas com o mesmo
+patch num único update (.in_("id", ...)), que repete os filtros do select:
+uma linha alterada por outra pessoa no meio do caminho não é sobrescrita.
+Por padrão só mostra o que mudaria (dry-run); com --apply grava, com
+concorrência limitada, salvando o cursor num checkpoint a cada página para
+poder continuar de onde parou.
+
+Exemplo:
+    migration = Migration(
+        name="fix_exemplo",
+        table="albums",
+        columns="id, title, is_private",
+        select=lambda query: query.is_("is_private", "null"),
+        transform=lambda album: {"is_private": False},
+    )
+    if __name__ == "__main__":
+        sys.exit(main(migration))
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from supabase import create_client
+from dotenv import load_dotenv
+from routes import checkpoints
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+PAGE_SIZE = 1000
+
+# Ids por update (.in_ vai na URL da requisição)
+UPDATE_BATCH_SIZE = 200
+
+DEFAULT_CONCURRENCY = 4
+
+class Migration:
+    def __init__(self, name, table, columns, transform, select=None, describe=None):
+        self.name = name
+        self.table = table
+        self.columns = columns if "id" in [c.strip() for c in columns.split(",")] else f"id, {columns}"
+        self.transform = transform
+        self.select = select or (lambda query: query)
+        self.describe = describe or (lambda row: row["id"])
+
+    @property
+    def checkpoint_name(self):
+        return f"migration:{self.name}"
+
+def get_page(migration, after_id=None):
+    """Próxima página de linhas escolhidas pela migração (ordenada por id)."""
+    query = migration.select(supabase.table(migration.table).select(migration.columns))
+    if after_id:
+        query = query.gt("id", after_id)
+    response = query.order("id").limit(PAGE_SIZE).execute()
+    return response.data or []
+
+def row_patch(migration, row):
+    """Campos que realmente mudam nesta linha (vazio se nada muda)."""
+    patch = migration.transform(row) or {}
+    return {key: value for key, value in patch.items() if row.get(key) != value}
+
+def group_patches(migration, rows):
+    """{patch (JSON): (patch, [linhas])} — linhas com o mesmo patch viram um update só."""
+    groups = {}
+    for row in rows:
+        patch = row_patch(migration, row)
+        if patch:
+            key = json.dumps(patch, sort_keys=True, default=str)
+            groups.setdefault(key, (patch, []))[1].append(row)
+    return groups
+
+def apply_patch(migration, patch, ids):
+    query = migration.select(supabase.table(migration.table).update(patch))
+    response = query.in_("id", ids).execute()
+    return len(response.data or [])
+
+def print_diff(migration, patch, rows, shown, limit):
+    for row in rows:
+        if shown >= limit:
+            break
+        changes = ", ".join(f"{key}: {row.get(key)!r} -> {value!r}" for key, value in patch.items())
+        print(f"  {migration.describe(row)} ({row['id']}): {changes}")
+        shown += 1
+    return shown
+
+async def run_migration(migration, apply=False, concurrency=DEFAULT_CONCURRENCY, restart=False, show=20):
+    """
+    Executa a migração. Retorna um dict com linhas lidas, alteradas e erros.
+    """
+    print("=" * 80)
+    print(f"MIGRAÇÃO {migration.name} ({migration.table})" + ("" if apply else " — DRY-RUN"))
+    print("=" * 80)
+
+    after_id = None
+    if apply and not restart:
+        state = checkpoints.load_checkpoint(migration.checkpoint_name)
+        if state:
+            after_id = state["after_id"]
+            print(f"Continuando depois de {after_id}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"read": 0, "changed": 0, "updated": 0, "failed": 0}
+    shown = 0
+    started = time.monotonic()
+
+    async def update(patch, ids):
+        async with semaphore:
+            try:
+                updated = await asyncio.to_thread(apply_patch, migration, patch, ids)
+            except Exception as e:
+                stats["failed"] += len(ids)
+                print(f"  ✗ Erro ao atualizar {len(ids)} linhas ({patch}): {e}")
+                return
+            stats["updated"] += updated
+
+    while True:
+        rows = await asyncio.to_thread(get_page, migration, after_id)
+        if not rows:
+            break
+        stats["read"] += len(rows)
+
+        groups = group_patches(migration, rows)
+        for patch, group_rows in groups.values():
+            stats["changed"] += len(group_rows)
+            shown = print_diff(migration, patch, group_rows, shown, show)
+
+        if apply:
+            failed_before = stats["failed"]
+            await asyncio.gather(*(
+                update(patch, [row["id"] for row in group_rows[i:i + UPDATE_BATCH_SIZE]])
+                for patch, group_rows in groups.values()
+                for i in range(0, len(group_rows), UPDATE_BATCH_SIZE)
+            ))
+            if stats["failed"] > failed_before:
+                # Não avançar o checkpoint: a próxima execução repete esta página
+                print("Interrompido por erros. Rode de novo para continuar.")
+                break
+            checkpoints.save_checkpoint(migration.checkpoint_name, {"after_id": rows[-1]["id"]})
+
+        after_id = rows[-1]["id"]
+        print(f"  {stats['read']} linhas lidas, {stats['changed']} a alterar "
+              f"({stats['read'] / (time.monotonic() - started):.0f} linhas/s)")
+        if len(rows) < PAGE_SIZE:
+            break
+
+    if shown < stats["changed"]:
+        print(f"  ... e mais {stats['changed'] - shown}")
+
+    print("=" * 80)
+    if apply:
+        if not stats["failed"]:
+            checkpoints.clear_checkpoint(migration.checkpoint_name)
+        print(f"Linhas lidas: {stats['read']}  |  atualizadas: {stats['updated']}  |  erros: {stats['failed']}")
+    else:
+        print(f"Linhas lidas: {stats['read']}  |  a alterar: {stats['changed']}")
+        if stats["changed"]:
+            print("Rode com --apply para gravar as alterações.")
+    print("=" * 80)
+    return stats
+
+def main(migration, argv=None):
+    parser = argparse.ArgumentParser(description=f"Migração {migration.name}")
+    parser.add_argument("--apply", action="store_true", help="Gravar as alterações (padrão: só mostrar)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Updates em paralelo")
+    parser.add_argument("--restart", action="store_true", help="Ignorar o checkpoint e começar do início")
+    parser.add_argument("--show", type=int, default=20, help="Quantas alterações mostrar")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = asyncio.run(run_migration(migration, args.apply, args.concurrency, args.restart, args.show))
+    except Exception as e:
+        print(f"Erro na migração: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 1 if stats["failed"] else 0
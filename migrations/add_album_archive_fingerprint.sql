@@ -0,0 +1,9 @@
+-- Fingerprint do archive ZIP de cada álbum (músicas, ordem e ETags)
+-- Execute isso no SQL Editor do Supabase
+
+-- 1. Coluna ao lado de archive_url
+ALTER TABLE public.albums
+    ADD COLUMN IF NOT EXISTS archive_fingerprint TEXT;
+
+-- 2. Archives existentes ficam sem fingerprint e são atualizados por:
+--    python generate_album_archives.py --stale
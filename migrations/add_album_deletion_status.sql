@@ -0,0 +1,15 @@
+-- Status da exclusão permanente de álbuns (processada em segundo plano)
+-- Execute isso no SQL Editor do Supabase
+
+-- 1. Colunas de controle da exclusão
+ALTER TABLE public.albums
+    ADD COLUMN IF NOT EXISTS deletion_status TEXT
+        CHECK (deletion_status IN ('pending', 'deleting', 'failed')),
+    ADD COLUMN IF NOT EXISTS deletion_requested_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS deletion_attempts INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS deletion_error TEXT;
+
+-- 2. Índice parcial para o worker encontrar exclusões pendentes
+CREATE INDEX IF NOT EXISTS albums_deletion_pending_idx
+ON public.albums (deletion_requested_at)
+WHERE deletion_status IS NOT NULL;
@@ -0,0 +1,14 @@
+-- Metadados dos vídeos do YouTube (título/thumbnail via oEmbed, resolvidos em segundo plano)
+-- Execute isso no SQL Editor do Supabase
+
+-- 1. Status da resolução: pending (aguardando), resolved, invalid (vídeo inexistente/privado)
+ALTER TABLE public.artist_videos
+    ADD COLUMN IF NOT EXISTS metadata_status TEXT NOT NULL DEFAULT 'resolved'
+        CHECK (metadata_status IN ('pending', 'resolved', 'invalid')),
+    ADD COLUMN IF NOT EXISTS author_name TEXT;
+
+-- 2. Índice parcial para o worker encontrar vídeos pendentes
+CREATE INDEX IF NOT EXISTS artist_videos_metadata_pending_idx
+ON public.artist_videos (created_at)
+WHERE metadata_status = 'pending';
+
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script para reconciliar o Supabase Storage com o banco de dados.
+
+Encontra arquivos órfãos deixados por uploads ou exclusões que falharam:
+  - songs/<album>/...           de álbuns que não existem mais
+  - songs/<album>/...           que nenhuma música referencia
+  - albums/<user>/<album>/...   capas de álbuns que não existem mais
+  - albums/<album>/*.zip        ZIPs de álbuns que não existem mais
+                                ou que não são mais o archive_url atual
+e álbuns sem nenhuma música.
+
+As chaves do banco (álbuns e URLs das músicas) são lidas em páginas (keyset
+por id) para conjuntos em memória; as listagens do storage são percorridas
+página por página e comparadas com esses conjuntos (hash join), sem carregar
+o bucket inteiro. Por padrão só gera o relatório; com --delete remove os
+órfãos em lotes (storage_utils.remove_objects) e marca os álbuns vazios para
+exclusão (o worker do servidor apaga).
+
+Arquivos e álbuns mais novos que --min-age-hours são ignorados, para não
+pegar uploads em andamento.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from supabase import create_client
+from dotenv import load_dotenv
+from collections import defaultdict
+from routes import storage_utils
+from routes.album_deleter import STATUS_PENDING, STATUS_DELETING
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+PAGE_SIZE = 1000
+DEFAULT_MIN_AGE_HOURS = 24
+DEFAULT_CONCURRENCY = 8
+
+# Motivos de um arquivo ser órfão
+SONG_MISSING_ALBUM = "musica_de_album_inexistente"
+SONG_UNREFERENCED = "musica_sem_registro"
+COVER_MISSING_ALBUM = "capa_de_album_inexistente"
+ARCHIVE_MISSING_ALBUM = "zip_de_album_inexistente"
+ARCHIVE_STALE = "zip_antigo"
+
+def parse_time(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def iter_table(table, columns):
+    """Todas as linhas de uma tabela, em páginas de PAGE_SIZE (keyset por id)."""
+    after_id = None
+    while True:
+        query = supabase.table(table).select(columns)
+        if after_id:
+            query = query.gt("id", after_id)
+        rows = query.order("id").limit(PAGE_SIZE).execute().data or []
+        yield from rows
+        if len(rows) < PAGE_SIZE:
+            return
+        after_id = rows[-1]["id"]
+
+def load_database_keys():
+    """Álbuns (id -> dados) e conjunto de caminhos de áudio referenciados pelas músicas."""
+    albums = {}
+    for album in iter_table("albums", "id, archive_url, created_at, deletion_status"):
+        albums[album["id"]] = {
+            "archive_path": storage_utils.object_path(album.get("archive_url")),
+            "created_at": parse_time(album.get("created_at")),
+            "deleting": album.get("deletion_status") in (STATUS_PENDING, STATUS_DELETING),
+            "songs": 0,
+        }
+    print(f"  {len(albums)} álbuns")
+
+    referenced = set()
+    songs = 0
+    for song in iter_table("songs", "id, album_id, file_url, audio_url, url"):
+        songs += 1
+        for field in ("file_url", "audio_url", "url"):
+            path = storage_utils.object_path(song.get(field))
+            if path:
+                referenced.add(path)
+        album = albums.get(song.get("album_id"))
+        if album:
+            album["songs"] += 1
+    print(f"  {songs} músicas, {len(referenced)} arquivos referenciados")
+    return albums, referenced
+
+class Reconciler:
+    def __init__(self, albums, referenced, min_age_hours, delete, report=None):
+        self.albums = albums
+        self.referenced = referenced
+        self.cutoff = datetime.now(timezone.utc) - timedelta(hours=min_age_hours)
+        self.delete = delete
+        self.report = report
+        self.orphans = defaultdict(lambda: [0, 0])  # motivo -> [arquivos, bytes]
+        self.skipped_recent = 0
+        self.removed = 0
+        self.bytes_reclaimed = 0
+        self.failed = 0
+        self._pending = []  # (caminho, bytes) aguardando remoção
+        self._lock = asyncio.Lock()
+
+    def is_recent(self, item):
+        created = parse_time(item.get("created_at") or item.get("updated_at")) if isinstance(item, dict) else None
+        # Sem data conhecida: tratar como recente (não apagar)
+        return created is None or created > self.cutoff
+
+    def found(self, orphans, path, item, reason, album_id):
+        if self.is_recent(item):
+            self.skipped_recent += 1
+            return
+        metadata = (item.get("metadata") if isinstance(item, dict) else None) or {}
+        orphans.append({"path": path, "reason": reason, "album_id": album_id,
+                        "size": int(metadata.get("size") or 0)})
+
+    async def collect(self, orphans):
+        """Contabiliza os órfãos de uma pasta já listada por completo (e remove, com --delete)."""
+        for record in orphans:
+            counts = self.orphans[record["reason"]]
+            counts[0] += 1
+            counts[1] += record["size"]
+            if self.report:
+                self.report.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self.delete:
+            self._pending.extend((record["path"], record["size"]) for record in orphans)
+            if len(self._pending) >= storage_utils.REMOVE_BATCH_SIZE:
+                await self.flush()
+
+    async def flush(self):
+        """Remove os órfãos acumulados (em lotes de REMOVE_BATCH_SIZE)."""
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            sizes = dict(batch)
+            result = await storage_utils.remove_objects([path for path, _ in batch])
+            failed = set(result["failed_paths"])
+            self.removed += result["removed"]
+            self.failed += len(failed)
+            self.bytes_reclaimed += sum(size for path, size in sizes.items() if path not in failed)
+            print(f"  Removidos {self.removed} arquivos ({self.bytes_reclaimed / 1024 / 1024:.1f}MB)")
+
+    async def files(self, prefix):
+        async for item in storage_utils.aiter_prefix(prefix):
+            if not storage_utils.is_folder(item):
+                yield f"{prefix}/{storage_utils.item_name(item)}", item
+
+    async def check_song_folder(self, album_id):
+        orphans = []
+        album = self.albums.get(album_id)
+        if album and album["deleting"]:
+            return orphans
+        async for path, item in self.files(f"songs/{album_id}"):
+            if album is None:
+                self.found(orphans, path, item, SONG_MISSING_ALBUM, album_id)
+            elif path not in self.referenced:
+                self.found(orphans, path, item, SONG_UNREFERENCED, album_id)
+        return orphans
+
+    async def check_albums_folder(self, name):
+        orphans = []
+        album = self.albums.get(name)
+        if album is not None:
+            # albums/<album>/: ZIPs do álbum; só o archive_url atual é válido
+            if album["deleting"]:
+                return orphans
+            async for path, item in self.files(f"albums/{name}"):
+                if path != album["archive_path"]:
+                    self.found(orphans, path, item, ARCHIVE_STALE, name)
+            return orphans
+
+        # albums/<user>/<album>/cover.jpg (ou ZIPs soltos de um álbum que já não existe)
+        async for item in storage_utils.aiter_prefix(f"albums/{name}"):
+            child = storage_utils.item_name(item)
+            if not storage_utils.is_folder(item):
+                self.found(orphans, f"albums/{name}/{child}", item, ARCHIVE_MISSING_ALBUM, name)
+                continue
+            if child in self.albums:
+                continue
+            async for path, cover in self.files(f"albums/{name}/{child}"):
+                self.found(orphans, path, cover, COVER_MISSING_ALBUM, child)
+        return orphans
+
+    async def run(self, prefixes, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        checks = {"songs": self.check_song_folder, "albums": self.check_albums_folder}
+
+        async def bounded(check, name):
+            async with semaphore:
+                try:
+                    orphans = await check(name)
+                except Exception as e:
+                    print(f"  ❌ Erro em {name}: {e}")
+                    return
+                await self.collect(orphans)
+
+        for prefix in prefixes:
+            print(f"\nVerificando {prefix}/ ...")
+            # Nomes das pastas primeiro: remover arquivos durante a listagem
+            # deslocaria os offsets das páginas seguintes
+            folders = [storage_utils.item_name(item) async for item in storage_utils.aiter_prefix(prefix)
+                       if storage_utils.is_folder(item)]
+            print(f"  {len(folders)} pastas")
+            await asyncio.gather(*(bounded(checks[prefix], name) for name in folders))
+        await self.flush()
+
+def empty_albums(albums, cutoff):
+    return sorted(
+        album_id for album_id, album in albums.items()
+        if album["songs"] == 0 and not album["deleting"]
+        and album["created_at"] is not None and album["created_at"] <= cutoff
+    )
+
+def mark_for_deletion(album_ids):
+    """Marca álbuns como pendentes de exclusão; o worker do servidor (album_deleter) apaga."""
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(0, len(album_ids), 100):
+        supabase.table("albums").update({
+            "deletion_status": STATUS_PENDING,
+            "deletion_requested_at": now,
+            "deletion_attempts": 0,
+            "deletion_error": None,
+        }).in_("id", album_ids[i:i + 100]).execute()
+
+async def reconcile(prefixes, delete=False, min_age_hours=DEFAULT_MIN_AGE_HOURS,
+                    concurrency=DEFAULT_CONCURRENCY, report_path=None):
+    print("=" * 80)
+    print("RECONCILIANDO STORAGE COM O BANCO DE DADOS" + (" (REMOVENDO ÓRFÃOS)" if delete else ""))
+    print("=" * 80)
+
+    print("\nLendo chaves do banco...")
+    albums, referenced = await asyncio.to_thread(load_database_keys)
+
+    report = open(report_path, "w", encoding="utf-8") if report_path else None
+    try:
+        reconciler = Reconciler(albums, referenced, min_age_hours, delete, report)
+        await reconciler.run(prefixes, concurrency)
+    finally:
+        if report:
+            report.close()
+
+    print("\n" + "=" * 80)
+    print("ARQUIVOS ÓRFÃOS:")
+    print("-" * 80)
+    total_files = sum(files for files, _ in reconciler.orphans.values())
+    total_bytes = sum(size for _, size in reconciler.orphans.values())
+    for reason, (files, size) in sorted(reconciler.orphans.items()):
+        print(f"  {reason:30s} {files:6d} arquivos  {size / 1024 / 1024:10.1f}MB")
+    print(f"  {'total':30s} {total_files:6d} arquivos  {total_bytes / 1024 / 1024:10.1f}MB")
+    if reconciler.skipped_recent:
+        print(f"  (ignorados {reconciler.skipped_recent} arquivos com menos de {min_age_hours}h)")
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=min_age_hours)
+    empty = empty_albums(albums, cutoff)
+    print(f"\nÁLBUNS SEM MÚSICAS ({len(empty)}):")
+    print("-" * 80)
+    for album_id in empty[:20]:
+        print(f"  {album_id}")
+    if len(empty) > 20:
+        print(f"  ... e mais {len(empty) - 20}")
+
+    if delete:
+        if empty:
+            await asyncio.to_thread(mark_for_deletion, empty)
+            print(f"  {len(empty)} álbuns marcados para exclusão")
+        print(f"\n✅ Removidos {reconciler.removed} arquivos, "
+              f"{reconciler.bytes_reclaimed / 1024 / 1024:.1f}MB liberados")
+        if reconciler.failed:
+            print(f"❌ {reconciler.failed} arquivos não puderam ser removidos")
+    else:
+        print(f"\nRode com --delete para remover ({total_bytes / 1024 / 1024:.1f}MB a liberar)")
+    if report_path:
+        print(f"Relatório: {report_path}")
+    print("=" * 80)
+    return reconciler.failed == 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Encontra (e remove) arquivos órfãos no storage")
+    parser.add_argument("--delete", action="store_true", help="Remover os órfãos encontrados")
+    parser.add_argument("--min-age-hours", type=float, default=DEFAULT_MIN_AGE_HOURS,
+                        help="Ignorar arquivos e álbuns mais novos que isso")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Pastas listadas em paralelo")
+    parser.add_argument("--prefix", choices=["songs", "albums"], action="append",
+                        help="Verificar só este prefixo (padrão: songs e albums)")
+    parser.add_argument("--report", default=None, help="Gravar os órfãos num arquivo NDJSON")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    ok = asyncio.run(reconcile(args.prefix or ["songs", "albums"], args.delete, args.min_age_hours,
+                               args.concurrency, args.report))
+    sys.exit(0 if ok else 1)
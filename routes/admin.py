@@ -1,83 +1,88 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
-import subprocess
-import sys
-import threading
+from typing import Optional
+import asyncio
+from . import archive_jobs
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-# Controlar se está executando
-is_generating = False
-generation_output = []
-
-
-def run_generation_script():
-    """Executa o script em uma thread separada"""
-    global is_generating, generation_output
-    
-    try:
-        is_generating = True
-        generation_output = []
-        
-        # Executar script
-        process = subprocess.Popen(
-            [sys.executable, "generate_album_archives.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            cwd="/app" if "/app" in sys.executable else None
-        )
-        
-        # Capturar output
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                break
-            generation_output.append(line.strip())
-            print(line.strip())
-        
-        process.wait()
-        generation_output.append(f"[CONCLUÍDO] Código de retorno: {process.returncode}")
-        
-    except Exception as e:
-        generation_output.append(f"[ERRO] {str(e)}")
-    finally:
-        is_generating = False
-
 
 @router.post("/generate-archives")
-async def generate_archives():
+async def generate_archives(
+    time_budget_seconds: Optional[float] = Query(None, gt=0),
+    max_items: Optional[int] = Query(None, gt=0),
+    continuation_token: Optional[str] = Query(None),
+    restart: bool = Query(False),
+    stale: bool = Query(False, description="Regerar só archives com fingerprint desatualizado"),
+):
     """
-    Inicia a geração dos ZIPs em background
-    Retorna status + lista de output anterior
+    Inicia a geração dos ZIPs em background (job de routes.archive_jobs)
+    Com time_budget_seconds/max_items a execução para no limite e a próxima
+    continua do último álbum processado (ou do continuation_token).
+    Retorna status + id do job (ou o job já em andamento)
     """
-    global is_generating
-    
-    if is_generating:
+    try:
+        job = await archive_jobs.start_job(archive_jobs.JOB_GENERATE_ARCHIVES, {
+            "time_budget_seconds": time_budget_seconds,
+            "max_items": max_items,
+            "continuation_token": continuation_token,
+            "restart": restart,
+            "stale": stale,
+        })
+    except archive_jobs.JobAlreadyRunning as e:
+        running = await asyncio.to_thread(archive_jobs.get_job, e.job_id, 20)
         return JSONResponse({
             "status": "em_progresso",
             "message": "Geração já em andamento",
-            "output": generation_output[-20:]  # Últimas 20 linhas
+            "job_id": e.job_id,
+            "progress": running["progress"] if running else {},
+            "output": running["output"] if running else []  # Últimas 20 linhas
         })
-    
-    # Iniciar em thread separada
-    thread = threading.Thread(target=run_generation_script, daemon=True)
-    thread.start()
-    
+
     return JSONResponse({
         "status": "iniciado",
         "message": "Geração de archives iniciada em background",
+        "job_id": job.id,
         "output": ["Verifique novamente em alguns minutos..."]
     })
 
 
 @router.get("/generate-archives/status")
 async def get_generation_status():
-    """Retorna status atual da geração"""
-    global is_generating, generation_output
-    
+    """Retorna status atual da geração (último job)"""
+    job = await asyncio.to_thread(archive_jobs.latest_job, archive_jobs.JOB_GENERATE_ARCHIVES, 50)
+    if not job:
+        return JSONResponse({"is_generating": False, "total_lines": 0, "output": []})
+
     return JSONResponse({
-        "is_generating": is_generating,
-        "total_lines": len(generation_output),
-        "output": generation_output[-50:]  # Últimas 50 linhas
+        "is_generating": job["status"] in archive_jobs.ACTIVE_STATUSES,
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "total_lines": job["total_lines"],
+        "output": job["output"]  # Últimas 50 linhas
     })
+
+
+@router.get("/generate-archives/jobs")
+async def list_generation_jobs(limit: int = Query(20, ge=1, le=200)):
+    """Histórico dos jobs de geração (mais recentes primeiro)"""
+    jobs = await asyncio.to_thread(archive_jobs.list_jobs, archive_jobs.JOB_GENERATE_ARCHIVES, limit)
+    return JSONResponse({"jobs": jobs})
+
+
+@router.get("/generate-archives/jobs/{job_id}")
+async def get_generation_job(job_id: str, lines: int = Query(200, ge=0, le=archive_jobs.ARCHIVE_JOB_LOG_LINES)):
+    """Detalhes de um job, com as últimas `lines` linhas de log"""
+    job = await asyncio.to_thread(archive_jobs.get_job, job_id, lines)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(job)
+
+
+@router.post("/generate-archives/jobs/{job_id}/cancel")
+async def cancel_generation_job(job_id: str):
+    """Cancela um job em andamento (para entre dois álbuns, com o cursor salvo)"""
+    if not await asyncio.to_thread(archive_jobs.cancel_job, job_id):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return JSONResponse({"status": "cancelando", "job_id": job_id})
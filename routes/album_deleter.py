@@ -0,0 +1,253 @@
+"""
+Background permanent deletion of albums.
+DELETE /albums/{id}?permanent=true only marks the album as pending
+(albums.deletion_status) and enqueues it. A worker started in the app lifespan
+purges queued albums in batches through album_purge, retrying failures with
+exponential backoff. Pending albums are re-enqueued on startup and by a
+periodic rescan, so nothing is lost if the process restarts.
+"""
+from supabase import create_client
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from . import album_purge
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+STATUS_PENDING = "pending"
+STATUS_DELETING = "deleting"
+STATUS_FAILED = "failed"
+STATUS_DELETED = "deleted"
+
+# Albums purged per worker batch
+DELETION_BATCH_SIZE = int(os.getenv("DELETION_BATCH_SIZE", "50"))
+
+# Wait this long after the first queued album so a burst is purged together
+DELETION_BATCH_WAIT = 0.5
+
+# Attempts before an album is left as "failed"
+DELETION_MAX_ATTEMPTS = int(os.getenv("DELETION_MAX_ATTEMPTS", "5"))
+
+# Backoff between attempts: base * 2^(attempt-1), capped
+DELETION_RETRY_BASE_SECONDS = 5
+DELETION_RETRY_MAX_SECONDS = 300
+
+# Pending albums are re-read from the database this often (covers restarts and other workers)
+DELETION_RESCAN_INTERVAL = int(os.getenv("DELETION_RESCAN_INTERVAL", "300"))
+
+# Recently finished deletions kept in memory for the status endpoint
+RECENT_DELETIONS_MAX = 1000
+
+_queue = None
+_queued = set()
+_recently_deleted = OrderedDict()
+_retry_handles = {}
+_worker_task = None
+_rescan_task = None
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _retry_delay(attempts: int) -> float:
+    return min(DELETION_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), DELETION_RETRY_MAX_SECONDS)
+
+
+def _enqueue(album_id: str):
+    _retry_handles.pop(album_id, None)
+    if _queue is None or album_id in _queued:
+        return
+    _queued.add(album_id)
+    _queue.put_nowait(album_id)
+
+
+async def request_deletion(album_id: str):
+    """Mark an album as pending permanent deletion and queue it for the worker."""
+    _recently_deleted.pop(album_id, None)
+    await asyncio.to_thread(
+        lambda: supabase.table("albums").update({
+            "deletion_status": STATUS_PENDING,
+            "deletion_requested_at": _now_iso(),
+            "deletion_attempts": 0,
+            "deletion_error": None,
+        }).eq("id", album_id).execute()
+    )
+    _enqueue(album_id)
+    print(f"[DELETER] Album {album_id} queued for permanent deletion")
+
+
+async def get_deletion_status(album_id: str) -> dict:
+    """Deletion status of an album. Albums whose row is gone are reported as deleted."""
+    response = await asyncio.to_thread(
+        lambda: supabase.table("albums")
+        .select("id, deletion_status, deletion_requested_at, deletion_attempts, deletion_error")
+        .eq("id", album_id)
+        .limit(1)
+        .execute()
+    )
+    rows = response.data or []
+    if not rows:
+        return {"album_id": album_id, "status": STATUS_DELETED, "deleted_at": _recently_deleted.get(album_id)}
+
+    row = rows[0]
+    return {
+        "album_id": album_id,
+        "status": row.get("deletion_status"),
+        "requested_at": row.get("deletion_requested_at"),
+        "attempts": row.get("deletion_attempts") or 0,
+        "error": row.get("deletion_error"),
+        "queued": album_id in _queued,
+    }
+
+
+async def _next_batch() -> list:
+    """Block until an album is queued, then collect up to DELETION_BATCH_SIZE ids."""
+    batch = [await _queue.get()]
+    deadline = asyncio.get_running_loop().time() + DELETION_BATCH_WAIT
+    while len(batch) < DELETION_BATCH_SIZE:
+        timeout = deadline - asyncio.get_running_loop().time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(_queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    for album_id in batch:
+        _queued.discard(album_id)
+    return batch
+
+
+async def _mark_failed(album: dict, error: str):
+    attempts = (album.get("deletion_attempts") or 0) + 1
+    status = STATUS_FAILED if attempts >= DELETION_MAX_ATTEMPTS else STATUS_PENDING
+    await asyncio.to_thread(
+        lambda: supabase.table("albums").update({
+            "deletion_status": status,
+            "deletion_attempts": attempts,
+            "deletion_error": error,
+        }).eq("id", album["id"]).execute()
+    )
+    if status == STATUS_FAILED:
+        print(f"[DELETER] Album {album['id']} failed after {attempts} attempts: {error}")
+        return
+
+    delay = _retry_delay(attempts)
+    print(f"[DELETER] Album {album['id']} failed (attempt {attempts}), retrying in {delay}s")
+    _retry_handles[album["id"]] = asyncio.get_running_loop().call_later(delay, _enqueue, album["id"])
+
+
+async def _process_batch(album_ids: list):
+    response = await asyncio.to_thread(
+        lambda: supabase.table("albums")
+        .select("id, artist_id, deletion_status, deletion_attempts")
+        .in_("id", album_ids)
+        .execute()
+    )
+    # Albums restored or already purged since they were queued are skipped
+    albums = [album for album in (response.data or []) if album.get("deletion_status") in (STATUS_PENDING, STATUS_DELETING)]
+    if not albums:
+        return
+
+    ids = [album["id"] for album in albums]
+    await asyncio.to_thread(
+        lambda: supabase.table("albums").update({"deletion_status": STATUS_DELETING}).in_("id", ids).execute()
+    )
+
+    print(f"[DELETER] Purging {len(albums)} albums...")
+    try:
+        result = await album_purge.purge_round(albums, log_prefix="[DELETER]")
+    except Exception as e:
+        print(f"[DELETER] Error purging batch: {e}")
+        result = {"deleted_ids": [], "failed_ids": ids, "files_removed": 0}
+
+    finished_at = _now_iso()
+    for album_id in result["deleted_ids"]:
+        _recently_deleted[album_id] = finished_at
+        while len(_recently_deleted) > RECENT_DELETIONS_MAX:
+            _recently_deleted.popitem(last=False)
+
+    failed = set(result["failed_ids"])
+    for album in albums:
+        if album["id"] in failed:
+            await _mark_failed(album, "Storage listing or removal failed")
+
+    print(f"[DELETER] Batch done: {len(result['deleted_ids'])} deleted, "
+          f"{len(failed)} failed, {result['files_removed']} files removed")
+
+
+async def _worker():
+    while True:
+        batch = await _next_batch()
+        try:
+            await _process_batch(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Database errors: try the whole batch again later
+            print(f"[DELETER] Error processing batch of {len(batch)} albums: {e}")
+            loop = asyncio.get_running_loop()
+            for album_id in batch:
+                _retry_handles[album_id] = loop.call_later(DELETION_RETRY_BASE_SECONDS, _enqueue, album_id)
+
+
+async def enqueue_pending():
+    """Queue every album still marked pending/deleting in the database."""
+    response = await asyncio.to_thread(
+        lambda: supabase.table("albums")
+        .select("id")
+        .in_("deletion_status", [STATUS_PENDING, STATUS_DELETING])
+        .order("deletion_requested_at")
+        .execute()
+    )
+    pending = [row["id"] for row in (response.data or []) if row["id"] not in _retry_handles]
+    for album_id in pending:
+        _enqueue(album_id)
+    if pending:
+        print(f"[DELETER] Re-enqueued {len(pending)} pending album deletions")
+
+
+async def _rescan_loop():
+    while True:
+        try:
+            await enqueue_pending()
+        except Exception as e:
+            print(f"[DELETER] Error scanning pending deletions: {e}")
+        await asyncio.sleep(DELETION_RESCAN_INTERVAL)
+
+
+def start_background_tasks():
+    """Start the deletion worker and the pending-deletion rescan (called from the app lifespan)."""
+    global _queue, _worker_task, _rescan_task
+    if _worker_task is None:
+        _queue = asyncio.Queue()
+        _worker_task = asyncio.create_task(_worker())
+        _rescan_task = asyncio.create_task(_rescan_loop())
+
+
+async def stop_background_tasks():
+    global _queue, _worker_task, _rescan_task
+    for handle in _retry_handles.values():
+        handle.cancel()
+    _retry_handles.clear()
+    for task in (_worker_task, _rescan_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _queue = None
+    _queued.clear()
+    _worker_task = None
+    _rescan_task = None
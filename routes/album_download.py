@@ -10,6 +10,8 @@ import asyncio
 import logging
 from datetime import datetime
 import traceback
+import time
+from . import archive_fingerprint
 
 
 load_dotenv()
@@ -41,6 +43,34 @@ supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 router = APIRouter(prefix="/albums", tags=["album_download"])
 
+# Resultado da verificação de fingerprint por álbum: {album_id: (stored_fingerprint, is_fresh, expires_at)}
+ARCHIVE_CHECK_TTL = 60
+ARCHIVE_CHECK_MAX_ENTRIES = 5000
+_archive_checks = {}
+
+
+def _archive_is_fresh(album_id: str, stored_fingerprint) -> bool:
+    """
+    True se o archive pre-gerado ainda corresponde às músicas do álbum.
+    Archives antigos sem fingerprint são considerados válidos (o modo --stale
+    do gerador os atualiza). Resultado em cache por ARCHIVE_CHECK_TTL segundos.
+    """
+    if not stored_fingerprint:
+        return True
+    now = time.monotonic()
+    cached = _archive_checks.get(album_id)
+    if cached and cached[0] == stored_fingerprint and cached[2] > now:
+        return cached[1]
+    
+    is_fresh = archive_fingerprint.album_fingerprint(album_id) == stored_fingerprint
+    if len(_archive_checks) >= ARCHIVE_CHECK_MAX_ENTRIES:
+        for key in [key for key, value in _archive_checks.items() if value[2] <= now]:
+            del _archive_checks[key]
+        if len(_archive_checks) >= ARCHIVE_CHECK_MAX_ENTRIES:
+            _archive_checks.clear()
+    _archive_checks[album_id] = (stored_fingerprint, is_fresh, now + ARCHIVE_CHECK_TTL)
+    return is_fresh
+
 
 async def download_single_song(client, song, idx):
     """Baixa uma única música e retorna os dados."""
@@ -157,13 +187,14 @@ async def stream_zip(songs, album_title):
 async def download_album(album_id: str):
     """
     Retorna um arquivo ZIP contendo todas as musicas de um album.
-    Se archive_url existe, faz redirect. Senão, gera em tempo real com streaming.
+    Se archive_url existe e o fingerprint confere, faz redirect. Senão, gera em
+    tempo real com streaming.
     """
     try:
         logger.info(f"Iniciando download do album: {album_id}")
         
         # Buscar album
-        album_result = supabase.table("albums").select("id, title, archive_url").eq("id", album_id).single().execute()
+        album_result = supabase.table("albums").select("id, title, archive_url, archive_fingerprint").eq("id", album_id).single().execute()
         
         if not album_result.data:
             raise HTTPException(status_code=404, detail="Album nao encontrado")
@@ -172,11 +203,19 @@ async def download_album(album_id: str):
         album_title = album.get("title", f"album_{album_id}")
         archive_url = album.get("archive_url")
         
-        # Se já tem archive pre-gerado, redireciona para ele (instantâneo)
+        # Se já tem archive pre-gerado e atualizado, redireciona para ele (instantâneo)
         if archive_url:
-            logger.info(f"✅ Usando archive pre-gerado: {archive_url[:50]}...")
-            from fastapi.responses import RedirectResponse
-            return RedirectResponse(url=archive_url)
+            try:
+                is_fresh = await asyncio.to_thread(_archive_is_fresh, album_id, album.get("archive_fingerprint"))
+            except Exception as e:
+                logger.error(f"Erro ao verificar fingerprint do archive: {e}")
+                is_fresh = True
+            
+            if is_fresh:
+                logger.info(f"✅ Usando archive pre-gerado: {archive_url[:50]}...")
+                from fastapi.responses import RedirectResponse
+                return RedirectResponse(url=archive_url)
+            logger.info(f"⚠️  Archive desatualizado (músicas mudaram), gerando em tempo real...")
         
         # Senão, gera em tempo real
         logger.info(f"⏱️  Archive não existe, gerando em tempo real...")
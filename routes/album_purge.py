@@ -0,0 +1,88 @@
+"""
+Permanent deletion of albums (storage files and database rows).
+Albums are purged in rounds: the storage prefixes of every album in the round
+are listed concurrently, their objects removed in large batches, and the
+song/album rows deleted with one `in_()` filter per table.
+"""
+from supabase import create_client
+import asyncio
+import os
+from dotenv import load_dotenv
+from . import catalog_search, storage_utils
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+# Storage calls running at once while purging
+PURGE_CONCURRENCY = int(os.getenv("PURGE_CONCURRENCY", "8"))
+
+# Albums purged per round (one DB delete per table per round)
+PURGE_ROUND_SIZE = 100
+
+
+def album_storage_prefixes(album: dict) -> list:
+    """Storage prefixes holding the files of an album (cover and songs)."""
+    album_id = album.get("id")
+    return [f"albums/{album.get('artist_id')}/{album_id}", f"songs/{album_id}"]
+
+
+async def _list_album_files(album: dict, semaphore: asyncio.Semaphore) -> list:
+    async def list_one(prefix):
+        async with semaphore:
+            return await storage_utils.alist_prefix_paths(prefix)
+
+    listings = await asyncio.gather(*(list_one(prefix) for prefix in album_storage_prefixes(album)))
+    return [path for paths in listings for path in paths]
+
+
+async def purge_round(albums: list, concurrency: int = PURGE_CONCURRENCY, log_prefix: str = "[PURGE]") -> dict:
+    """
+    Permanently delete one round of albums.
+
+    An album whose storage listing or removal fails keeps its database rows,
+    so a later run can retry it without leaving orphaned files behind.
+
+    Returns:
+        dict: {"deleted_ids": [...], "failed_ids": [...], "files_removed": int}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    listings = await asyncio.gather(
+        *(_list_album_files(album, semaphore) for album in albums), return_exceptions=True
+    )
+
+    failed_ids = []
+    files_by_album = {}
+    for album, listing in zip(albums, listings):
+        if isinstance(listing, Exception):
+            print(f"{log_prefix} Error listing files of album {album.get('id')}: {listing}")
+            failed_ids.append(album.get("id"))
+        else:
+            files_by_album[album.get("id")] = listing
+
+    all_files = [path for paths in files_by_album.values() for path in paths]
+    print(f"{log_prefix} Removing {len(all_files)} files of {len(files_by_album)} albums...")
+    removal = await storage_utils.remove_objects(all_files, concurrency=concurrency)
+
+    failed_paths = set(removal["failed_paths"])
+    ready_ids = []
+    for album_id, paths in files_by_album.items():
+        if failed_paths.intersection(paths):
+            failed_ids.append(album_id)
+        else:
+            ready_ids.append(album_id)
+
+    if ready_ids:
+        print(f"{log_prefix} Deleting {len(ready_ids)} albums from database")
+        await asyncio.to_thread(lambda: supabase.table("songs").delete().in_("album_id", ready_ids).execute())
+        await asyncio.to_thread(lambda: supabase.table("albums").delete().in_("id", ready_ids).execute())
+        catalog_search.remove_albums(ready_ids)
+
+    return {"deleted_ids": ready_ids, "failed_ids": failed_ids, "files_removed": removal["removed"]}
+
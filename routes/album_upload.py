@@ -1,23 +1,25 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 import os
 import uuid
 import json
 import asyncio
 import zipfile
 import shutil
-import unicodedata
 import re
-from typing import Optional
 from pathlib import Path
 from datetime import datetime, timezone
 from supabase import create_client
 from dotenv import load_dotenv
-import jwt
 import rarfile
 import httpx
 from io import BytesIO
 from . import upload_progress as progress_module
 from . import auth_utils
+from . import catalog_search
+from . import release_scheduler
+from . import resumable_upload
+from . import youtube_metadata
+from .text_utils import strip_accents
 
 load_dotenv()
 
@@ -32,6 +34,9 @@ supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 router = APIRouter(prefix="/album-upload", tags=["album-upload"])
 
+# Chunk size used to copy the uploaded archive to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # Global state for upload progress tracking
 upload_progress = {}
 
@@ -41,8 +46,7 @@ def sanitize_filename(filename: str) -> str:
     Converts "Música.mp3" -> "Musica.mp3"
     """
     # Remove accents
-    nfd = unicodedata.normalize('NFD', filename)
-    clean = ''.join(char for char in nfd if unicodedata.category(char) != 'Mn')
+    clean = strip_accents(filename)
     
     # Remove other special characters (keep only alphanumeric, dots, hyphens, underscores)
     clean = re.sub(r'[^\w\s.-]', '', clean)
@@ -52,25 +56,8 @@ def sanitize_filename(filename: str) -> str:
     
     return clean
 
-def extract_youtube_video_id(url: str) -> Optional[str]:
-    """
-    Extract video ID from YouTube URL.
-    Supports: youtu.be/xxx, youtube.com/watch?v=xxx, youtube.com/embed/xxx
-    Returns: video_id (11 chars) or None if invalid
-    """
-    if not url:
-        return None
-    
-    pattern = r'^.*(youtu.be\/|v\/|u\/\w\/|embed\/|watch\?v=|&v=)([^#&?]*).*'
-    match = re.match(pattern, url)
-    
-    if match and len(match.group(2)) == 11:
-        return match.group(2)
-    
-    return None
-
 @router.post("/upload")
-async def upload_album(request: Request):
+async def upload_album(request: Request, user_id: str = Depends(auth_utils.get_current_user_id)):
     """
     Upload a new album with all metadata.
     Extracts ZIP, uploads files to Supabase Storage, and saves metadata.
@@ -100,7 +87,6 @@ async def upload_album(request: Request):
         collaborators_str = form_data.get("collaborators", "[]")
         artist_id = form_data.get("artistId")
         artist_name = form_data.get("artistName", "")
-        auth_header = request.headers.get("Authorization")
         
         # Get files
         cover_image_file = form_data.get("coverImage")
@@ -117,51 +103,45 @@ async def upload_album(request: Request):
         if not album_file:
             raise HTTPException(status_code=400, detail="albumFile is required")
         
-        if not auth_header:
-            raise HTTPException(status_code=401, detail="Authorization header required")
-        
-        # Extract user ID from token
-        token = auth_header.replace("Bearer ", "").strip()
-        try:
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            user_id = decoded.get("sub")
-        except Exception as e:
-            print(f"Error decoding token: {e}")
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Could not extract user from token")
-        
         # Use uploadId from frontend if provided, otherwise generate new one
         upload_id = form_data.get("uploadId") or str(uuid.uuid4())
         print(f"[UPLOAD] Upload ID: {upload_id}")
         
-        # Initialize progress tracking (update_progress will handle initialization)
-        progress_module.update_progress(upload_id, 0, "iniciando_upload")
+        # Initialize progress tracking (progress is computed from bytes processed in each stage)
+        tracker = progress_module.UploadProgressTracker(upload_id)
+        tracker.report("iniciando_upload", force=True)
+        progress_module.set_upload_owner(upload_id, user_id)
         
         # Skip connection test - upload will fail directly if there's an issue
         print(f"[UPLOAD] Supabase connection configured.")
-        progress_module.update_progress(upload_id, 5, "conexao_verificada")
+        tracker.report("conexao_verificada", force=True)
         
         # Create working directory
         temp_dir = Path(__file__).parent.parent / "uploads" / upload_id
         temp_dir.mkdir(parents=True, exist_ok=True)
         
         try:
-            progress_module.update_progress(upload_id, 1, "lendo_arquivo")
-            await asyncio.sleep(0.1)
             print(f"[UPLOAD] Starting file processing...")
             
             # Save and extract ZIP file
             album_zip_path = temp_dir / f"{album_file.filename}"
-            print(f"[UPLOAD] Reading file contents...")
-            progress_module.update_progress(upload_id, 5, "extraindo_arquivo")
-            await asyncio.sleep(0.1)
-            contents = await album_file.read()
+            album_file_size = getattr(album_file, "size", None)
+            if album_file_size is None:
+                album_file.file.seek(0, os.SEEK_END)
+                album_file_size = album_file.file.tell()
+                album_file.file.seek(0)
+            tracker.set_total("recebendo_arquivo", album_file_size)
+            tracker.report("lendo_arquivo", force=True)
             
             print(f"[UPLOAD] Writing file to disk...")
             with open(album_zip_path, "wb") as f:
-                f.write(contents)
+                while True:
+                    chunk = await album_file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    tracker.advance("recebendo_arquivo", len(chunk), "lendo_arquivo")
+            tracker.finish_stage("recebendo_arquivo", "extraindo_arquivo")
             
             print(f"[UPLOAD] File saved: {album_zip_path}")
             print(f"[UPLOAD] File size: {os.path.getsize(album_zip_path)} bytes")
@@ -175,13 +155,15 @@ async def upload_album(request: Request):
             try:
                 if file_extension == '.zip':
                     print(f"[UPLOAD] Extracting ZIP file...")
-                    progress_module.update_progress(upload_id, 15, "extraindo_zip")
-                    await asyncio.sleep(0.1)
                     with zipfile.ZipFile(album_zip_path, 'r') as zip_ref:
-                        zip_ref.extractall(extract_dir)
+                        members = zip_ref.infolist()
+                        tracker.set_total("extraindo_arquivo", sum(m.file_size for m in members))
+                        tracker.report("extraindo_zip", force=True)
+                        for member in members:
+                            zip_ref.extract(member, extract_dir)
+                            tracker.advance("extraindo_arquivo", member.file_size, "extraindo_zip")
                     print(f"[UPLOAD] ZIP extracted successfully to: {extract_dir}")
-                    progress_module.update_progress(upload_id, 32, "zip_extraido")
-                    await asyncio.sleep(0.1)
+                    tracker.finish_stage("extraindo_arquivo", "zip_extraido")
                 elif file_extension == '.rar':
                     print(f"[UPLOAD] Extracting RAR file (this may take a while)...")
                     try:
@@ -203,16 +185,18 @@ async def upload_album(request: Request):
                         
                         # Try using rarfile library with proper error handling
                         rarfile.RarFile.strerror = True  # Better error messages
-                        progress_module.update_progress(upload_id, 20, "extraindo_rar")
                         with rarfile.RarFile(album_zip_path) as rar_ref:
                             # Verify RAR file is readable
                             infolist = rar_ref.infolist()
                             print(f"[UPLOAD] RAR file contains {len(infolist)} items")
+                            tracker.set_total("extraindo_arquivo", sum(m.file_size for m in infolist))
+                            tracker.report("extraindo_rar", force=True)
                             
-                            # Extract all files
+                            # Extract all files in a single unrar run (per-member
+                            # extraction re-reads solid archives from the start)
                             rar_ref.extractall(extract_dir)
                             print(f"[UPLOAD] RAR extracted successfully to: {extract_dir}")
-                            progress_module.update_progress(upload_id, 35, "rar_extraido")
+                            tracker.finish_stage("extraindo_arquivo", "rar_extraido")
                     except Exception as e:
                         print(f"[UPLOAD] RAR extraction error: {e}")
                         raise Exception(f"Failed to extract RAR file: {str(e)}")
@@ -247,12 +231,11 @@ async def upload_album(request: Request):
                         print(f"[UPLOAD]   Found audio file: {file_path.name}")
             
             print(f"[UPLOAD] Found {len(mp3_files)} audio files")
-            progress_module.update_progress(upload_id, 35, "arquivos_encontrados")
-            await asyncio.sleep(0.1)
+            tracker.report("arquivos_encontrados", force=True)
             
             if not mp3_files:
                 print(f"WARNING: No audio files found in archive!")
-                progress_module.update_progress(upload_id, 0, "erro_nenhum_audio")
+                tracker.report("erro_nenhum_audio", force=True)
                 raise HTTPException(status_code=400, detail="Nenhum arquivo de áudio (MP3, M4A, WAV, FLAC, OGG) encontrado no arquivo. Verifique o conteúdo do ZIP/RAR.")
             
             # Parse metadata
@@ -379,20 +362,14 @@ async def upload_album(request: Request):
             }
             
             # Insert album
-            progress_module.update_progress(upload_id, 80, "criando_album")
+            tracker.report("criando_album", force=True)
             print(f"[UPLOAD] Inserting album into database...")
             print(f"[UPLOAD] Album data: {album_data}")
             try:
                 # Ensure artist exists before creating album
                 artist_created = auth_utils.ensure_artist_exists(user_id, artist_name)
-                print(f"[UPLOAD] Artist creation result: {artist_created}")
-                
-                # Verify artist exists before proceeding
-                artist_verify = supabase.table("artists").select("id, name").eq("id", user_id).execute()
-                print(f"[UPLOAD] Artist verification: {artist_verify.data}")
-                
-                if not artist_verify.data or len(artist_verify.data) == 0:
-                    print(f"[UPLOAD] WARNING: Artist {user_id} still not found after creation attempt")
+                if not artist_created:
+                    print(f"[UPLOAD] WARNING: Could not ensure artist {user_id} exists")
                 
                 album_response = supabase.table("albums").insert(album_data).execute()
                 
@@ -415,8 +392,11 @@ async def upload_album(request: Request):
                 raise HTTPException(status_code=500, detail="Failed to get album ID from response")
             
             print(f"Album created with ID: {album_id}")
-            progress_module.update_progress(upload_id, 82, "album_criado")
-            await asyncio.sleep(0.1)
+            tracker.report("album_criado", force=True)
+            
+            if is_scheduled and scheduled_publish_at:
+                # Publicação agendada: o scheduler publica no horário exato
+                release_scheduler.schedule(album_id, scheduled_publish_at)
             
             # Now upload cover image to Supabase Storage with correct album_id
             cover_url = None
@@ -463,52 +443,37 @@ async def upload_album(request: Request):
             else:
                 print(f"[UPLOAD] No cover image data available")
             
-            progress_module.update_progress(upload_id, 85, "capa_carregada")
-            await asyncio.sleep(0.1)
+            tracker.report("capa_carregada", force=True)
             
             # CREATE YOUTUBE VIDEO RECORD if youtube_url is provided
+            # (title and thumbnail come from oEmbed, resolved in the background by youtube_metadata)
             if youtube_url:
                 try:
-                    video_id = extract_youtube_video_id(youtube_url)
+                    video_id = youtube_metadata.extract_video_id(youtube_url)
                     if video_id:
                         print(f"[UPLOAD] Processing YouTube video: {youtube_url}")
                         print(f"[UPLOAD] Extracted video ID: {video_id}")
                         
-                        # Get YouTube thumbnail
-                        thumbnail_url = f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-                        
-                        # Get YouTube video title
-                        video_title = title  # Default to album title
-                        try:
-                            async with httpx.AsyncClient(timeout=10.0) as client:
-                                oembed_response = await client.get(
-                                    f"https://www.youtube.com/oembed?url={youtube_url}&format=json"
-                                )
-                                if oembed_response.status_code == 200:
-                                    oembed_data = oembed_response.json()
-                                    video_title = oembed_data.get("title", title)
-                                    print(f"[UPLOAD] YouTube title fetched: {video_title}")
-                        except Exception as e:
-                            print(f"[UPLOAD] Could not fetch YouTube title: {e}")
-                        
                         # Create artist_videos record
                         video_data = {
                             "artist_id": user_id,
                             "album_id": album_id,
                             "video_url": youtube_url,
                             "video_id": video_id,
-                            "title": video_title,
-                            "thumbnail": thumbnail_url,
+                            "title": title,  # Título do álbum até o oEmbed responder
+                            "thumbnail": youtube_metadata.default_thumbnail(video_id),
                             "is_public": is_public,  # Se álbum é público, vídeo é público
+                            "metadata_status": youtube_metadata.STATUS_PENDING,
                             "created_at": datetime.now(timezone.utc).isoformat()
                         }
                         
                         print(f"[UPLOAD] Creating video record: {video_data}")
                         try:
                             video_response = supabase.table("artist_videos").insert(video_data).execute()
-                            print(f"[UPLOAD] Video response: {video_response}")
                             if hasattr(video_response, 'data') and video_response.data:
-                                print(f"[UPLOAD] Video record created successfully with ID: {video_response.data[0].get('id')}")
+                                video_record = video_response.data[0]
+                                print(f"[UPLOAD] Video record created successfully with ID: {video_record.get('id')}")
+                                youtube_metadata.enqueue(video_record.get("id"), video_id)
                             else:
                                 print(f"[UPLOAD] Warning: Video response had no data")
                         except Exception as e:
@@ -524,12 +489,13 @@ async def upload_album(request: Request):
                     print(f"[UPLOAD] YouTube processing traceback: {traceback.format_exc()}")
                     # Não falhar o upload se houve erro processando vídeo
             
-            progress_module.update_progress(upload_id, 87, "video_youtube_criado")
-            await asyncio.sleep(0.1)
+            tracker.finish_stage("criando_album", "video_youtube_criado")
             
             # Upload MP3 files and create song records
-            progress_module.update_progress(upload_id, 40, "iniciando_upload_musicas")
-            await asyncio.sleep(0.1)
+            mp3_files = sorted(mp3_files)
+            mp3_sizes = [mp3_file.stat().st_size for mp3_file in mp3_files]
+            tracker.set_total("enviando_musicas", sum(mp3_sizes))
+            tracker.report("iniciando_upload_musicas", force=True)
             
             # Log cover_url status
             if cover_url:
@@ -539,19 +505,12 @@ async def upload_album(request: Request):
             
             songs_created = []
             total_songs = len(mp3_files)
-            for idx, mp3_file in enumerate(sorted(mp3_files), 1):
+            for idx, (mp3_file, mp3_size) in enumerate(zip(mp3_files, mp3_sizes), 1):
+                song_uploaded = False
+                song_bytes_reported = [0]  # Bytes of this song already counted in the progress
                 try:
-                    # Calculate progress: 40-80% for uploads
-                    song_progress = 40 + int((idx / max(total_songs, 1)) * 35)  # 40-75% for uploads
                     print(f"[UPLOAD] Processing song {idx}/{total_songs}: {mp3_file.name}")
-                    progress_module.update_progress(upload_id, song_progress, f"enviando_musica_{idx}")
-                    await asyncio.sleep(0.05)
-                    
-                    # Read MP3 file
-                    with open(mp3_file, "rb") as f:
-                        mp3_data = f.read()
-                    
-                    print(f"[UPLOAD] Read {len(mp3_data)} bytes for {mp3_file.name}")
+                    tracker.report(f"enviando_musica_{idx}", force=True)
                     
                     # Clean filename - remove duplicate extensions
                     clean_filename = mp3_file.stem  # Remove .mp3 if duplicated
@@ -572,39 +531,66 @@ async def upload_album(request: Request):
                     upload_success = False
                     max_retries = 5
                     
-                    for attempt in range(max_retries):
-                        try:
-                            progress_module.update_progress(upload_id, song_progress, f"enviando_musica_{idx}_tentativa_{attempt+1}")
-                            await asyncio.sleep(0.05)
-                            async with httpx.AsyncClient(timeout=120.0) as client:
-                                upload_url = f"{SUPABASE_URL}/storage/v1/object/musica/{storage_path}"
-                                headers = {
-                                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                                    "Content-Type": "audio/mpeg"
-                                }
-                                response = await client.post(upload_url, content=mp3_data, headers=headers)
-                                if response.status_code not in [200, 201]:
-                                    print(f"[UPLOAD] Upload error (attempt {attempt+1}/{max_retries}): {response.status_code} - {response.text}")
-                                    if attempt < max_retries - 1:
-                                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                                        continue
-                                    raise Exception(f"Upload failed after {max_retries} attempts: {response.text}")
-                                print(f"[UPLOAD] Upload successful: {response.status_code}")
-                                upload_success = True
-                                break
-                        except asyncio.TimeoutError:
-                            print(f"[UPLOAD] Upload timeout (attempt {attempt+1}/{max_retries})")
-                            if attempt < max_retries - 1:
-                                await asyncio.sleep(2 ** attempt)
-                                continue
-                            raise Exception(f"Upload timeout after {max_retries} attempts")
+                    def count_song_bytes(amount):
+                        song_bytes_reported[0] += amount
+                        tracker.advance("enviando_musicas", amount, f"enviando_musica_{idx}")
+
+                    if mp3_size >= resumable_upload.RESUMABLE_THRESHOLD:
+                        # Arquivos grandes: upload resumível (TUS) em chunks lidos do disco,
+                        # com retry por chunk em vez de reenviar o arquivo inteiro
+                        print(f"[UPLOAD] Resumable upload of {mp3_size} bytes")
+                        loop = asyncio.get_running_loop()
+
+                        def report_song_bytes(amount):
+                            # Chamado na thread do upload: o tracker e o progress store
+                            # só são tocados no event loop
+                            loop.call_soon_threadsafe(count_song_bytes, amount)
+
+                        await asyncio.to_thread(
+                            resumable_upload.upload_file, mp3_file, "musica", storage_path,
+                            "audio/mpeg", True, report_song_bytes
+                        )
+                        upload_success = True
+                    else:
+                        # Read MP3 file
+                        with open(mp3_file, "rb") as f:
+                            mp3_data = f.read()
+                        
+                        print(f"[UPLOAD] Read {len(mp3_data)} bytes for {mp3_file.name}")
+                        
+                        for attempt in range(max_retries):
+                            try:
+                                if attempt > 0:
+                                    tracker.report(f"enviando_musica_{idx}_tentativa_{attempt+1}", force=True)
+                                async with httpx.AsyncClient(timeout=120.0) as client:
+                                    upload_url = f"{SUPABASE_URL}/storage/v1/object/musica/{storage_path}"
+                                    headers = {
+                                        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+                                        "Content-Type": "audio/mpeg"
+                                    }
+                                    response = await client.post(upload_url, content=mp3_data, headers=headers)
+                                    if response.status_code not in [200, 201]:
+                                        print(f"[UPLOAD] Upload error (attempt {attempt+1}/{max_retries}): {response.status_code} - {response.text}")
+                                        if attempt < max_retries - 1:
+                                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                                            continue
+                                        raise Exception(f"Upload failed after {max_retries} attempts: {response.text}")
+                                    print(f"[UPLOAD] Upload successful: {response.status_code}")
+                                    upload_success = True
+                                    break
+                            except asyncio.TimeoutError:
+                                print(f"[UPLOAD] Upload timeout (attempt {attempt+1}/{max_retries})")
+                                if attempt < max_retries - 1:
+                                    await asyncio.sleep(2 ** attempt)
+                                    continue
+                                raise Exception(f"Upload timeout after {max_retries} attempts")
                     
                     if not upload_success:
                         raise Exception(f"Failed to upload song {idx}")
                     
                     # Update progress after successful song upload
-                    progress_module.update_progress(upload_id, song_progress + 1, f"musica_{idx}_concluida")
-                    await asyncio.sleep(0.05)
+                    song_uploaded = True
+                    tracker.advance("enviando_musicas", mp3_size - song_bytes_reported[0], f"musica_{idx}_concluida")
                     
                     # Get public URL
                     audio_url = f"{SUPABASE_URL}/storage/v1/object/public/musica/{storage_path}"
@@ -650,8 +636,7 @@ async def upload_album(request: Request):
                             print(f"[UPLOAD] Response error: {song_response.error}")
                     
                     # Update progress after recording
-                    progress_module.update_progress(upload_id, song_progress + 2, f"musica_{idx}_registrada")
-                    await asyncio.sleep(0.05)
+                    tracker.report(f"musica_{idx}_registrada", force=True)
                     
                     print(f"[UPLOAD] Song {idx} uploaded: {mp3_file.name}")
                     
@@ -660,13 +645,15 @@ async def upload_album(request: Request):
                     print(f"[UPLOAD] Error uploading song {idx}: {e}")
                     print(f"[UPLOAD] Error type: {type(e)}")
                     print(f"[UPLOAD] Traceback: {traceback.format_exc()}")
+                    # Count the failed song as processed so progress keeps moving
+                    if not song_uploaded:
+                        tracker.advance("enviando_musicas", mp3_size - song_bytes_reported[0], f"musica_{idx}_falhou")
                     continue
             
             print(f"Created {len(songs_created)} song records")
+            tracker.finish_stage("enviando_musicas", "atualizando_contagem_musicas")
             
             # Update album with song count
-            progress_module.update_progress(upload_id, 75, "atualizando_contagem_musicas")
-            await asyncio.sleep(0.1)
             print(f"[UPLOAD] Updating album song count to {len(songs_created)}")
             try:
                 update_response = supabase.table("albums").update({
@@ -675,18 +662,18 @@ async def upload_album(request: Request):
                 print(f"[UPLOAD] Update response: {update_response}")
                 print(f"[UPLOAD] Update data: {update_response.data if hasattr(update_response, 'data') else 'No data'}")
                 print(f"[UPLOAD] Album successfully updated with song count: {len(songs_created)}")
-                progress_module.update_progress(upload_id, 80, "contagem_atualizada")
-                await asyncio.sleep(0.1)
+                tracker.report("contagem_atualizada", force=True)
             except Exception as e:
                 import traceback
                 print(f"[UPLOAD] Error updating song count: {e}")
                 print(traceback.format_exc())
             
+            # Index the album for /search (only returned once public and published)
+            catalog_search.add_album({**album_record, "cover_url": cover_url}, songs_created)
+            
             # Mark as complete
-            progress_module.update_progress(upload_id, 90, "finalizando")
-            await asyncio.sleep(0.1)
-            progress_module.update_progress(upload_id, 100, "concluido")
-            await asyncio.sleep(0.05)
+            tracker.report("finalizando", force=True)
+            tracker.finish_stage("finalizando", "concluido")
             progress_module.complete_progress(upload_id)
             
             return {
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, HTTPException, Query, Header
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from supabase import create_client
 import os
 from dotenv import load_dotenv
-import jwt
 import json
 import httpx
+import asyncio
+from . import album_deleter, auth_utils, catalog_search
 
 load_dotenv()
 
@@ -33,45 +33,20 @@ async def list_albums():
 async def delete_album(
     album_id: str,
     permanent: bool = Query(False),
-    authorization: Optional[str] = Header(None)
+    user_id: str = Depends(auth_utils.get_current_user_id)
 ):
     """
     Delete an album.
     If permanent=true, permanently delete from trash.
     If permanent=false, move to trash.
     """
-    print(f"DELETE album request: album_id={album_id}, permanent={permanent}, auth={authorization is not None}")
+    print(f"DELETE album request: album_id={album_id}, permanent={permanent}, user={user_id}")
     
     try:
-        if not authorization:
-            print("Error: No authorization header")
-            raise HTTPException(status_code=401, detail="Unauthorized - missing auth header")
-        
-        # Extract token from "Bearer {token}"
-        token = authorization.replace("Bearer ", "").strip()
-        
-        if not token:
-            print("Error: Invalid token format")
-            raise HTTPException(status_code=401, detail="Unauthorized - invalid token")
-        
-        print(f"Token extracted: {token[:20]}...")
-        
-        # Decode JWT token to get user_id
-        try:
-            # Decode without verification first (to get the payload)
-            # The token is already validated by the frontend auth
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            user_id = decoded.get("sub")
-            print(f"User ID from token: {user_id}")
-        except Exception as e:
-            print(f"Error decoding token: {str(e)}")
-            raise HTTPException(status_code=401, detail="Could not verify user from token")
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Could not extract user_id from token")
-        
         # Get album to verify ownership
-        album_data = supabase.table("albums").select("*").eq("id", album_id).single().execute()
+        album_data = await asyncio.to_thread(
+            lambda: supabase.table("albums").select("id, artist_id").eq("id", album_id).single().execute()
+        )
         album = album_data.data if album_data.data else None
         
         if not album:
@@ -81,127 +56,25 @@ async def delete_album(
             raise HTTPException(status_code=403, detail="You don't have permission to delete this album")
         
         if permanent:
-            # Permanently delete: delete files from storage, then songs, then album
-            print(f"Permanently deleting album {album_id}")
-            
-            # 1. Delete files from Supabase Storage
-            try:
-                print(f"[DELETE] Deleting files from Supabase Storage for album {album_id}")
-                
-                files_to_delete = []
-                
-                # Delete cover image(s) by listing the albums directory
-                print(f"[DELETE] Listing cover files in: albums/{user_id}/{album_id}")
-                albums_dir = f"albums/{user_id}/{album_id}"
-                try:
-                    # List all files in the albums directory (covers)
-                    list_albums = supabase.storage.from_("musica").list(albums_dir)
-                    if list_albums:
-                        print(f"[DELETE] Found {len(list_albums)} items in {albums_dir}")
-                        for item in list_albums:
-                            # Check if it's a file (has name attribute)
-                            if hasattr(item, 'name'):
-                                file_path = f"{albums_dir}/{item.name}"
-                                files_to_delete.append(file_path)
-                                print(f"[DELETE] Marked cover for deletion: {file_path}")
-                            elif isinstance(item, dict) and 'name' in item:
-                                file_path = f"{albums_dir}/{item['name']}"
-                                files_to_delete.append(file_path)
-                                print(f"[DELETE] Marked cover for deletion: {file_path}")
-                    else:
-                        print(f"[DELETE] No cover files found in {albums_dir}")
-                except Exception as e:
-                    print(f"[DELETE] Error listing cover files: {e}")
-                
-                # Delete all song audio files by listing the directory
-                print(f"[DELETE] Listing song files in: songs/{album_id}")
-                songs_dir = f"songs/{album_id}"
-                try:
-                    # List all files in the songs directory
-                    list_response = supabase.storage.from_("musica").list(songs_dir)
-                    if list_response:
-                        print(f"[DELETE] Found {len(list_response)} items in {songs_dir}")
-                        for item in list_response:
-                            # Check if it's a file (has name attribute)
-                            if hasattr(item, 'name'):
-                                file_path = f"{songs_dir}/{item.name}"
-                                files_to_delete.append(file_path)
-                                print(f"[DELETE] Marked song for deletion: {file_path}")
-                            elif isinstance(item, dict) and 'name' in item:
-                                file_path = f"{songs_dir}/{item['name']}"
-                                files_to_delete.append(file_path)
-                                print(f"[DELETE] Marked song for deletion: {file_path}")
-                    else:
-                        print(f"[DELETE] No files found in {songs_dir}")
-                except Exception as e:
-                    print(f"[DELETE] Error listing song files: {e}")
-                    import traceback
-                    print(traceback.format_exc())
-                
-                # Delete all collected files at once
-                if files_to_delete:
-                    print(f"[DELETE] Deleting {len(files_to_delete)} files from storage...")
-                    try:
-                        delete_response = supabase.storage.from_("musica").remove(files_to_delete)
-                        print(f"[DELETE] Storage delete response: {delete_response}")
-                        print(f"[DELETE] Successfully deleted {len(files_to_delete)} files")
-                    except Exception as e:
-                        print(f"[DELETE] Error deleting files from storage: {e}")
-                        import traceback
-                        print(traceback.format_exc())
-                else:
-                    print(f"[DELETE] No files to delete from storage")
-                
-                # Verify directories are clean
-                print(f"[DELETE] Verifying directories are clean...")
-                try:
-                    albums_dir = f"albums/{user_id}/{album_id}"
-                    try:
-                        list_albums = supabase.storage.from_("musica").list(albums_dir)
-                        if not list_albums or len(list_albums) == 0:
-                            print(f"[DELETE] ✓ Directory cleaned: {albums_dir}")
-                        else:
-                            print(f"[DELETE] ⚠ Directory not empty: {albums_dir}")
-                    except Exception as e:
-                        print(f"[DELETE] ✓ Directory removed: {albums_dir}")
-                    
-                    songs_dir = f"songs/{album_id}"
-                    try:
-                        list_songs = supabase.storage.from_("musica").list(songs_dir)
-                        if not list_songs or len(list_songs) == 0:
-                            print(f"[DELETE] ✓ Directory cleaned: {songs_dir}")
-                        else:
-                            print(f"[DELETE] ⚠ Directory not empty: {songs_dir}")
-                    except Exception as e:
-                        print(f"[DELETE] ✓ Directory removed: {songs_dir}")
-                    
-                except Exception as e:
-                    print(f"[DELETE] Error verifying cleanup: {e}")
-                
-            except Exception as e:
-                print(f"[DELETE] Error in storage deletion process: {e}")
-                import traceback
-                print(traceback.format_exc())
-                # Continue with DB deletion even if storage deletion fails
-            
-            # 2. Delete songs from database
-            print(f"[DELETE] Deleting songs from database")
-            supabase.table("songs").delete().eq("album_id", album_id).execute()
-            
-            # 3. Delete album from database
-            print(f"[DELETE] Deleting album from database")
-            supabase.table("albums").delete().eq("id", album_id).execute()
+            # Permanently delete: the background deleter removes storage files, songs and the album
+            print(f"Scheduling permanent deletion of album {album_id}")
+            await album_deleter.request_deletion(album_id)
+            catalog_search.remove_albums([album_id])
             
             response = {
                 "success": True,
-                "message": f"Album permanently deleted (files and database records removed)",
-                "album_id": album_id
+                "message": "Album scheduled for permanent deletion",
+                "album_id": album_id,
+                "deletion_status": album_deleter.STATUS_PENDING,
             }
         else:
             # Soft delete: mark as deleted/trashed
             print(f"Moving album {album_id} to trash")
             
-            supabase.table("albums").update({"is_deleted": True}).eq("id", album_id).execute()
+            await asyncio.to_thread(
+                lambda: supabase.table("albums").update({"is_deleted": True}).eq("id", album_id).execute()
+            )
+            catalog_search.update_albums([{"id": album_id, "is_deleted": True}])
             
             response = {
                 "success": True,
@@ -219,3 +92,11 @@ async def delete_album(
         print(f"Error deleting album: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error deleting album: {str(e)}")
+
+@router.get("/{album_id}/deletion-status")
+async def get_deletion_status(album_id: str):
+    """Status of a permanent deletion: pending, deleting, failed or deleted."""
+    try:
+        return await album_deleter.get_deletion_status(album_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching deletion status: {str(e)}")
@@ -0,0 +1,80 @@
+"""
+Fingerprints of album archives.
+A fingerprint is a sha256 over the album's track manifest: song ids, track
+order and the storage ETag of each audio object. It is stored next to
+albums.archive_url when an archive is generated; if it no longer matches the
+album, the archive is stale (tracks added, removed, reordered or replaced).
+"""
+from supabase import create_client
+import hashlib
+import os
+from typing import Optional
+from urllib.parse import unquote, urlparse
+from dotenv import load_dotenv
+from . import storage_utils
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+# Bumped if the manifest format changes (every archive becomes stale)
+FINGERPRINT_VERSION = "v1"
+
+SONG_COLUMNS = "id, title, audio_url, file_url, url, track_number"
+
+
+def fetch_album_songs(album_id: str) -> list:
+    """Songs of an album in archive order (track_number, then id)."""
+    response = (
+        supabase.table("songs")
+        .select(SONG_COLUMNS)
+        .eq("album_id", album_id)
+        .order("track_number", desc=False)
+        .order("id")
+        .execute()
+    )
+    return response.data or []
+
+
+def song_object_name(song: dict) -> Optional[str]:
+    """File name of the song's audio object (last segment of its URL or storage path)."""
+    song_url = song.get("file_url") or song.get("audio_url") or song.get("url")
+    if not song_url:
+        return None
+    path = urlparse(song_url).path if song_url.startswith("http") else song_url
+    return unquote(path.rstrip("/").rsplit("/", 1)[-1]) or None
+
+
+def storage_etags(album_id: str) -> dict:
+    """{object name: ETag} of the audio files under songs/{album_id}."""
+    etags = {}
+    for item in storage_utils.iter_prefix(f"songs/{album_id}"):
+        if storage_utils.is_folder(item):
+            continue
+        metadata = item.get("metadata") if isinstance(item, dict) else getattr(item, "metadata", None)
+        etags[storage_utils.item_name(item)] = (metadata or {}).get("eTag", "")
+    return etags
+
+
+def compute_fingerprint(songs: list, etags: dict) -> str:
+    """Fingerprint of a track manifest (songs in archive order)."""
+    digest = hashlib.sha256()
+    for position, song in enumerate(songs, 1):
+        name = song_object_name(song)
+        digest.update(
+            f"{position}|{song.get('track_number')}|{song.get('id')}|{name}|{etags.get(name, '')}\n".encode()
+        )
+    return f"{FINGERPRINT_VERSION}:{digest.hexdigest()}"
+
+
+def album_fingerprint(album_id: str, songs: Optional[list] = None) -> str:
+    """Current fingerprint of an album (songs from fetch_album_songs if not given)."""
+    if songs is None:
+        songs = fetch_album_songs(album_id)
+    return compute_fingerprint(songs, storage_etags(album_id))
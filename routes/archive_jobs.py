@@ -0,0 +1,417 @@
+"""
+In-process manager for archive generation jobs.
+This module handles:
+1. Typed jobs (JOB_RUNNERS) run in a worker thread, at most
+   ARCHIVE_JOB_CONCURRENCY at once per process and one running job per type
+2. A bounded log ring buffer and progress counters per job
+3. Cancellation (checked by the job between albums, also across workers)
+4. Job history in the local checkpoints database (routes.checkpoints), so
+   status survives restarts and is visible to every worker on the host
+5. A lease per active job: its process refreshes updated_at every
+   ARCHIVE_JOB_HEARTBEAT_INTERVAL, and a job not refreshed for
+   ARCHIVE_JOB_LEASE_SECONDS (its process crashed or restarted) is interrupted
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Optional
+from . import checkpoints
+
+JOB_GENERATE_ARCHIVES = "generate_archives"
+
+# Jobs running at once in this process (more are queued)
+ARCHIVE_JOB_CONCURRENCY = int(os.getenv("ARCHIVE_JOB_CONCURRENCY", "1"))
+
+# Log lines kept in memory per job / saved with the job history
+ARCHIVE_JOB_LOG_LINES = 1000
+ARCHIVE_JOB_SAVED_LOG_LINES = 200
+
+# Running jobs are saved to the database at most this often
+ARCHIVE_JOB_SAVE_INTERVAL = 2.0
+
+# Active jobs refresh their lease this often; one not refreshed for the lease is interrupted
+ARCHIVE_JOB_HEARTBEAT_INTERVAL = 15.0
+ARCHIVE_JOB_LEASE_SECONDS = int(os.getenv("ARCHIVE_JOB_LEASE_SECONDS", "120"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_INTERRUPTED = "interrupted"
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class ArchiveJob:
+    """
+    One job. The runner receives it and reports through write(), log(),
+    update_progress() and is_cancelled(); all of them are thread-safe.
+    """
+
+    def __init__(self, job_type: str, params: dict, job_id: Optional[str] = None):
+        self.id = job_id or str(uuid.uuid4())
+        self.type = job_type
+        self.params = params
+        self.status = STATUS_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.logs = deque(maxlen=ARCHIVE_JOB_LOG_LINES)
+        self.log_count = 0
+        self._partial = ""
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    def write(self, text: str, end: str = "\n"):
+        """Append output; lines are split on newlines (print-style, `end` may be ' ... ')."""
+        with self._lock:
+            lines = (self._partial + text + end).split("\n")
+            self._partial = lines.pop()
+            for line in lines:
+                self.logs.append(line)
+                self.log_count += 1
+        self._maybe_save()
+
+    def log(self, line: str):
+        self.write(line)
+
+    def update_progress(self, **counters):
+        with self._lock:
+            self.progress.update(counters)
+        self._maybe_save()
+
+    def is_cancelled(self) -> bool:
+        if self._cancel.is_set():
+            return True
+        # Cancellation requested from another worker
+        if _cancel_requested(self.id):
+            self._cancel.set()
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def tail(self, lines: int) -> list:
+        with self._lock:
+            output = list(self.logs)
+            if self._partial:
+                output.append(self._partial)
+        return output[-lines:] if lines else output
+
+    def _maybe_save(self):
+        now = time.monotonic()
+        if now - self._saved_at >= ARCHIVE_JOB_SAVE_INTERVAL:
+            self._saved_at = now
+            _save(self)
+
+    def to_dict(self, log_lines: int = 50) -> dict:
+        with self._lock:
+            progress = dict(self.progress)
+        return {
+            "id": self.id,
+            "type": self.type,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+            "total_lines": self.log_count,
+            "output": self.tail(log_lines),
+        }
+
+
+def _run_generate_archives(job: ArchiveJob) -> dict:
+    import generate_album_archives
+    return generate_album_archives.main(
+        time_budget=job.params.get("time_budget_seconds"),
+        max_items=job.params.get("max_items"),
+        resume_token=job.params.get("continuation_token"),
+        restart=job.params.get("restart", False),
+        job=job,
+        stale=job.params.get("stale", False),
+    )
+
+
+# Job type -> function run in a worker thread with the job; returns the job result
+JOB_RUNNERS = {
+    JOB_GENERATE_ARCHIVES: _run_generate_archives,
+}
+
+_db_lock = threading.Lock()
+_conn = None
+_jobs = {}
+_tasks = set()
+_semaphore = None
+_heartbeat_task = None
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(checkpoints.CHECKPOINT_DB_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archive_jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                log_count INTEGER NOT NULL DEFAULT 0,
+                logs TEXT,
+                pid INTEGER,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS archive_jobs_created_at ON archive_jobs (created_at);
+        """)
+        # Databases created before the lease
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(archive_jobs)")}
+        if "updated_at" not in columns:
+            try:
+                _conn.execute("ALTER TABLE archive_jobs ADD COLUMN updated_at REAL")
+            except sqlite3.OperationalError:
+                pass  # Added by another worker
+    return _conn
+
+
+def _lease_expired(updated_at: Optional[float], created_at: float, now: float) -> bool:
+    return (updated_at or created_at) < now - ARCHIVE_JOB_LEASE_SECONDS
+
+
+def _expire_leases(conn: sqlite3.Connection, job_type: str):
+    """Active jobs of a type whose lease ran out (process crashed or restarted) are marked interrupted."""
+    now = time.time()
+    conn.execute(
+        "UPDATE archive_jobs SET status = ?, finished_at = ? "
+        "WHERE type = ? AND status IN (?, ?) AND COALESCE(updated_at, created_at) < ?",
+        (STATUS_INTERRUPTED, now, job_type, *ACTIVE_STATUSES, now - ARCHIVE_JOB_LEASE_SECONDS),
+    )
+
+
+def _touch(job_ids: list):
+    """Refresh the lease of this process's active jobs."""
+    placeholders = ", ".join("?" for _ in job_ids)
+    with _db_lock:
+        _connection().execute(
+            f"UPDATE archive_jobs SET updated_at = ? WHERE id IN ({placeholders}) AND status IN (?, ?)",
+            (time.time(), *job_ids, *ACTIVE_STATUSES),
+        )
+
+
+def _save(job: ArchiveJob):
+    data = job.to_dict(log_lines=ARCHIVE_JOB_SAVED_LOG_LINES)
+    with _db_lock:
+        _connection().execute(
+            "INSERT INTO archive_jobs (id, type, status, params, created_at, started_at, finished_at, "
+            "progress, result, error, log_count, logs, pid, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET status = excluded.status, started_at = excluded.started_at, "
+            "finished_at = excluded.finished_at, progress = excluded.progress, result = excluded.result, "
+            "error = excluded.error, log_count = excluded.log_count, logs = excluded.logs, "
+            "updated_at = excluded.updated_at",
+            (job.id, job.type, data["status"], json.dumps(data["params"]), data["created_at"],
+             data["started_at"], data["finished_at"], json.dumps(data["progress"]),
+             json.dumps(data["result"]), data["error"], data["total_lines"], json.dumps(data["output"]),
+             os.getpid(), time.time()),
+        )
+
+
+def _cancel_requested(job_id: str) -> bool:
+    with _db_lock:
+        row = _connection().execute("SELECT cancel_requested FROM archive_jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row[0])
+
+
+def _row_to_dict(row: sqlite3.Row, log_lines: int = 50) -> dict:
+    logs = json.loads(row["logs"]) if row["logs"] else []
+    status = row["status"]
+    # Expired but not yet marked (that happens when the next job of the type is registered)
+    if status in ACTIVE_STATUSES and _lease_expired(row["updated_at"], row["created_at"], time.time()):
+        status = STATUS_INTERRUPTED
+    return {
+        "id": row["id"],
+        "type": row["type"],
+        "status": status,
+        "params": json.loads(row["params"]),
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+        "progress": json.loads(row["progress"]) if row["progress"] else {},
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "total_lines": row["log_count"],
+        "output": logs[-log_lines:] if log_lines else logs,
+    }
+
+
+def _query(sql: str, args: tuple = ()) -> list:
+    with _db_lock:
+        conn = _connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.row_factory = None
+
+
+def get_job(job_id: str, log_lines: int = 50) -> Optional[dict]:
+    """A job of this process (live) or from the history."""
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job.to_dict(log_lines)
+    rows = _query("SELECT * FROM archive_jobs WHERE id = ?", (job_id,))
+    return _row_to_dict(rows[0], log_lines) if rows else None
+
+
+def list_jobs(job_type: Optional[str] = None, limit: int = 20) -> list:
+    """Most recent jobs first (without logs)."""
+    if job_type:
+        rows = _query("SELECT * FROM archive_jobs WHERE type = ? ORDER BY created_at DESC LIMIT ?", (job_type, limit))
+    else:
+        rows = _query("SELECT * FROM archive_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+    jobs = []
+    for row in rows:
+        job = _jobs.get(row["id"])
+        data = job.to_dict(log_lines=0) if job is not None else _row_to_dict(row)
+        data.pop("output")
+        jobs.append(data)
+    return jobs
+
+
+def latest_job(job_type: str, log_lines: int = 50) -> Optional[dict]:
+    rows = _query("SELECT id FROM archive_jobs WHERE type = ? ORDER BY created_at DESC LIMIT 1", (job_type,))
+    return get_job(rows[0]["id"], log_lines) if rows else None
+
+
+async def _run(job: ArchiveJob):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(ARCHIVE_JOB_CONCURRENCY)
+    try:
+        async with _semaphore:
+            if await asyncio.to_thread(job.is_cancelled):
+                job.status = STATUS_CANCELLED
+                return
+            job.status = STATUS_RUNNING
+            job.started_at = time.time()
+            await asyncio.to_thread(_save, job)
+            try:
+                job.result = await asyncio.to_thread(JOB_RUNNERS[job.type], job)
+                job.status = STATUS_CANCELLED if await asyncio.to_thread(job.is_cancelled) else STATUS_SUCCEEDED
+            except Exception as e:
+                job.error = str(e)
+                job.status = STATUS_FAILED
+                job.log(f"[ERRO] {e}")
+    finally:
+        job.finished_at = time.time()
+        await asyncio.to_thread(_save, job)
+        _jobs.pop(job.id, None)
+        print(f"[JOBS] Job {job.type} {job.id} finished: {job.status}")
+
+
+class JobAlreadyRunning(Exception):
+    """A job of the same type is already queued or running (in any worker)."""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Job {job_id} is already running")
+        self.job_id = job_id
+
+
+def _register(job: ArchiveJob):
+    """Save a new job unless one of the same type is active (atomic across workers)."""
+    with _db_lock:
+        conn = _connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _expire_leases(conn, job.type)
+            row = conn.execute(
+                "SELECT id FROM archive_jobs WHERE type = ? AND status IN (?, ?) LIMIT 1",
+                (job.type, *ACTIVE_STATUSES),
+            ).fetchone()
+            if row:
+                raise JobAlreadyRunning(row[0])
+            conn.execute(
+                "INSERT INTO archive_jobs (id, type, status, params, created_at, pid, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.type, job.status, json.dumps(job.params), job.created_at, os.getpid(), time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+async def _heartbeat():
+    """Refresh the lease of this process's jobs (queued ones included) while any is active."""
+    while _jobs:
+        await asyncio.sleep(ARCHIVE_JOB_HEARTBEAT_INTERVAL)
+        job_ids = list(_jobs)
+        if not job_ids:
+            break
+        try:
+            await asyncio.to_thread(_touch, job_ids)
+        except Exception as e:
+            print(f"[JOBS] Error refreshing job leases: {e}")
+
+
+async def start_job(job_type: str, params: dict) -> ArchiveJob:
+    """
+    Create a job and run it in the background.
+    Raises ValueError for unknown types and JobAlreadyRunning if a job of the
+    type is already active.
+    """
+    global _heartbeat_task
+    if job_type not in JOB_RUNNERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job = ArchiveJob(job_type, params)
+    await asyncio.to_thread(_register, job)
+    _jobs[job.id] = job
+    task = asyncio.create_task(_run(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    if _heartbeat_task is None or _heartbeat_task.done():
+        _heartbeat_task = asyncio.create_task(_heartbeat())
+    print(f"[JOBS] Job {job_type} {job.id} queued")
+    return job
+
+
+def cancel_job(job_id: str) -> bool:
+    """Request cancellation of an active job (of any worker). Returns False if it is not active."""
+    with _db_lock:
+        cursor = _connection().execute(
+            "UPDATE archive_jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+            (job_id, *ACTIVE_STATUSES),
+        )
+    job = _jobs.get(job_id)
+    if job is not None:
+        job.cancel()
+        return True
+    return cursor.rowcount > 0
+
+
+async def stop_background_tasks():
+    """Cancel running jobs and wait for them to stop at their next checkpoint (app shutdown)."""
+    for job in list(_jobs.values()):
+        job.cancel()
+    if _tasks:
+        await asyncio.wait(list(_tasks), timeout=30)
+    if _heartbeat_task is not None:
+        _heartbeat_task.cancel()
@@ -0,0 +1,374 @@
+"""
+In-memory search index of artist names and slugs.
+Names are folded with text_utils.normalize (accents, case, punctuation), so
+"jose" finds "José". Lookups use a sorted token list (bisect) for prefix
+matches and a deletion neighbourhood (all tokens with one character removed)
+for one-typo matches, so a search touches only the matching tokens instead
+of scanning every artist.
+
+The index is built from the artists table at startup and rebuilt every
+ARTIST_INDEX_REFRESH_SECONDS (artists created by other processes); artists
+created through auth_utils are added right away.
+"""
+from supabase import create_client
+import asyncio
+import bisect
+import heapq
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .text_utils import normalize, tokenize
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+ARTIST_INDEX_REFRESH_SECONDS = int(os.getenv("ARTIST_INDEX_REFRESH_SECONDS", "600"))
+
+# Rows per page when loading the artists table
+LOAD_PAGE_SIZE = 1000
+
+# Tokens shorter than this only match exactly or by prefix (no typos)
+TYPO_MIN_LENGTH = 4
+
+# Most index tokens a single prefix may expand to
+PREFIX_EXPANSION_LIMIT = 500
+
+# Most artists ranked / examined per query: broad 1-2 letter queries only
+# rank the artists of their best (exact, then shortest) tokens
+MAX_CANDIDATES = 300
+MAX_SCANNED = 1000
+
+# Recent results (typeahead repeats the same short prefixes); dropped on any index change
+RESULT_CACHE_SIZE = 1024
+
+# Match scores per query token
+SCORE_EXACT = 3.0
+SCORE_PREFIX = 2.0
+SCORE_TYPO = 1.0
+SCORE_FULL_NAME = 3.0
+SCORE_NAME_PREFIX = 1.5
+
+
+def _deletions(token: str) -> set:
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by at most one insertion, deletion, substitution or transposition."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+    return a[i:] == b[i + 1:]
+
+
+def _token_score(term: str, token: str) -> float:
+    """Score of one index token for one query term (0 if it does not match)."""
+    if token == term:
+        return SCORE_EXACT
+    if token.startswith(term):
+        # Closer in length to the query scores higher
+        return SCORE_PREFIX - 0.5 * (1 - len(term) / len(token))
+    if len(term) >= TYPO_MIN_LENGTH and _within_one_edit(term, token):
+        return SCORE_TYPO
+    return 0.0
+
+
+class ArtistIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._artists = {}          # id -> {"id", "name", "slug", "avatar_url"}
+        self._normalized = {}       # id -> normalized name
+        self._artist_tokens = {}    # id -> set of tokens (name + slug)
+        self._token_artists = {}    # token -> set of artist ids
+        self._sorted_tokens = []    # every token, sorted (prefix lookups)
+        self._deletes = {}          # token with one char removed -> set of tokens
+        self._added = {}            # artists added since the last rebuild
+        self._bulk = False          # building: append tokens, sort once at the end
+        self._results = OrderedDict()  # (query, limit, offset) -> results
+        self.ready = False
+
+    def __len__(self):
+        return len(self._artists)
+
+    def __contains__(self, artist_id):
+        return artist_id in self._artists
+
+    # Index maintenance (callers hold the lock)
+
+    def _add_token(self, token: str, artist_id: str):
+        artists = self._token_artists.get(token)
+        if artists is None:
+            artists = self._token_artists[token] = set()
+            if self._bulk:
+                self._sorted_tokens.append(token)
+            else:
+                bisect.insort(self._sorted_tokens, token)
+            if len(token) >= TYPO_MIN_LENGTH:
+                for variant in _deletions(token):
+                    self._deletes.setdefault(variant, set()).add(token)
+        artists.add(artist_id)
+
+    def _remove_token(self, token: str, artist_id: str):
+        artists = self._token_artists.get(token)
+        if artists is None:
+            return
+        artists.discard(artist_id)
+        if artists:
+            return
+        del self._token_artists[token]
+        position = bisect.bisect_left(self._sorted_tokens, token)
+        if position < len(self._sorted_tokens) and self._sorted_tokens[position] == token:
+            del self._sorted_tokens[position]
+        if len(token) >= TYPO_MIN_LENGTH:
+            for variant in _deletions(token):
+                tokens = self._deletes.get(variant)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._deletes[variant]
+
+    def _remove(self, artist_id: str):
+        self._results.clear()
+        for token in self._artist_tokens.pop(artist_id, ()):
+            self._remove_token(token, artist_id)
+        self._artists.pop(artist_id, None)
+        self._normalized.pop(artist_id, None)
+
+    def _add(self, artist: dict):
+        artist_id = str(artist["id"])
+        self._remove(artist_id)
+        name = artist.get("name") or ""
+        slug = artist.get("slug") or ""
+        tokens = set(tokenize(name)) | set(tokenize(slug))
+        self._artists[artist_id] = {
+            "id": artist_id,
+            "name": name,
+            "slug": artist.get("slug"),
+            "avatar_url": artist.get("avatar_url"),
+        }
+        self._normalized[artist_id] = normalize(name)
+        self._artist_tokens[artist_id] = tokens
+        for token in tokens:
+            self._add_token(token, artist_id)
+
+    # Public API
+
+    def add(self, artist: dict):
+        """Add or replace an artist (dict with id, name and optionally slug/avatar_url)."""
+        with self._lock:
+            self._add(artist)
+            self._added[str(artist["id"])] = artist
+
+    def add_if_missing(self, artist: dict):
+        with self._lock:
+            if str(artist["id"]) not in self._artists:
+                self._add(artist)
+                self._added[str(artist["id"])] = artist
+
+    def remove(self, artist_id: str):
+        with self._lock:
+            self._remove(str(artist_id))
+            self._added.pop(str(artist_id), None)
+
+    def replace_all(self, artists: list):
+        """Swap in a freshly built index (used by the periodic rebuild)."""
+        fresh = ArtistIndex()
+        fresh._bulk = True
+        for artist in artists:
+            fresh._add(artist)
+        fresh._sorted_tokens.sort()
+        fresh._bulk = False
+        with self._lock:
+            # Artists added while the rows were loading may be missing from them
+            for artist_id, artist in self._added.items():
+                if artist_id not in fresh._artists:
+                    fresh._add(artist)
+            self._added = {}
+            self._artists = fresh._artists
+            self._normalized = fresh._normalized
+            self._artist_tokens = fresh._artist_tokens
+            self._token_artists = fresh._token_artists
+            self._sorted_tokens = fresh._sorted_tokens
+            self._deletes = fresh._deletes
+            self._results.clear()
+            self.ready = True
+
+    def _term_tokens(self, term: str) -> dict:
+        """{index token: score} of the tokens matching a query term (prefix or one typo), best first."""
+        start = bisect.bisect_left(self._sorted_tokens, term)
+        prefixed = []
+        for token in self._sorted_tokens[start:start + PREFIX_EXPANSION_LIMIT]:
+            if not token.startswith(term):
+                break
+            prefixed.append(token)
+        # Exact token first, then shorter (closer) prefixes; same scores as _token_score
+        prefixed.sort(key=len)
+        length = len(term)
+        matches = {token: SCORE_EXACT if token == term else SCORE_PREFIX - 0.5 * (1 - length / len(token))
+                   for token in prefixed}
+
+        if len(term) >= TYPO_MIN_LENGTH:
+            typos = set(self._deletes.get(term, ()))
+            for variant in _deletions(term):
+                if variant in self._token_artists:
+                    typos.add(variant)
+                typos.update(self._deletes.get(variant, ()))
+            for token in typos:
+                if token not in matches and _within_one_edit(term, token):
+                    matches[token] = SCORE_TYPO
+        return matches
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> list:
+        """
+        Artists matching every term of the query (the last term may be
+        incomplete), best matches first.
+        """
+        normalized_query = normalize(query)
+        terms = list(dict.fromkeys(normalized_query.split()))
+        if not terms:
+            return []
+
+        key = (normalized_query, limit, offset)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return cached
+
+            term_tokens = [self._term_tokens(term) for term in terms]
+            # Walk the most selective term's tokens (best first) and keep the
+            # artists that also match every other term
+            pivot = min(range(len(terms)), key=lambda position: (
+                len(term_tokens[position]), terms[position] not in term_tokens[position]))
+            # Prefix expansions cut at PREFIX_EXPANSION_LIMIT are checked token by token
+            others = [(terms[position], tokens.keys(), len(tokens) >= PREFIX_EXPANSION_LIMIT)
+                      for position, tokens in enumerate(term_tokens) if position != pivot]
+
+            candidates = []
+            seen = set()
+            for token in term_tokens[pivot]:
+                for artist_id in self._token_artists[token] - seen:
+                    seen.add(artist_id)
+                    artist_tokens = self._artist_tokens[artist_id]
+                    if all(not matching.isdisjoint(artist_tokens)
+                           or (truncated and any(token.startswith(term) for token in artist_tokens))
+                           for term, matching, truncated in others):
+                        candidates.append(artist_id)
+                # Broad query (1-2 letters): only rank the artists of the best tokens
+                if len(candidates) >= MAX_CANDIDATES or len(seen) >= MAX_SCANNED:
+                    break
+
+            ranked = []
+            for artist_id in candidates:
+                artist_tokens = self._artist_tokens[artist_id]
+                score = sum(max(scores[token] if token in scores else _token_score(term, token)
+                                    for token in artist_tokens)
+                            for term, scores in zip(terms, term_tokens))
+                name = self._normalized[artist_id]
+                if name == normalized_query:
+                    score += SCORE_FULL_NAME
+                elif name.startswith(normalized_query):
+                    score += SCORE_NAME_PREFIX
+                ranked.append((-score, len(name), name, artist_id))
+
+            results = [
+                {**self._artists[artist_id], "score": round(-negative_score, 3)}
+                for negative_score, _, _, artist_id in heapq.nsmallest(offset + limit, ranked)[offset:]
+            ]
+            self._results[key] = results
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+            return results
+
+
+index = ArtistIndex()
+
+_task = None
+
+
+def load_artists() -> list:
+    """Every artist row, fetched in pages (keyset by id)."""
+    artists = []
+    after_id = None
+    while True:
+        query = supabase.table("artists").select("*")
+        if after_id:
+            query = query.gt("id", after_id)
+        rows = query.order("id").limit(LOAD_PAGE_SIZE).execute().data or []
+        artists.extend(rows)
+        if len(rows) < LOAD_PAGE_SIZE:
+            return artists
+        after_id = rows[-1]["id"]
+
+
+def rebuild():
+    artists = load_artists()
+    index.replace_all(artists)
+    print(f"[ARTIST SEARCH] Index built with {len(index)} artists")
+
+
+def add_artist(artist: dict):
+    """Add a newly created artist to the index (no-op if it is already there)."""
+    index.add_if_missing(artist)
+
+
+def search_database(query: str, limit: int = 20, offset: int = 0) -> list:
+    """Fallback used before the index is ready: ilike on the name."""
+    response = (
+        supabase.table("artists")
+        .select("*")
+        .ilike("name", f"%{query}%")
+        .order("name")
+        .range(offset, offset + limit - 1)
+        .execute()
+    )
+    return [
+        {"id": row["id"], "name": row.get("name"), "slug": row.get("slug"), "avatar_url": row.get("avatar_url")}
+        for row in response.data or []
+    ]
+
+
+async def _run():
+    while True:
+        try:
+            await asyncio.to_thread(rebuild)
+        except Exception as e:
+            print(f"[ARTIST SEARCH] Error building index: {e}")
+        await asyncio.sleep(ARTIST_INDEX_REFRESH_SECONDS)
+
+
+def start_background_tasks():
+    """Build the index in the background and rebuild it periodically."""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop_background_tasks():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
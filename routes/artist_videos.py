@@ -1,6 +1,23 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
+from datetime import datetime, timezone
+from supabase import create_client
+from dotenv import load_dotenv
+import asyncio
+import os
+from . import auth_utils, youtube_metadata
+
+load_dotenv()
+
+# Initialize Supabase client
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 router = APIRouter(prefix="/artist-videos", tags=["artist-videos"])
 
@@ -8,25 +25,73 @@ class AddVideoRequest(BaseModel):
     album_id: str
     video_id: str
     title: Optional[str] = None
-    
+
 @router.post("/add")
-async def add_video(request: AddVideoRequest):
+async def add_video(
+    request: AddVideoRequest,
+    user_id: str = Depends(auth_utils.get_current_user_id)
+):
     """
     Add a YouTube video to an album.
+    video_id may be the 11-character id or a YouTube URL. Without a title, the
+    title and thumbnail are filled in from oEmbed in the background
+    (metadata_status "pending" until then).
     """
     try:
-        if not request.album_id or not request.video_id:
-            raise HTTPException(status_code=400, detail="album_id and video_id are required")
-        
-        # TODO: Implement Supabase integration to save video reference
-        # For now, return mock success
+        video_id = request.video_id.strip()
+        if not youtube_metadata.is_valid_video_id(video_id):
+            video_id = youtube_metadata.extract_video_id(video_id)
+        if not request.album_id or not video_id:
+            raise HTTPException(status_code=400, detail="album_id and a valid YouTube video_id are required")
+
+        album_response = await asyncio.to_thread(
+            lambda: supabase.table("albums").select("id, artist_id, title, is_private").eq("id", request.album_id).limit(1).execute()
+        )
+        album = album_response.data[0] if album_response.data else None
+        if not album:
+            raise HTTPException(status_code=404, detail="Album not found")
+        if album.get("artist_id") != user_id:
+            raise HTTPException(status_code=403, detail="You don't have permission to add videos to this album")
+
+        # The same video twice on an album returns the existing record
+        existing = await asyncio.to_thread(
+            lambda: supabase.table("artist_videos").select("*")
+            .eq("album_id", request.album_id).eq("video_id", video_id).limit(1).execute()
+        )
+        if existing.data:
+            video = existing.data[0]
+            message = "Video already added"
+        else:
+            title = (request.title or "").strip()
+            video_data = {
+                "artist_id": user_id,
+                "album_id": request.album_id,
+                "video_url": youtube_metadata.video_url(video_id),
+                "video_id": video_id,
+                "title": title or album.get("title"),  # Album title until oEmbed answers
+                "thumbnail": youtube_metadata.default_thumbnail(video_id),
+                "is_public": not album.get("is_private"),
+                "metadata_status": youtube_metadata.STATUS_RESOLVED if title else youtube_metadata.STATUS_PENDING,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            response = await asyncio.to_thread(lambda: supabase.table("artist_videos").insert(video_data).execute())
+            if not response.data:
+                raise HTTPException(status_code=500, detail="Failed to save video")
+            video = response.data[0]
+            if video.get("metadata_status") == youtube_metadata.STATUS_PENDING:
+                youtube_metadata.enqueue(video.get("id"), video_id)
+            message = "Video added successfully"
+
         return {
             "success": True,
             "album_id": request.album_id,
-            "video_id": request.video_id,
-            "video_url": f"https://youtu.be/{request.video_id}",
-            "message": "Video added successfully"
+            "video_id": video_id,
+            "video_url": video.get("video_url"),
+            "video": video,
+            "message": message
         }
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,30 +1,44 @@
 from fastapi import APIRouter, Query, HTTPException
-from typing import List, Optional
+import asyncio
+import time
+from . import artist_search
 
 router = APIRouter(prefix="/artists", tags=["artists"])
 
 @router.get("/search")
-async def search_artists(q: str = Query(..., min_length=1)):
+async def search_artists(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
     """
-    Search for artists by name.
+    Search for artists by name or slug.
+    Accent/case-insensitive, matches prefixes ("ze ram" -> "Zé Ramalho")
+    and single typos; best matches first.
     """
     try:
-        if not q or len(q) < 1:
+        if not q.strip():
             raise HTTPException(status_code=400, detail="Query parameter 'q' is required")
         
-        # TODO: Implement Supabase search
-        # For now, return mock results
+        started = time.perf_counter()
+        if artist_search.index.ready:
+            results = artist_search.index.search(q, limit, offset)
+            source = "index"
+        else:
+            # Index still loading (right after startup)
+            results = await asyncio.to_thread(artist_search.search_database, q, limit, offset)
+            source = "database"
+        
         return {
             "query": q,
-            "results": [
-                {
-                    "id": "artist-1",
-                    "name": f"Artist matching '{q}'",
-                    "slug": f"artist-{q.lower().replace(' ', '-')}",
-                    "avatar_url": None
-                }
-            ]
+            "results": results,
+            "limit": limit,
+            "offset": offset,
+            "source": source,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,5 @@
 """Authentication endpoints for artist profile creation."""
-from fastapi import APIRouter, HTTPException, Request
-import jwt
+from fastapi import APIRouter, Depends, HTTPException, Request
 from . import auth_utils
 import os
 from dotenv import load_dotenv
@@ -11,29 +10,12 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/init-artist-profile")
-async def init_artist_profile(request: Request):
+async def init_artist_profile(request: Request, user_id: str = Depends(auth_utils.get_current_user_id)):
     """
     Initialize artist profile after signup.
     Called by frontend after user confirms email.
     """
     try:
-        # Get auth token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header:
-            raise HTTPException(status_code=401, detail="Authorization header required")
-        
-        # Extract user ID from token
-        token = auth_header.replace("Bearer ", "").strip()
-        try:
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            user_id = decoded.get("sub")
-        except Exception as e:
-            print(f"Error decoding token: {e}")
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Could not extract user from token")
-        
         # Parse request body
         try:
             body = await request.json()
@@ -74,26 +56,12 @@ async def init_artist_profile(request: Request):
 
 
 @router.post("/ensure-artist")
-async def ensure_artist_exists(request: Request):
+async def ensure_artist_exists(request: Request, user_id: str = Depends(auth_utils.get_current_user_id)):
     """
     Ensure artist profile exists (idempotent).
     Used as fallback in various parts of the app.
     """
     try:
-        auth_header = request.headers.get("Authorization")
-        if not auth_header:
-            raise HTTPException(status_code=401, detail="Authorization header required")
-        
-        token = auth_header.replace("Bearer ", "").strip()
-        try:
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            user_id = decoded.get("sub")
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Could not extract user from token")
-        
         try:
             body = await request.json()
         except:
@@ -116,25 +84,11 @@ async def ensure_artist_exists(request: Request):
 
 
 @router.get("/profile")
-async def get_artist_profile(request: Request):
+async def get_artist_profile(user_id: str = Depends(auth_utils.get_current_user_id)):
     """
     Check if user has an artist profile.
     """
     try:
-        auth_header = request.headers.get("Authorization")
-        if not auth_header:
-            raise HTTPException(status_code=401, detail="Authorization header required")
-        
-        token = auth_header.replace("Bearer ", "").strip()
-        try:
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            user_id = decoded.get("sub")
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Could not extract user from token")
-        
         from supabase import create_client
         SUPABASE_URL = os.getenv("SUPABASE_URL")
         SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
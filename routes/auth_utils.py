@@ -1,7 +1,14 @@
 """Utility functions for authentication and artist management."""
+from fastapi import Depends, Header, HTTPException
 from supabase import create_client
+from collections import OrderedDict
+from typing import Optional
 import os
+import threading
+import time
+import jwt
 from dotenv import load_dotenv
+from . import artist_search
 
 load_dotenv()
 
@@ -13,11 +20,146 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
 
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
+# Legacy (HS256) projects sign access tokens with the project's JWT secret.
+# Without it, tokens are verified against the project's JWKS (asymmetric keys).
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+
+# How long fetched signing keys are trusted before the JWKS is fetched again
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+
+# Verified tokens kept in memory (token -> claims, until the token expires)
+TOKEN_CACHE_SIZE = 10000
+
+# Seconds of clock drift accepted on exp/iat/nbf
+JWT_LEEWAY_SECONDS = 30
+
+# Artists known to exist (user id -> expiry), skips the upsert on repeat calls.
+# Artist rows are never deleted by the API, so expiry is the only invalidation:
+# a row removed by hand is recreated at most KNOWN_ARTIST_TTL_SECONDS later
+KNOWN_ARTIST_TTL_SECONDS = int(os.getenv("KNOWN_ARTIST_TTL_SECONDS", "3600"))
+KNOWN_ARTIST_CACHE_SIZE = 50000
+
+_known_artists = {}
+_known_artists_lock = threading.Lock()
+
+_jwks_client = None
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+if not SUPABASE_JWT_SECRET:
+    print(f"[AUTH] SUPABASE_JWT_SECRET not set, verifying tokens with JWKS from {SUPABASE_JWKS_URL}")
+
+
+def _get_jwks_client() -> jwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_jwk_set=True, lifespan=JWKS_REFRESH_SECONDS)
+    return _jwks_client
+
+
+def _decode(token: str) -> dict:
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise jwt.InvalidTokenError("HS256 token but SUPABASE_JWT_SECRET is not set")
+        key = SUPABASE_JWT_SECRET
+    elif algorithm in ("RS256", "ES256"):
+        key = _get_jwks_client().get_signing_key_from_jwt(token).key
+    else:
+        raise jwt.InvalidTokenError(f"Unsupported token algorithm: {algorithm}")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=JWT_AUDIENCE,
+        leeway=JWT_LEEWAY_SECONDS,
+        options={"require": ["exp", "sub"]},
+    )
+
+
+def verify_token(token: str) -> dict:
+    """
+    Verify a Supabase access token and return its claims.
+    Verified tokens are cached until they expire, so repeated requests with
+    the same token skip the signature check.
+
+    Raises:
+        jwt.InvalidTokenError: bad signature, expired, wrong audience...
+    """
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+        if cached is not None:
+            claims, expires_at = cached
+            if expires_at > now:
+                _token_cache.move_to_end(token)
+                return claims
+            del _token_cache[token]
+
+    try:
+        claims = _decode(token)
+    except jwt.PyJWKClientError as e:
+        raise jwt.InvalidTokenError(f"Could not get signing key: {e}") from e
+
+    with _token_cache_lock:
+        _token_cache[token] = (claims, claims["exp"] + JWT_LEEWAY_SECONDS)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return claims
+
+
+def get_current_claims(authorization: Optional[str] = Header(None)) -> dict:
+    """
+    FastAPI dependency: verified claims of the request's bearer token.
+    Sync on purpose: a JWKS fetch (cache miss) runs in the threadpool.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+
+    token = authorization.replace("Bearer ", "").strip()
+    if not token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    try:
+        return verify_token(token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError as e:
+        print(f"[AUTH] Invalid token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def get_current_user_id(claims: dict = Depends(get_current_claims)) -> str:
+    """FastAPI dependency: user id (sub) of the request's verified bearer token."""
+    return claims["sub"]
+
+
+def _is_known_artist(user_id: str) -> bool:
+    with _known_artists_lock:
+        expires_at = _known_artists.get(user_id)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del _known_artists[user_id]
+            return False
+        return True
+
+
+def _remember_artist(user_id: str):
+    with _known_artists_lock:
+        _known_artists.pop(user_id, None)
+        _known_artists[user_id] = time.monotonic() + KNOWN_ARTIST_TTL_SECONDS
+        while len(_known_artists) > KNOWN_ARTIST_CACHE_SIZE:
+            _known_artists.pop(next(iter(_known_artists)))
+
 
 def ensure_artist_exists(user_id: str, artist_name: str = None) -> bool:
     """
     Ensure an artist record exists for the given user_id.
-    Creates one if it doesn't exist.
+    Creates one if it doesn't exist (an existing artist is left untouched).
+    Artists seen recently are cached, so repeat calls skip the database.
     
     Args:
         user_id: The user ID from Supabase Auth
@@ -26,33 +168,20 @@ def ensure_artist_exists(user_id: str, artist_name: str = None) -> bool:
     Returns:
         bool: True if artist exists or was created successfully, False otherwise
     """
+    if _is_known_artist(user_id):
+        return True
+
     try:
-        # Check if artist already exists
-        print(f"[AUTH] Checking if artist exists: {user_id}")
-        artist_check = supabase.table("artists").select("id").eq("id", user_id).execute()
-        
-        if artist_check.data and len(artist_check.data) > 0:
-            print(f"[AUTH] Artist already exists: {user_id}")
-            return True
-        
-        # Artist doesn't exist, create one
-        print(f"[AUTH] Creating new artist record for: {user_id}")
-        artist_data = {
-            "id": user_id,
-            "name": artist_name or "Artista",
-        }
-        print(f"[AUTH] Artist data to insert: {artist_data}")
-        
-        artist_response = supabase.table("artists").insert(artist_data).execute()
-        print(f"[AUTH] Artist response: {artist_response}")
-        print(f"[AUTH] Artist response data: {artist_response.data if hasattr(artist_response, 'data') else 'No data'}")
-        
-        if artist_response.data and len(artist_response.data) > 0:
-            print(f"[AUTH] Artist created successfully: {user_id}")
-            return True
-        else:
-            print(f"[AUTH] Failed to create artist: {artist_response}")
-            return False
+        # Single idempotent insert: no check-then-insert race between requests
+        print(f"[AUTH] Ensuring artist exists: {user_id}")
+        supabase.table("artists").upsert(
+            {"id": user_id, "name": artist_name or "Artista"},
+            on_conflict="id",
+            ignore_duplicates=True,
+        ).execute()
+        _remember_artist(user_id)
+        artist_search.add_artist({"id": user_id, "name": artist_name or "Artista"})
+        return True
             
     except Exception as e:
         print(f"[AUTH] Error ensuring artist exists: {e}")
@@ -0,0 +1,518 @@
+"""
+In-memory full-text index of the catalog (albums and songs) for GET /search.
+Album titles, song titles, artist names, genres and album tags are folded with
+text_utils.normalize, Portuguese stopwords are dropped and plurals reduced to
+the singular ("canções" -> "cancao"), then stored in an inverted index
+(term -> {document: weighted term frequency}). Queries are ranked with BM25,
+the last query term also matches as a prefix (typeahead), and facet counts
+(type, genre, year) are computed over every match.
+
+Every album is indexed with its visibility fields; only public, published,
+non-deleted albums and their songs are returned, so publishing or trashing an
+album only flips its state. The upload, delete, purge and publish paths update
+the index right away; the index is also rebuilt from the database at startup
+and every CATALOG_INDEX_REFRESH_SECONDS (changes made by other processes).
+"""
+from supabase import create_client
+import asyncio
+import bisect
+import heapq
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from operator import itemgetter
+from dotenv import load_dotenv
+from .text_utils import normalize, tokenize
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+CATALOG_INDEX_REFRESH_SECONDS = int(os.getenv("CATALOG_INDEX_REFRESH_SECONDS", "900"))
+
+# Rows per page when loading the albums and songs tables
+LOAD_PAGE_SIZE = 1000
+
+ALBUM_COLUMNS = (
+    "id, title, slug, artist_id, artist_name, genre, tags, cover_url, release_year, "
+    "is_private, is_scheduled, is_deleted, deleted_at, deletion_status"
+)
+SONG_COLUMNS = "id, title, album_id, artist_name, album_name, genre, cover_url, track_number, release_year"
+
+# Album fields that decide whether it (and its songs) can be returned
+VISIBILITY_FIELDS = ("is_private", "is_scheduled", "is_deleted", "deleted_at", "deletion_status")
+
+# Term frequency weight of each field (BM25F-style: a title hit counts 3x a genre hit)
+ALBUM_FIELDS = {"title": 3.0, "artist_name": 2.0, "tags": 1.5, "genre": 1.0}
+SONG_FIELDS = {"title": 3.0, "artist_name": 2.0, "album_name": 1.0, "genre": 1.0}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# The last query term also matches index terms starting with it, at this weight
+PREFIX_WEIGHT = 0.6
+PREFIX_EXPANSION_LIMIT = 50
+PREFIX_MIN_LENGTH = 2
+
+# Values returned per facet
+FACET_SIZE = 20
+
+# Analyzed field values kept (artist names, album names and genres repeat across songs)
+ANALYZE_CACHE_SIZE = 65536
+
+# Recent results (same query, filters and page); dropped on any index change
+RESULT_CACHE_SIZE = 1024
+
+STOPWORDS = frozenset("""
+    a o as os e de da do das dos em na no nas nos num numa um uma uns umas
+    ao aos pra pro pras pros para por pelo pela pelos pelas com sem que se ou
+    the of and
+""".split())
+
+
+def stem(token: str) -> str:
+    """Light Portuguese plural reduction: "cancoes" -> "cancao", "amores" -> "amor", "musicas" -> "musica"."""
+    if len(token) <= 3 or not token.endswith("s") or token.isdigit():
+        return token
+    if token.endswith(("oes", "aes")):
+        return token[:-3] + "ao"
+    if token.endswith("ais"):
+        return token[:-3] + "al"
+    if token.endswith("eis") and len(token) > 4:
+        return token[:-3] + "el"
+    if token.endswith("ns"):
+        return token[:-2] + "m"
+    if token.endswith(("res", "zes")) and len(token) > 4:
+        return token[:-2]
+    if token.endswith(("ss", "us", "is")):
+        return token
+    return token[:-1]
+
+
+@lru_cache(maxsize=ANALYZE_CACHE_SIZE)
+def analyze(text: str) -> tuple:
+    """Index terms of a text (normalized, without stopwords, stemmed)."""
+    return tuple(stem(token) for token in tokenize(text) if token not in STOPWORDS)
+
+
+def _field_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value if item)
+    return str(value) if value else ""
+
+
+def _is_visible(album: dict) -> bool:
+    return not (
+        album.get("is_private")
+        or album.get("is_scheduled")
+        or album.get("is_deleted")
+        or album.get("deleted_at")
+        or album.get("deletion_status")
+    )
+
+
+def _year(row: dict):
+    year = row.get("release_year")
+    if year in (None, ""):
+        return None
+    try:
+        return int(str(year)[:4])
+    except ValueError:
+        return None
+
+
+class CatalogIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}             # "album:<id>" / "song:<id>" -> result fields
+        self._doc_terms = {}        # doc key -> its terms
+        self._doc_length = {}       # doc key -> weighted length
+        self._doc_album = {}        # doc key -> album id
+        self._norms = {}            # doc key -> BM25 length normalization
+        self._total_length = 0.0
+        self._average_length = 1.0  # as of the last rebuild (norms of added docs use it too)
+        self._postings = {}         # term -> {doc key: weighted frequency}
+        self._sorted_terms = []     # every term, sorted (prefix lookups)
+        self._albums = {}           # album id -> visibility fields
+        self._hidden = set()        # album ids that cannot be returned (private, scheduled, deleted)
+        self._album_docs = {}       # album id -> doc keys of the album and its songs
+        self._bulk = False          # building: append terms, sort once at the end
+        self._log = None            # changes made while a rebuild is loading (replayed on swap)
+        self._results = OrderedDict()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    # Index maintenance (callers hold the lock)
+
+    def _add_doc(self, key: str, album_id: str, doc: dict, row: dict, fields: dict):
+        self._remove_doc(key)
+        terms = {}
+        for field, weight in fields.items():
+            value = row.get(field)
+            if value:
+                for term in analyze(_field_text(value)):
+                    terms[term] = terms.get(term, 0.0) + weight
+        self._docs[key] = doc
+        self._doc_terms[key] = tuple(terms)
+        length = sum(terms.values())
+        self._doc_length[key] = length
+        self._doc_album[key] = album_id
+        self._total_length += length
+        if not self._bulk:
+            self._norms[key] = self._norm(length)
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._bulk:
+                    self._sorted_terms.append(term)
+                else:
+                    bisect.insort(self._sorted_terms, term)
+            postings[key] = frequency
+        self._album_docs.setdefault(album_id, set()).add(key)
+
+    def _remove_doc(self, key: str):
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        doc = self._docs.pop(key)
+        self._total_length -= self._doc_length.pop(key)
+        self._doc_album.pop(key)
+        self._norms.pop(key, None)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                position = bisect.bisect_left(self._sorted_terms, term)
+                if position < len(self._sorted_terms) and self._sorted_terms[position] == term:
+                    del self._sorted_terms[position]
+        docs = self._album_docs.get(doc["album_id"])
+        if docs is not None:
+            docs.discard(key)
+
+    def _norm(self, length: float) -> float:
+        return BM25_K1 * (1 - BM25_B + BM25_B * length / self._average_length)
+
+    def _set_state(self, album_id: str, state: dict):
+        self._albums[album_id] = state
+        if _is_visible(state):
+            self._hidden.discard(album_id)
+        else:
+            self._hidden.add(album_id)
+
+    def _add_album(self, album: dict):
+        album_id = str(album["id"])
+        self._set_state(album_id, {field: album.get(field) for field in VISIBILITY_FIELDS})
+        self._add_doc(f"album:{album_id}", album_id, {
+            "type": "album",
+            "id": album_id,
+            "album_id": album_id,
+            "title": album.get("title"),
+            "slug": album.get("slug"),
+            "artist_id": album.get("artist_id"),
+            "artist_name": album.get("artist_name"),
+            "genre": album.get("genre"),
+            "release_year": _year(album),
+            "cover_url": album.get("cover_url"),
+        }, album, ALBUM_FIELDS)
+
+    def _add_song(self, song: dict):
+        album_id = str(song.get("album_id"))
+        self._add_doc(f"song:{song['id']}", album_id, {
+            "type": "song",
+            "id": str(song["id"]),
+            "album_id": album_id,
+            "title": song.get("title"),
+            "album_name": song.get("album_name"),
+            "artist_name": song.get("artist_name"),
+            "genre": song.get("genre"),
+            "release_year": _year(song),
+            "track_number": song.get("track_number"),
+            "cover_url": song.get("cover_url"),
+        }, song, SONG_FIELDS)
+
+    def _remove_album(self, album_id: str):
+        for key in list(self._album_docs.pop(album_id, ())):
+            self._remove_doc(key)
+        self._albums.pop(album_id, None)
+        self._hidden.discard(album_id)
+
+    def _apply(self, method: str, *args):
+        getattr(self, method)(*args)
+        if self._log is not None:
+            self._log.append((method, args))
+        self._results.clear()
+
+    def _update_album(self, album: dict):
+        album_id = str(album["id"])
+        state = self._albums.get(album_id)
+        if state is not None:
+            self._set_state(album_id, {**state, **{field: album[field] for field in VISIBILITY_FIELDS if field in album}})
+
+    def _add_album_with_songs(self, album: dict, songs: list):
+        self._remove_album(str(album["id"]))
+        self._add_album(album)
+        for song in songs:
+            self._add_song({**song, "album_id": album["id"]})
+
+    # Public API
+
+    def add_album(self, album: dict, songs: list = ()):
+        """Add or replace an album and its songs (rows as stored in the database)."""
+        with self._lock:
+            self._apply("_add_album_with_songs", album, list(songs))
+
+    def update_album(self, album: dict):
+        """Update the visibility fields present in `album` (e.g. a published or trashed album)."""
+        with self._lock:
+            self._apply("_update_album", album)
+
+    def remove_album(self, album_id: str):
+        with self._lock:
+            self._apply("_remove_album", str(album_id))
+
+    def begin_rebuild(self):
+        """Start recording changes so they survive the swap in replace_all."""
+        with self._lock:
+            self._log = []
+
+    def replace_all(self, albums: list, songs: list):
+        """Swap in a freshly built index (used by the periodic rebuild)."""
+        fresh = CatalogIndex()
+        fresh._bulk = True
+        for album in albums:
+            fresh._add_album(album)
+        for song in songs:
+            if str(song.get("album_id")) in fresh._albums:
+                fresh._add_song(song)
+        fresh._sorted_terms.sort()
+        fresh._average_length = fresh._total_length / len(fresh._docs) if fresh._docs else 1.0
+        fresh._norms = {key: fresh._norm(length) for key, length in fresh._doc_length.items()}
+        fresh._bulk = False
+        with self._lock:
+            # Uploads, publications and deletions made while the rows were loading
+            for method, args in self._log or ():
+                getattr(fresh, method)(*args)
+            self._log = None
+            for name in ("_docs", "_doc_terms", "_doc_length", "_doc_album", "_norms", "_total_length",
+                         "_average_length", "_postings", "_sorted_terms", "_albums", "_hidden", "_album_docs"):
+                setattr(self, name, getattr(fresh, name))
+            self._results.clear()
+            self.ready = True
+
+    def _query_terms(self, query: str):
+        """
+        ({index term: weight}, [set of terms per query token]). A document
+        matches a token if it has any term of its set; the last token also
+        matches index terms starting with it.
+        """
+        tokens = [token for token in tokenize(query) if token not in STOPWORDS]
+        terms = {stem(token): 1.0 for token in tokens}
+        groups = [{stem(token)} for token in tokens]
+        if tokens and len(tokens[-1]) >= PREFIX_MIN_LENGTH and not query[-1:].isspace():
+            last = tokens[-1]
+            start = bisect.bisect_left(self._sorted_terms, last)
+            for term in self._sorted_terms[start:start + PREFIX_EXPANSION_LIMIT]:
+                if not term.startswith(last):
+                    break
+                terms.setdefault(term, PREFIX_WEIGHT)
+                groups[-1].add(term)
+        return terms, groups
+
+    def search(self, query: str, doc_type: str = None, genre: str = None, year: int = None,
+               limit: int = 20, offset: int = 0) -> dict:
+        """
+        Ranked documents matching the query. Documents must match every query
+        term (the last one may be a prefix); if none do, documents matching
+        any term are returned ("match": "any").
+        """
+        genre_key = normalize(genre or "")
+        key = (normalize(query), query[-1:].isspace(), doc_type, genre_key, year, limit, offset)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return cached
+
+            terms, groups = self._query_terms(query)
+            total_docs = len(self._docs) or 1
+            hidden = self._hidden
+            doc_album = self._doc_album
+            norms = self._norms
+
+            scores = {}
+            for term, weight in terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                factor = weight * idf * (BM25_K1 + 1)
+                for doc_key, frequency in postings.items():
+                    if doc_album[doc_key] in hidden:
+                        continue
+                    scores[doc_key] = scores.get(doc_key, 0.0) + factor * frequency / (frequency + norms[doc_key])
+
+            match = "all"
+            hits = scores
+            if len(groups) > 1:
+                # Documents with a term of every group (set operations on the postings)
+                matching = None
+                for group in sorted(groups, key=lambda group: sum(len(self._postings.get(term, ())) for term in group)):
+                    group_docs = set().union(*(self._postings.get(term, {}).keys() for term in group))
+                    matching = group_docs if matching is None else matching & group_docs
+                hits = [doc_key for doc_key in matching if doc_key in scores]
+                if not hits:
+                    hits, match = scores, "any"
+
+            # Facets count every match; the filters only narrow the results
+            matched_docs = list(map(self._docs.__getitem__, hits))
+            facets = {
+                field: Counter(value for value in map(itemgetter(field), matched_docs) if value)
+                for field in ("type", "genre", "release_year")
+            }
+            filtered = hits
+            if doc_type or genre_key or year:
+                genre_keys = {}
+                filtered = [
+                    doc_key for doc_key, doc in zip(hits, matched_docs)
+                    if (not doc_type or doc["type"] == doc_type)
+                    and (not genre_key or genre_keys.setdefault(doc["genre"], normalize(doc["genre"] or "")) == genre_key)
+                    and (not year or doc["release_year"] == year)
+                ]
+
+            page = heapq.nlargest(offset + limit, filtered, key=scores.__getitem__)[offset:]
+            results = {
+                "total": len(filtered),
+                "match": match,
+                "results": [{**self._docs[doc_key], "score": round(scores[doc_key], 4)} for doc_key in page],
+                "facets": {
+                    name: [{"value": value, "count": count} for value, count in counter.most_common(FACET_SIZE)]
+                    for name, counter in facets.items()
+                },
+            }
+            self._results[key] = results
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+            return results
+
+
+index = CatalogIndex()
+
+_task = None
+
+
+def _load_table(table: str, columns: str) -> list:
+    """Every row of a table, fetched in pages (keyset by id)."""
+    rows = []
+    after_id = None
+    while True:
+        query = supabase.table(table).select(columns)
+        if after_id:
+            query = query.gt("id", after_id)
+        page = query.order("id").limit(LOAD_PAGE_SIZE).execute().data or []
+        rows.extend(page)
+        if len(page) < LOAD_PAGE_SIZE:
+            return rows
+        after_id = page[-1]["id"]
+
+
+def rebuild():
+    index.begin_rebuild()
+    albums = _load_table("albums", ALBUM_COLUMNS)
+    songs = _load_table("songs", SONG_COLUMNS)
+    index.replace_all(albums, songs)
+    print(f"[CATALOG SEARCH] Index built with {len(albums)} albums and {len(songs)} songs")
+
+
+def add_album(album: dict, songs: list = ()):
+    """Index a newly uploaded album and its songs (hidden until public and published)."""
+    index.add_album(album, songs)
+
+
+def update_albums(albums: list):
+    """Apply visibility changes (publication, trash) returned by an update."""
+    for album in albums:
+        index.update_album(album)
+
+
+def remove_albums(album_ids: list):
+    for album_id in album_ids:
+        index.remove_album(album_id)
+
+
+def search_database(query: str, limit: int = 20, offset: int = 0) -> dict:
+    """Fallback used before the index is ready: ilike on public album titles (no songs or facets)."""
+    response = (
+        supabase.table("albums")
+        .select(ALBUM_COLUMNS, count="exact")
+        .ilike("title", f"%{query}%")
+        .eq("is_private", False)
+        .eq("is_scheduled", False)
+        .or_("is_deleted.is.null,is_deleted.eq.false")
+        .is_("deleted_at", "null")
+        .is_("deletion_status", "null")
+        .order("title")
+        .range(offset, offset + limit - 1)
+        .execute()
+    )
+    return {
+        "total": response.count or 0,
+        "match": "all",
+        "results": [
+            {
+                "type": "album",
+                "id": row["id"],
+                "album_id": row["id"],
+                "title": row.get("title"),
+                "slug": row.get("slug"),
+                "artist_id": row.get("artist_id"),
+                "artist_name": row.get("artist_name"),
+                "genre": row.get("genre"),
+                "release_year": _year(row),
+                "cover_url": row.get("cover_url"),
+            }
+            for row in response.data or []
+        ],
+        "facets": {},
+    }
+
+
+async def _run():
+    while True:
+        try:
+            await asyncio.to_thread(rebuild)
+        except Exception as e:
+            print(f"[CATALOG SEARCH] Error building index: {e}")
+        await asyncio.sleep(CATALOG_INDEX_REFRESH_SECONDS)
+
+
+def start_background_tasks():
+    """Build the index in the background and rebuild it periodically."""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop_background_tasks():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
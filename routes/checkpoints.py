@@ -0,0 +1,98 @@
+"""
+Durable checkpoints for long-running maintenance jobs.
+Cursors are stored as JSON in a local SQLite database so a job can stop after
+a time/item budget (or crash) and resume where it left off. The same cursor
+can be handed to clients as an opaque continuation token.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "/tmp/oucaaqui_checkpoints.db")
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CHECKPOINT_DB_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    return _conn
+
+
+def load_checkpoint(name: str) -> Optional[dict]:
+    """Last saved state of a job, or None."""
+    with _lock:
+        row = _connection().execute("SELECT state FROM checkpoints WHERE name = ?", (name,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_checkpoint(name: str, state: dict):
+    with _lock:
+        _connection().execute(
+            "INSERT INTO checkpoints (name, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (name, json.dumps(state), time.time()),
+        )
+
+
+def clear_checkpoint(name: str):
+    with _lock:
+        _connection().execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+
+
+def encode_token(state: dict) -> str:
+    """Opaque continuation token for a cursor."""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode()
+
+
+def decode_token(token: str) -> dict:
+    """Cursor of a continuation token. Raises ValueError if the token is invalid."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid continuation token: {e}")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid continuation token")
+    return state
+
+
+class Budget:
+    """Time and item limits of one run. Both are optional."""
+
+    def __init__(self, time_budget_seconds: Optional[float] = None, max_items: Optional[int] = None):
+        self.time_budget_seconds = time_budget_seconds
+        self.max_items = max_items
+        self.started = time.monotonic()
+        self.items = 0
+
+    def consume(self, items: int = 1):
+        self.items += items
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_items(self) -> Optional[int]:
+        return None if self.max_items is None else max(self.max_items - self.items, 0)
+
+    def exhausted(self, next_step_seconds: float = 0) -> bool:
+        """True once a limit is reached, or the next step (estimated) would pass the time budget."""
+        if self.max_items is not None and self.items >= self.max_items:
+            return True
+        if self.time_budget_seconds is not None and self.elapsed + next_step_seconds >= self.time_budget_seconds:
+            return True
+        return False
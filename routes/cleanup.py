@@ -5,14 +5,19 @@ This module handles:
 2. Storage file cleanup for permanently deleted albums
 """
 
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Query
 from typing import Optional
 from supabase import create_client
 import os
 from dotenv import load_dotenv
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import httpx
+import asyncio
+import time
+from . import album_purge
+from . import checkpoints
+from . import release_scheduler
 
 load_dotenv()
 
@@ -29,14 +34,39 @@ supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 router = APIRouter(prefix="/cleanup", tags=["cleanup"])
 
 
+# Checkpoint (routes.checkpoints) holding the cursor of the auto-delete run
+AUTO_DELETE_CHECKPOINT = "cleanup.auto_delete_old_albums"
+
+
+def _fetch_expired_albums(cursor: dict, limit: int) -> list:
+    """Next page of albums in trash before cursor["cutoff"], in (deleted_at, id) order after the cursor."""
+    query = supabase.table("albums").select("id, artist_id, deleted_at").lt("deleted_at", cursor["cutoff"])
+    if cursor.get("id"):
+        last_deleted_at = cursor["deleted_at"]
+        query = query.or_(
+            f'deleted_at.gt."{last_deleted_at}",and(deleted_at.eq."{last_deleted_at}",id.gt.{cursor["id"]})'
+        )
+    response = query.order("deleted_at").order("id").limit(limit).execute()
+    return response.data or []
+
+
 @router.post("/auto-delete-old-albums")
 async def auto_delete_old_albums(
     secret: Optional[str] = Header(None),
+    time_budget_seconds: Optional[float] = Query(None, gt=0, description="Stop starting new rounds after this many seconds"),
+    max_items: Optional[int] = Query(None, gt=0, description="Process at most this many albums"),
+    continuation_token: Optional[str] = Query(None, description="Resume from the token returned by a previous call"),
+    restart: bool = Query(False, description="Ignore the saved cursor and start over"),
 ):
     """
     Auto-delete albums that have been in trash for more than 30 days.
     This endpoint should be called by a cron job (e.g., GitHub Actions, AWS Lambda).
     
+    With a time or item budget, each call does a bounded amount of work. The
+    cursor of the last processed album is saved after every round, so the next
+    call (or the continuation_token) resumes there. A crash only repeats the
+    round that was running, which is safe to redo.
+    
     Requires: X-Cleanup-Secret header with correct secret key
     """
     try:
@@ -46,143 +76,78 @@ async def auto_delete_old_albums(
         
         print("[CLEANUP] Starting auto-delete of old trashed albums...")
         
-        # Calculate date 30 days ago
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        thirty_days_ago_iso = thirty_days_ago.isoformat()
-        
-        print(f"[CLEANUP] Looking for albums deleted before: {thirty_days_ago_iso}")
-        
-        # Find albums that were deleted more than 30 days ago
-        deleted_albums = supabase.table("albums").select("*").lt("deleted_at", thirty_days_ago_iso).execute()
+        if continuation_token:
+            try:
+                cursor = checkpoints.decode_token(continuation_token)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        elif not restart:
+            cursor = checkpoints.load_checkpoint(AUTO_DELETE_CHECKPOINT)
+        else:
+            cursor = None
         
-        if not deleted_albums.data:
-            print("[CLEANUP] No albums to delete")
-            return {
-                "success": True,
-                "message": "No albums to delete",
-                "deleted_count": 0
-            }
+        if not cursor or not cursor.get("cutoff"):
+            # Calculate date 30 days ago
+            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+            cursor = {"cutoff": thirty_days_ago.isoformat()}
+        else:
+            print(f"[CLEANUP] Resuming after album {cursor.get('id')} (deleted_at {cursor.get('deleted_at')})")
         
-        albums_to_delete = deleted_albums.data
-        print(f"[CLEANUP] Found {len(albums_to_delete)} albums to permanently delete")
+        print(f"[CLEANUP] Looking for albums deleted before: {cursor['cutoff']}")
         
+        budget = checkpoints.Budget(time_budget_seconds, max_items)
         deleted_count = 0
         error_count = 0
+        files_removed = 0
+        failed_ids = []
+        done = False
+        round_seconds = 0.0
         
-        for album in albums_to_delete:
-            try:
-                album_id = album.get("id")
-                user_id = album.get("artist_id")
-                
-                print(f"[CLEANUP] Processing album {album_id} by user {user_id}")
-                
-                # Delete storage files
-                try:
-                    files_to_delete = []
-                    
-                    # Delete cover files by listing the albums directory
-                    print(f"[CLEANUP] Listing cover files in: albums/{user_id}/{album_id}")
-                    albums_dir = f"albums/{user_id}/{album_id}"
-                    try:
-                        list_albums = supabase.storage.from_("musica").list(albums_dir)
-                        if list_albums:
-                            print(f"[CLEANUP] Found {len(list_albums)} items in {albums_dir}")
-                            for item in list_albums:
-                                if hasattr(item, 'name'):
-                                    file_path = f"{albums_dir}/{item.name}"
-                                    files_to_delete.append(file_path)
-                                    print(f"[CLEANUP] Marked cover for deletion: {file_path}")
-                                elif isinstance(item, dict) and 'name' in item:
-                                    file_path = f"{albums_dir}/{item['name']}"
-                                    files_to_delete.append(file_path)
-                                    print(f"[CLEANUP] Marked cover for deletion: {file_path}")
-                        else:
-                            print(f"[CLEANUP] No cover files found in {albums_dir}")
-                    except Exception as e:
-                        print(f"[CLEANUP] Error listing cover files: {e}")
-                    
-                    # Delete song files by listing directory
-                    print(f"[CLEANUP] Listing song files in: songs/{album_id}")
-                    songs_dir = f"songs/{album_id}"
-                    try:
-                        list_response = supabase.storage.from_("musica").list(songs_dir)
-                        if list_response:
-                            print(f"[CLEANUP] Found {len(list_response)} items in {songs_dir}")
-                            for item in list_response:
-                                if hasattr(item, 'name'):
-                                    file_path = f"{songs_dir}/{item.name}"
-                                    files_to_delete.append(file_path)
-                                    print(f"[CLEANUP] Marked song for deletion: {file_path}")
-                                elif isinstance(item, dict) and 'name' in item:
-                                    file_path = f"{songs_dir}/{item['name']}"
-                                    files_to_delete.append(file_path)
-                                    print(f"[CLEANUP] Marked song for deletion: {file_path}")
-                        else:
-                            print(f"[CLEANUP] No files found in {songs_dir}")
-                    except Exception as e:
-                        print(f"[CLEANUP] Error listing song files: {e}")
-                    
-                    # Delete all collected files
-                    if files_to_delete:
-                        print(f"[CLEANUP] Deleting {len(files_to_delete)} files...")
-                        try:
-                            supabase.storage.from_("musica").remove(files_to_delete)
-                            print(f"[CLEANUP] Successfully deleted {len(files_to_delete)} files")
-                        except Exception as e:
-                            print(f"[CLEANUP] Error deleting files: {e}")
-                    else:
-                        print(f"[CLEANUP] No files to delete for album {album_id}")
-                    
-                    # Verify directories are clean
-                    print(f"[CLEANUP] Verifying directories are clean...")
-                    try:
-                        albums_dir = f"albums/{user_id}/{album_id}"
-                        try:
-                            list_albums = supabase.storage.from_("musica").list(albums_dir)
-                            if not list_albums or len(list_albums) == 0:
-                                print(f"[CLEANUP] ✓ Directory cleaned: {albums_dir}")
-                            else:
-                                print(f"[CLEANUP] ⚠ Directory not empty: {albums_dir}")
-                        except Exception as e:
-                            print(f"[CLEANUP] ✓ Directory removed: {albums_dir}")
-                        
-                        songs_dir = f"songs/{album_id}"
-                        try:
-                            list_songs = supabase.storage.from_("musica").list(songs_dir)
-                            if not list_songs or len(list_songs) == 0:
-                                print(f"[CLEANUP] ✓ Directory cleaned: {songs_dir}")
-                            else:
-                                print(f"[CLEANUP] ⚠ Directory not empty: {songs_dir}")
-                        except Exception as e:
-                            print(f"[CLEANUP] ✓ Directory removed: {songs_dir}")
-                    except Exception as e:
-                        print(f"[CLEANUP] Error verifying cleanup: {e}")
-                    
-                    
-                except Exception as e:
-                    print(f"[CLEANUP] Error in storage deletion for album {album_id}: {e}")
-                
-                # Delete songs from database
-                print(f"[CLEANUP] Deleting songs from database")
-                supabase.table("songs").delete().eq("album_id", album_id).execute()
-                
-                # Delete album from database
-                print(f"[CLEANUP] Deleting album from database")
-                supabase.table("albums").delete().eq("id", album_id).execute()
-                
-                print(f"[CLEANUP] Album {album_id} permanently deleted")
-                deleted_count += 1
-                
-            except Exception as e:
-                print(f"[CLEANUP] Error processing album {album.get('id')}: {e}")
-                error_count += 1
-                continue
+        while not budget.exhausted(round_seconds):
+            limit = album_purge.PURGE_ROUND_SIZE
+            if budget.remaining_items() is not None:
+                limit = min(limit, budget.remaining_items())
+            
+            albums = await asyncio.to_thread(_fetch_expired_albums, cursor, limit)
+            if not albums:
+                done = True
+                break
+            print(f"[CLEANUP] Purging round of {len(albums)} albums")
+            
+            # Storage listings run concurrently, objects are removed in large batches
+            # and DB rows are deleted with one in_() filter per round
+            round_started = time.monotonic()
+            result = await album_purge.purge_round(albums, log_prefix="[CLEANUP]")
+            round_seconds = time.monotonic() - round_started
+            
+            deleted_count += len(result["deleted_ids"])
+            error_count += len(result["failed_ids"])
+            files_removed += result["files_removed"]
+            failed_ids.extend(result["failed_ids"])
+            
+            last_album = albums[-1]
+            cursor = {"cutoff": cursor["cutoff"], "deleted_at": last_album["deleted_at"], "id": last_album["id"]}
+            checkpoints.save_checkpoint(AUTO_DELETE_CHECKPOINT, cursor)
+            budget.consume(len(albums))
+            
+            if len(albums) < limit:
+                done = True
+                break
+        
+        if done:
+            # Next run starts over (retrying albums that failed this time)
+            checkpoints.clear_checkpoint(AUTO_DELETE_CHECKPOINT)
         
         response = {
             "success": True,
-            "message": f"Cleanup completed: {deleted_count} albums deleted, {error_count} errors",
+            "message": f"Cleanup {'completed' if done else 'paused'}: {deleted_count} albums deleted, {error_count} errors",
             "deleted_count": deleted_count,
-            "error_count": error_count
+            "error_count": error_count,
+            "files_removed": files_removed,
+            "failed_album_ids": failed_ids,
+            "done": done,
+            "continuation_token": None if done else checkpoints.encode_token(cursor),
+            "elapsed_seconds": round(budget.elapsed, 2)
         }
         
         print(f"[CLEANUP] Cleanup response: {response}")
@@ -203,7 +168,9 @@ async def publish_scheduled_albums(
 ):
     """
     Publish albums that have reached their scheduled publish date.
-    This endpoint should be called by a cron job periodically (e.g., every minute).
+    Releases are normally published on time by the in-process scheduler
+    (routes.release_scheduler); this endpoint remains as a fallback for
+    deployments without it and can be called by a cron job.
     
     Requires: X-Cleanup-Secret header with correct secret key
     """
@@ -214,54 +181,41 @@ async def publish_scheduled_albums(
         
         print("[SCHEDULED] Checking for albums to publish...")
         
-        now = datetime.utcnow()
-        now_iso = now.isoformat()
-        
-        print(f"[SCHEDULED] Current time: {now_iso}")
+        now = datetime.now(timezone.utc)
+        print(f"[SCHEDULED] Current time: {now.isoformat()}")
         
-        # Find albums that are scheduled and their publish time has passed
-        scheduled_albums = supabase.table("albums").select("*").eq("is_scheduled", True).lte("scheduled_publish_at", now_iso).execute()
+        # One conditional UPDATE publishes every due album and returns the affected rows
+        published = await asyncio.to_thread(release_scheduler.publish_due_albums, now)
         
-        if not scheduled_albums.data:
+        if not published:
             print("[SCHEDULED] No albums to publish")
             return {
                 "success": True,
                 "message": "No albums to publish",
-                "published_count": 0
+                "published_count": 0,
+                "albums": []
             }
         
-        albums_to_publish = scheduled_albums.data
-        print(f"[SCHEDULED] Found {len(albums_to_publish)} albums to publish")
-        
-        published_count = 0
-        error_count = 0
-        
-        for album in albums_to_publish:
-            try:
-                album_id = album.get("id")
-                title = album.get("title")
-                
-                print(f"[SCHEDULED] Publishing album: {title} (ID: {album_id})")
-                
-                # Update album: set is_private to false, is_scheduled to false
-                supabase.table("albums").update({
-                    "is_private": False,
-                    "is_scheduled": False
-                }).eq("id", album_id).execute()
-                
-                print(f"[SCHEDULED] Album published: {title}")
-                published_count += 1
-                
-            except Exception as e:
-                print(f"[SCHEDULED] Error publishing album {album.get('id')}: {e}")
-                error_count += 1
-                continue
+        albums_info = []
+        for album in published:
+            lag = release_scheduler.publish_lag_seconds(album)
+            print(f"[SCHEDULED] Album published: {album.get('title')} (ID: {album.get('id')}, lag {lag}s)")
+            albums_info.append({
+                "id": album.get("id"),
+                "title": album.get("title"),
+                "scheduled_publish_at": album.get("scheduled_publish_at"),
+                "published_at": album.get("published_at"),
+                "publish_lag_seconds": lag
+            })
         
+        lags = [info["publish_lag_seconds"] for info in albums_info if info["publish_lag_seconds"] is not None]
         response = {
             "success": True,
-            "message": f"Published {published_count} albums, {error_count} errors",
-            "published_count": published_count,
-            "error_count": error_count
+            "message": f"Published {len(published)} albums",
+            "published_count": len(published),
+            "max_publish_lag_seconds": max(lags) if lags else None,
+            "avg_publish_lag_seconds": round(sum(lags) / len(lags), 3) if lags else None,
+            "albums": albums_info
         }
         
         print(f"[SCHEDULED] Response: {response}")
@@ -276,66 +230,98 @@ async def publish_scheduled_albums(
         raise HTTPException(status_code=500, detail=f"Error during publish: {str(e)}")
 
 
+# Trash age buckets reported by /status, in days: [start, end)
+TRASH_AGE_BUCKETS = [(0, 7), (7, 14), (14, 30), (30, None)]
+
+
+def _count_trashed(older_than: Optional[str] = None, newer_than: Optional[str] = None) -> int:
+    """Count-only query: albums in trash deleted before `older_than` and at/after `newer_than`."""
+    query = supabase.table("albums").select("id", count="exact", head=True).not_.is_("deleted_at", "null")
+    if older_than:
+        query = query.lt("deleted_at", older_than)
+    if newer_than:
+        query = query.gte("deleted_at", newer_than)
+    return query.execute().count or 0
+
+
+def _trashed_albums_page(offset: int, limit: int) -> list:
+    response = (
+        supabase.table("albums")
+        .select("id, deleted_at, title, artist_name")
+        .not_.is_("deleted_at", "null")
+        .order("deleted_at")
+        .order("id")
+        .range(offset, offset + limit - 1)
+        .execute()
+    )
+    return response.data or []
+
+
 @router.get("/status")
-async def cleanup_status():
+async def cleanup_status(
+    include_albums: bool = Query(False, description="Include a page of trashed albums"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
     """
     Check the status of albums in trash.
+    Counts and age buckets come from count-only queries, so the call stays
+    cheap at any trash size. The per-album list (oldest first) is optional
+    and paginated.
     """
     try:
         print("[CLEANUP] Checking trash status...")
         
-        # Get count of trashed albums
-        trashed_albums = supabase.table("albums").select("id, deleted_at, title, artist_name").is_("deleted_at", None, negate=True).execute()
+        now = datetime.utcnow()
         
-        if not trashed_albums.data:
-            return {
-                "success": True,
-                "message": "No albums in trash",
-                "trashed_count": 0,
-                "albums": []
-            }
+        def cutoff(days):
+            return (now - timedelta(days=days)).isoformat() if days is not None else None
         
-        albums = trashed_albums.data
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        # Total + one count per bucket, run concurrently
+        counts = await asyncio.gather(
+            asyncio.to_thread(_count_trashed),
+            *(asyncio.to_thread(_count_trashed, cutoff(start), cutoff(end)) for start, end in TRASH_AGE_BUCKETS)
+        )
+        trashed_count = counts[0]
+        age_buckets = [
+            {"min_days": start, "max_days": end, "count": count}
+            for (start, end), count in zip(TRASH_AGE_BUCKETS, counts[1:])
+        ]
         
-        albums_info = []
-        auto_delete_count = 0
+        response = {
+            "success": True,
+            "trashed_count": trashed_count,
+            "auto_delete_count": age_buckets[-1]["count"],
+            "age_buckets": age_buckets
+        }
         
-        for album in albums:
-            deleted_at = album.get("deleted_at")
-            if deleted_at:
+        if include_albums:
+            albums = await asyncio.to_thread(_trashed_albums_page, offset, limit)
+            thirty_days_ago = now - timedelta(days=30)
+            
+            albums_info = []
+            for album in albums:
+                deleted_at = album.get("deleted_at")
                 try:
-                    # Parse ISO datetime
-                    if isinstance(deleted_at, str):
-                        deleted_date = datetime.fromisoformat(deleted_at.replace('Z', '+00:00'))
-                    else:
-                        deleted_date = deleted_at
-                    
-                    days_in_trash = (datetime.utcnow() - deleted_date.replace(tzinfo=None)).days
-                    will_auto_delete = deleted_date < thirty_days_ago
-                    
-                    if will_auto_delete:
-                        auto_delete_count += 1
-                    
-                    albums_info.append({
-                        "id": album.get("id"),
-                        "title": album.get("title"),
-                        "artist": album.get("artist_name"),
-                        "deleted_at": deleted_at,
-                        "days_in_trash": days_in_trash,
-                        "will_auto_delete": will_auto_delete,
-                        "days_until_delete": max(0, 30 - days_in_trash)
-                    })
+                    deleted_date = datetime.fromisoformat(deleted_at.replace('Z', '+00:00')).replace(tzinfo=None)
                 except Exception as e:
                     print(f"[CLEANUP] Error parsing date for album {album.get('id')}: {e}")
                     continue
+                days_in_trash = (now - deleted_date).days
+                albums_info.append({
+                    "id": album.get("id"),
+                    "title": album.get("title"),
+                    "artist": album.get("artist_name"),
+                    "deleted_at": deleted_at,
+                    "days_in_trash": days_in_trash,
+                    "will_auto_delete": deleted_date < thirty_days_ago,
+                    "days_until_delete": max(0, 30 - days_in_trash)
+                })
+            
+            response["albums"] = albums_info
+            response["next_offset"] = offset + limit if offset + limit < trashed_count else None
         
-        return {
-            "success": True,
-            "trashed_count": len(albums),
-            "auto_delete_count": auto_delete_count,
-            "albums": albums_info
-        }
+        return response
         
     except Exception as e:
         import traceback
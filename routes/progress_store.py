@@ -0,0 +1,472 @@
+"""
+Bounded stores for upload progress.
+This module handles:
+1. Compact update records (__slots__, fixed-size deque per upload)
+2. Per-entry TTL (shorter once an upload is finished)
+3. A global cap on tracked uploads (least recently updated are evicted first)
+4. Pluggable backends: in-process memory (default) or a SQLite database in
+   WAL mode shared by every worker on the host (PROGRESS_BACKEND=sqlite)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Optional
+
+# Fields of update_progress(**details) stored in dedicated slots;
+# anything else goes to ProgressUpdate.extra
+DETAIL_FIELDS = ("stage", "bytes_done", "bytes_total", "bytes_per_second", "eta_seconds")
+
+FINAL_STEPS = ("completed", "concluido")
+
+
+class ProgressUpdate:
+    """One progress update of an upload."""
+
+    __slots__ = ("seq", "progress", "step", "elapsed_seconds", "timestamp") + DETAIL_FIELDS + ("extra",)
+
+    def __init__(self, seq: int, progress: int, step: str, elapsed_seconds: int,
+                 timestamp: float, details: Optional[dict] = None):
+        self.seq = seq
+        self.progress = progress
+        self.step = step
+        self.elapsed_seconds = elapsed_seconds
+        self.timestamp = timestamp
+        details = dict(details) if details else {}
+        for field in DETAIL_FIELDS:
+            setattr(self, field, details.pop(field, None))
+        self.extra = details or None
+
+    @property
+    def is_final(self) -> bool:
+        return self.progress >= 100 or self.step in FINAL_STEPS
+
+    def to_dict(self) -> dict:
+        data = {
+            "progress": self.progress,
+            "step": self.step,
+            "elapsed_seconds": self.elapsed_seconds,
+            "timestamp": datetime.fromtimestamp(self.timestamp, timezone.utc).replace(tzinfo=None).isoformat(),
+        }
+        for field in DETAIL_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class ProgressEntry:
+    """Progress state of one upload."""
+
+    __slots__ = ("start_time", "updated_at", "expires_at", "last_seq", "owner_id", "updates")
+
+    def __init__(self, start_time: float, max_updates: int):
+        self.start_time = start_time
+        self.owner_id = None
+        self.updated_at = start_time
+        self.expires_at = start_time
+        self.last_seq = 0
+        self.updates = deque(maxlen=max_updates)
+
+    @property
+    def latest(self) -> Optional[ProgressUpdate]:
+        return self.updates[-1] if self.updates else None
+
+
+class ProgressBackend(ABC):
+    """
+    Interface of a progress store.
+
+    `shared` backends are visible to other processes; those report updates
+    written by other processes through poll_changes() so local subscribers
+    can be woken up.
+    """
+
+    shared = False
+
+    @abstractmethod
+    def __contains__(self, upload_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def append(self, upload_id: str, progress: int, step: str,
+               details: Optional[dict] = None, now: Optional[float] = None) -> ProgressUpdate:
+        ...
+
+    @abstractmethod
+    def latest(self, upload_id: str) -> Optional[ProgressUpdate]:
+        ...
+
+    @abstractmethod
+    def updates_since(self, upload_id: str, seq: int) -> list:
+        ...
+
+    @abstractmethod
+    def delete(self, upload_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def sweep(self, now: Optional[float] = None) -> int:
+        ...
+
+    @abstractmethod
+    def set_owner(self, upload_id: str, owner_id: str):
+        """Associate an upload with the artist that sent it."""
+
+    @abstractmethod
+    def owner_of(self, upload_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def uploads_of(self, owner_id: str) -> list:
+        """upload_ids currently tracked for an artist."""
+
+    def poll_changes(self) -> list:
+        """upload_ids updated by other processes since the last call."""
+        return []
+
+
+class MemoryProgressStore(ProgressBackend):
+    """
+    Progress of the uploads handled by this process.
+
+    Entries expire `ttl_seconds` after their last update (`completed_ttl_seconds`
+    once the upload is finished) and at most `max_entries` uploads are kept.
+    Each upload keeps only its last `max_updates` updates.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, completed_ttl_seconds: float = 600,
+                 max_entries: int = 1000, max_updates: int = 50):
+        self.ttl_seconds = ttl_seconds
+        self.completed_ttl_seconds = completed_ttl_seconds
+        self.max_entries = max_entries
+        self.max_updates = max_updates
+        self._entries = OrderedDict()
+
+    def __contains__(self, upload_id: str) -> bool:
+        return self.get(upload_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> list:
+        return list(self._entries.keys())
+
+    def get(self, upload_id: str, now: Optional[float] = None) -> Optional[ProgressEntry]:
+        entry = self._entries.get(upload_id)
+        if entry is not None and entry.expires_at <= (now or time.time()):
+            del self._entries[upload_id]
+            return None
+        return entry
+
+    def append(self, upload_id: str, progress: int, step: str,
+               details: Optional[dict] = None, now: Optional[float] = None) -> ProgressUpdate:
+        """Store a new update for upload_id, creating the entry if needed."""
+        now = now or time.time()
+        entry = self.get(upload_id, now)
+        if entry is None:
+            entry = ProgressEntry(now, self.max_updates)
+            self._entries[upload_id] = entry
+            self._evict_overflow()
+        else:
+            self._entries.move_to_end(upload_id)
+
+        entry.last_seq += 1
+        update = ProgressUpdate(entry.last_seq, progress, step, int(now - entry.start_time), now, details)
+        entry.updates.append(update)
+        entry.updated_at = now
+        entry.expires_at = now + (self.completed_ttl_seconds if update.is_final else self.ttl_seconds)
+        return update
+
+    def latest(self, upload_id: str) -> Optional[ProgressUpdate]:
+        entry = self.get(upload_id)
+        return entry.latest if entry else None
+
+    def updates_since(self, upload_id: str, seq: int) -> list:
+        """Updates with a sequence number greater than `seq` that are still kept."""
+        entry = self.get(upload_id)
+        if entry is None or entry.last_seq <= seq:
+            return []
+        missing = entry.last_seq - seq
+        if missing >= len(entry.updates):
+            return list(entry.updates)
+        return [entry.updates[i] for i in range(len(entry.updates) - missing, len(entry.updates))]
+
+    def delete(self, upload_id: str) -> bool:
+        return self._entries.pop(upload_id, None) is not None
+
+    def set_owner(self, upload_id: str, owner_id: str):
+        entry = self.get(upload_id)
+        if entry is not None:
+            entry.owner_id = owner_id
+
+    def owner_of(self, upload_id: str) -> Optional[str]:
+        entry = self.get(upload_id)
+        return entry.owner_id if entry else None
+
+    def uploads_of(self, owner_id: str) -> list:
+        now = time.time()
+        return [
+            upload_id for upload_id, entry in self._entries.items()
+            if entry.owner_id == owner_id and entry.expires_at > now
+        ]
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove expired entries. Returns how many were removed."""
+        now = now or time.time()
+        expired = [upload_id for upload_id, entry in self._entries.items() if entry.expires_at <= now]
+        for upload_id in expired:
+            del self._entries[upload_id]
+        return len(expired)
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteProgressStore(ProgressBackend):
+    """
+    Progress stored in a SQLite database (WAL mode), shared by every worker
+    process on the host. Same limits as MemoryProgressStore.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, completed_ttl_seconds: float = 600,
+                 max_entries: int = 1000, max_updates: int = 50):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.completed_ttl_seconds = completed_ttl_seconds
+        self.max_entries = max_entries
+        self.max_updates = max_updates
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS progress_entries (
+                upload_id TEXT PRIMARY KEY,
+                start_time REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_seq INTEGER NOT NULL,
+                owner_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS progress_entries_updated_at ON progress_entries (updated_at);
+            CREATE TABLE IF NOT EXISTS progress_updates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                upload_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                progress INTEGER NOT NULL,
+                step TEXT NOT NULL,
+                elapsed_seconds INTEGER NOT NULL,
+                timestamp REAL NOT NULL,
+                details TEXT
+            );
+            CREATE INDEX IF NOT EXISTS progress_updates_upload_seq ON progress_updates (upload_id, seq);
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(progress_entries)")]
+        if "owner_id" not in columns:
+            self._conn.execute("ALTER TABLE progress_entries ADD COLUMN owner_id TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS progress_entries_owner ON progress_entries (owner_id)")
+        self._data_version = self._pragma_data_version()
+        self._last_row_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM progress_updates").fetchone()[0]
+
+    def __contains__(self, upload_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM progress_entries WHERE upload_id = ? AND expires_at > ?",
+                (upload_id, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM progress_entries WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+    def append(self, upload_id: str, progress: int, step: str,
+               details: Optional[dict] = None, now: Optional[float] = None) -> ProgressUpdate:
+        now = now or time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT start_time, last_seq, expires_at FROM progress_entries WHERE upload_id = ?",
+                    (upload_id,),
+                ).fetchone()
+                if row is None or row[2] <= now:
+                    if row is not None:
+                        self._delete_locked(upload_id)
+                    start_time, seq = now, 1
+                else:
+                    start_time, seq = row[0], row[1] + 1
+
+                update = ProgressUpdate(seq, progress, step, int(now - start_time), now, details)
+                expires_at = now + (self.completed_ttl_seconds if update.is_final else self.ttl_seconds)
+                self._conn.execute(
+                    "INSERT INTO progress_entries (upload_id, start_time, updated_at, expires_at, last_seq) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (upload_id) DO UPDATE SET "
+                    "updated_at = excluded.updated_at, expires_at = excluded.expires_at, last_seq = excluded.last_seq",
+                    (upload_id, start_time, now, expires_at, seq),
+                )
+                self._conn.execute(
+                    "INSERT INTO progress_updates (upload_id, seq, progress, step, elapsed_seconds, timestamp, details) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (upload_id, seq, update.progress, update.step, update.elapsed_seconds, now,
+                     self._dump_details(update)),
+                )
+                if seq > self.max_updates:
+                    self._conn.execute(
+                        "DELETE FROM progress_updates WHERE upload_id = ? AND seq <= ?",
+                        (upload_id, seq - self.max_updates),
+                    )
+                if seq == 1:
+                    self._evict_overflow_locked()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return update
+
+    def latest(self, upload_id: str) -> Optional[ProgressUpdate]:
+        updates = self._select_updates(
+            "SELECT u.seq, u.progress, u.step, u.elapsed_seconds, u.timestamp, u.details "
+            "FROM progress_updates u JOIN progress_entries e ON e.upload_id = u.upload_id "
+            "WHERE u.upload_id = ? AND e.expires_at > ? ORDER BY u.seq DESC LIMIT 1",
+            (upload_id, time.time()),
+        )
+        return updates[0] if updates else None
+
+    def updates_since(self, upload_id: str, seq: int) -> list:
+        return self._select_updates(
+            "SELECT u.seq, u.progress, u.step, u.elapsed_seconds, u.timestamp, u.details "
+            "FROM progress_updates u JOIN progress_entries e ON e.upload_id = u.upload_id "
+            "WHERE u.upload_id = ? AND u.seq > ? AND e.expires_at > ? ORDER BY u.seq",
+            (upload_id, seq, time.time()),
+        )
+
+    def delete(self, upload_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._delete_locked(upload_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def set_owner(self, upload_id: str, owner_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE progress_entries SET owner_id = ? WHERE upload_id = ?", (owner_id, upload_id))
+
+    def owner_of(self, upload_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner_id FROM progress_entries WHERE upload_id = ? AND expires_at > ?",
+                (upload_id, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def uploads_of(self, owner_id: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT upload_id FROM progress_entries WHERE owner_id = ? AND expires_at > ?",
+                (owner_id, time.time()),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM progress_updates WHERE upload_id IN "
+                    "(SELECT upload_id FROM progress_entries WHERE expires_at <= ?)",
+                    (now,),
+                )
+                removed = self._conn.execute("DELETE FROM progress_entries WHERE expires_at <= ?", (now,)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def poll_changes(self) -> list:
+        """
+        upload_ids with updates written by other connections since the last call.
+        PRAGMA data_version makes the no-change case a cheap, read-free check.
+        """
+        with self._lock:
+            data_version = self._pragma_data_version()
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            rows = self._conn.execute(
+                "SELECT upload_id, MAX(id) FROM progress_updates WHERE id > ? GROUP BY upload_id",
+                (self._last_row_id,),
+            ).fetchall()
+        if not rows:
+            return []
+        self._last_row_id = max(self._last_row_id, max(row[1] for row in rows))
+        return [row[0] for row in rows]
+
+    def _pragma_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _select_updates(self, query: str, params: tuple) -> list:
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            ProgressUpdate(seq, progress, step, elapsed, timestamp, json.loads(details) if details else None)
+            for seq, progress, step, elapsed, timestamp, details in rows
+        ]
+
+    def _delete_locked(self, upload_id: str) -> bool:
+        self._conn.execute("DELETE FROM progress_updates WHERE upload_id = ?", (upload_id,))
+        return self._conn.execute("DELETE FROM progress_entries WHERE upload_id = ?", (upload_id,)).rowcount > 0
+
+    def _evict_overflow_locked(self):
+        overflow = self._conn.execute("SELECT COUNT(*) FROM progress_entries").fetchone()[0] - self.max_entries
+        if overflow <= 0:
+            return
+        oldest = self._conn.execute(
+            "SELECT upload_id FROM progress_entries ORDER BY updated_at LIMIT ?", (overflow,)
+        ).fetchall()
+        for (upload_id,) in oldest:
+            self._delete_locked(upload_id)
+
+    @staticmethod
+    def _dump_details(update: ProgressUpdate) -> Optional[str]:
+        details = {field: getattr(update, field) for field in DETAIL_FIELDS if getattr(update, field) is not None}
+        if update.extra:
+            details.update(update.extra)
+        return json.dumps(details) if details else None
+
+
+def create_progress_store(backend: Optional[str] = None, **limits) -> ProgressBackend:
+    """
+    Build the progress store selected by PROGRESS_BACKEND ("memory" or "sqlite").
+    The SQLite database path comes from PROGRESS_SQLITE_PATH.
+    """
+    backend = (backend or os.getenv("PROGRESS_BACKEND", "memory")).lower()
+    if backend == "memory":
+        return MemoryProgressStore(**limits)
+    if backend == "sqlite":
+        path = os.getenv("PROGRESS_SQLITE_PATH", "/tmp/upload_progress.db")
+        return SQLiteProgressStore(path, **limits)
+    raise ValueError(f"Unknown PROGRESS_BACKEND: {backend}")
@@ -0,0 +1,213 @@
+"""
+In-process scheduler for timed album releases.
+Upcoming `scheduled_publish_at` times are kept in a min-heap; a task started in
+the app lifespan sleeps until the earliest one is due (or until a new release
+is scheduled earlier) and publishes every due album with one conditional
+bulk update (publish_due_albums, shared with the cron endpoint).
+The heap is rebuilt from the database at startup and every
+SCHEDULER_RESYNC_INTERVAL seconds, so releases edited elsewhere or scheduled
+by another worker are still picked up.
+"""
+from supabase import create_client
+import asyncio
+import heapq
+import os
+from datetime import datetime, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from . import catalog_search
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+# Full reload of the scheduled releases from the database
+SCHEDULER_RESYNC_INTERVAL = int(os.getenv("SCHEDULER_RESYNC_INTERVAL", "900"))
+
+# Upcoming releases loaded per resync (the rest are loaded by later resyncs)
+SCHEDULER_LOAD_LIMIT = 1000
+
+# Wait before retrying a failed publish
+SCHEDULER_RETRY_SECONDS = 10
+
+_heap = []
+_rearm = None
+_loop = None
+_task = None
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse a timestamp from the database (ISO 8601, 'Z' or offset). Naive values are UTC."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _push(album_id: str, publish_at: datetime):
+    # Re-arm only when the new release is due before the one the task sleeps on
+    if not _heap or publish_at < _heap[0][0]:
+        _rearm.set()
+    heapq.heappush(_heap, (publish_at, album_id))
+
+
+def schedule(album_id: str, publish_at):
+    """
+    Register a release (datetime or ISO string). Safe to call from any thread;
+    does nothing when the scheduler is not running (the next resync loads it).
+    """
+    if _loop is None or _rearm is None:
+        return
+    if isinstance(publish_at, str):
+        publish_at = parse_timestamp(publish_at)
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _push(album_id, publish_at)
+    else:
+        _loop.call_soon_threadsafe(_push, album_id, publish_at)
+
+
+def _load_upcoming() -> list:
+    response = (
+        supabase.table("albums")
+        .select("id, scheduled_publish_at")
+        .eq("is_scheduled", True)
+        .order("scheduled_publish_at")
+        .limit(SCHEDULER_LOAD_LIMIT)
+        .execute()
+    )
+    return [
+        (parse_timestamp(row["scheduled_publish_at"]), row["id"])
+        for row in (response.data or [])
+        if row.get("scheduled_publish_at")
+    ]
+
+
+async def resync():
+    """Rebuild the heap from the scheduled albums in the database."""
+    global _heap
+    entries = await asyncio.to_thread(_load_upcoming)
+    # Keep releases scheduled while loading (a stale entry only costs a no-op update)
+    loaded_ids = {album_id for _, album_id in entries}
+    entries.extend(entry for entry in _heap if entry[1] not in loaded_ids)
+    heapq.heapify(entries)
+    _heap = entries
+    _rearm.set()
+    print(f"[SCHEDULER] Loaded {len(entries)} scheduled releases")
+
+
+def publish_due_albums(now: Optional[datetime] = None) -> list:
+    """
+    Publish every scheduled album whose time has come, with one conditional
+    bulk update (published_at is set in the same statement).
+
+    Returns:
+        list: the published album rows
+    """
+    now = now or datetime.now(timezone.utc)
+    response = (
+        supabase.table("albums")
+        .update({"is_private": False, "is_scheduled": False, "published_at": now.isoformat()})
+        .eq("is_scheduled", True)
+        .lte("scheduled_publish_at", now.isoformat())
+        .execute()
+    )
+    published = response.data or []
+    catalog_search.update_albums(published)
+    return published
+
+
+def publish_lag_seconds(album: dict) -> Optional[float]:
+    """Seconds between an album's scheduled time and its actual publication."""
+    if not album.get("scheduled_publish_at") or not album.get("published_at"):
+        return None
+    lag = parse_timestamp(album["published_at"]) - parse_timestamp(album["scheduled_publish_at"])
+    return round(lag.total_seconds(), 3)
+
+
+def _requeue(entries: list):
+    for publish_at, album_id in entries:
+        _push(album_id, publish_at)
+
+
+async def _publish_due():
+    now = datetime.now(timezone.utc)
+    due = []
+    while _heap and _heap[0][0] <= now:
+        due.append(heapq.heappop(_heap))
+    if not due:
+        return
+
+    try:
+        published = await asyncio.to_thread(publish_due_albums, now)
+    except Exception as e:
+        print(f"[SCHEDULER] Error publishing {len(due)} due albums: {e}")
+        _loop.call_later(SCHEDULER_RETRY_SECONDS, _requeue, due)
+        return
+
+    print(f"[SCHEDULER] Published {len(published)} albums")
+    for row in published:
+        print(f"[SCHEDULER] Album published: {row.get('title')} (ID: {row.get('id')}, "
+              f"lag {publish_lag_seconds(row)}s)")
+
+
+async def _run():
+    next_resync = _loop.time() + SCHEDULER_RESYNC_INTERVAL
+    while True:
+        if _loop.time() >= next_resync:
+            try:
+                await resync()
+            except Exception as e:
+                print(f"[SCHEDULER] Error loading scheduled releases: {e}")
+            next_resync = _loop.time() + SCHEDULER_RESYNC_INTERVAL
+
+        await _publish_due()
+
+        timeout = next_resync - _loop.time()
+        if _heap:
+            delay = (_heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+            timeout = min(timeout, delay)
+        _rearm.clear()
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(_rearm.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def start():
+    """Load scheduled releases and start the scheduler task (called from the app lifespan)."""
+    global _loop, _rearm, _task
+    if _task is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _rearm = asyncio.Event()
+    try:
+        await resync()
+    except Exception as e:
+        print(f"[SCHEDULER] Error loading scheduled releases: {e}")
+    _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _loop, _rearm, _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _heap.clear()
+    _loop = None
+    _rearm = None
+    _task = None
+
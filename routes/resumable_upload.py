@@ -0,0 +1,200 @@
+"""
+Resumable uploads to Supabase Storage (TUS protocol).
+Large objects are sent from disk in TUS_CHUNK_SIZE chunks (constant memory).
+Each chunk is retried on its own, resyncing the offset with a HEAD request.
+The upload URL is kept in a checkpoint (routes.checkpoints), so an upload
+interrupted by a crash or restart continues from the last stored byte
+instead of byte 0.
+"""
+import base64
+import os
+import time
+from typing import Callable, Optional
+from urllib.parse import urljoin
+import httpx
+from dotenv import load_dotenv
+from . import checkpoints
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+RESUMABLE_UPLOAD_URL = os.getenv("STORAGE_RESUMABLE_URL", f"{SUPABASE_URL}/storage/v1/upload/resumable")
+
+TUS_VERSION = "1.0.0"
+
+# Supabase Storage requires 6MB chunks (except the last one)
+TUS_CHUNK_SIZE = 6 * 1024 * 1024
+
+# Files at least this big go through the resumable endpoint
+RESUMABLE_THRESHOLD = int(os.getenv("RESUMABLE_UPLOAD_THRESHOLD", str(TUS_CHUNK_SIZE)))
+
+# Attempts per chunk before giving up (the upload can still be resumed later)
+CHUNK_MAX_RETRIES = 5
+CHUNK_RETRY_MAX_SECONDS = 30
+
+
+class ResumableUploadError(Exception):
+    pass
+
+
+def _headers(**extra) -> dict:
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+        "apikey": SUPABASE_SERVICE_KEY,
+        "Tus-Resumable": TUS_VERSION,
+    }
+    headers.update(extra)
+    return headers
+
+
+def _encode_metadata(metadata: dict) -> str:
+    return ",".join(f"{key} {base64.b64encode(str(value).encode()).decode()}" for key, value in metadata.items())
+
+
+def _checkpoint_name(path: str, bucket: str, object_name: str) -> str:
+    # Size and mtime in the name: a changed local file never resumes an old upload
+    stat = os.stat(path)
+    return f"tus:{bucket}/{object_name}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def _create_upload(client: httpx.Client, bucket: str, object_name: str, size: int,
+                   content_type: str, upsert: bool) -> str:
+    response = client.post(RESUMABLE_UPLOAD_URL, headers=_headers(**{
+        "Upload-Length": str(size),
+        "Upload-Metadata": _encode_metadata({
+            "bucketName": bucket,
+            "objectName": object_name,
+            "contentType": content_type,
+            "cacheControl": "3600",
+        }),
+        "x-upsert": "true" if upsert else "false",
+    }))
+    if response.status_code not in (200, 201) or "location" not in response.headers:
+        raise ResumableUploadError(f"Could not create upload: {response.status_code} - {response.text[:200]}")
+    return urljoin(RESUMABLE_UPLOAD_URL, response.headers["location"])
+
+
+def _server_offset(client: httpx.Client, upload_url: str) -> Optional[int]:
+    """Bytes already stored for an upload, or None if the server no longer knows it."""
+    response = client.head(upload_url, headers=_headers())
+    if response.status_code in (404, 410):
+        return None
+    if response.status_code not in (200, 204) or "upload-offset" not in response.headers:
+        raise ResumableUploadError(f"Could not get upload offset: {response.status_code}")
+    return int(response.headers["upload-offset"])
+
+
+def upload_file(path, bucket: str, object_name: str, content_type: str = "application/octet-stream",
+                upsert: bool = True, on_progress: Optional[Callable[[int], None]] = None) -> str:
+    """
+    Upload a local file with the TUS protocol. Blocking; run it in a thread
+    from async code. on_progress(bytes) is called after every stored chunk.
+    Raises ResumableUploadError when a chunk keeps failing; calling again
+    with the same file resumes where the upload stopped.
+
+    Returns:
+        str: object_name
+    """
+    path = str(path)
+    size = os.path.getsize(path)
+    checkpoint = _checkpoint_name(path, bucket, object_name)
+    state = checkpoints.load_checkpoint(checkpoint)
+
+    with httpx.Client(timeout=httpx.Timeout(120.0, connect=10.0)) as client, open(path, "rb") as f:
+        upload_url = None
+        offset = 0
+        if state:
+            try:
+                offset = _server_offset(client, state["url"])
+            except (httpx.HTTPError, ResumableUploadError) as e:
+                print(f"[RESUMABLE] Could not resume {object_name}: {e}")
+                offset = None
+            if offset is not None:
+                upload_url = state["url"]
+                print(f"[RESUMABLE] Resuming {object_name} at {offset}/{size} bytes")
+            else:
+                offset = 0
+        if upload_url is None:
+            upload_url = _create_upload(client, bucket, object_name, size, content_type, upsert)
+            checkpoints.save_checkpoint(checkpoint, {"url": upload_url})
+        if offset and on_progress:
+            on_progress(offset)
+
+        attempts = 0
+        while offset < size:
+            f.seek(offset)
+            chunk = f.read(TUS_CHUNK_SIZE)
+            try:
+                response = client.patch(upload_url, content=chunk, headers=_headers(**{
+                    "Upload-Offset": str(offset),
+                    "Content-Type": "application/offset+octet-stream",
+                }))
+                if response.status_code in (200, 204):
+                    new_offset = int(response.headers.get("upload-offset", offset + len(chunk)))
+                    if on_progress:
+                        on_progress(new_offset - offset)
+                    offset = new_offset
+                    attempts = 0
+                    continue
+                error = f"{response.status_code} - {response.text[:200]}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+
+            attempts += 1
+            if attempts > CHUNK_MAX_RETRIES:
+                raise ResumableUploadError(
+                    f"Chunk at offset {offset} of {object_name} failed after {CHUNK_MAX_RETRIES} retries: {error}"
+                )
+            delay = min(2 ** (attempts - 1), CHUNK_RETRY_MAX_SECONDS)
+            print(f"[RESUMABLE] Chunk at {offset} of {object_name} failed ({error}), retry {attempts} in {delay}s")
+            time.sleep(delay)
+
+            # The chunk may have been stored even if the response was lost
+            try:
+                server_offset = _server_offset(client, upload_url)
+            except (httpx.HTTPError, ResumableUploadError):
+                continue
+            if server_offset is None:
+                # Upload expired on the server: start again from byte 0
+                upload_url = _create_upload(client, bucket, object_name, size, content_type, upsert)
+                checkpoints.save_checkpoint(checkpoint, {"url": upload_url})
+                server_offset = 0
+            if on_progress and server_offset != offset:
+                on_progress(server_offset - offset)
+            offset = server_offset
+
+    checkpoints.clear_checkpoint(checkpoint)
+    return object_name
+
+
+def upload_object(path, bucket: str, object_name: str, content_type: str = "application/octet-stream",
+                  upsert: bool = True, on_progress: Optional[Callable[[int], None]] = None) -> str:
+    """
+    Upload a local file: resumable for files of RESUMABLE_THRESHOLD bytes or
+    more, a single streamed request (no retries) for smaller ones.
+    """
+    size = os.path.getsize(path)
+    if size >= RESUMABLE_THRESHOLD:
+        return upload_file(path, bucket, object_name, content_type, upsert, on_progress)
+
+    with open(path, "rb") as f:
+        response = httpx.post(
+            f"{SUPABASE_URL}/storage/v1/object/{bucket}/{object_name}",
+            content=f,
+            headers={
+                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+                "Content-Type": content_type,
+                "x-upsert": "true" if upsert else "false",
+            },
+            timeout=120.0,
+        )
+    if response.status_code not in (200, 201):
+        raise ResumableUploadError(f"Upload failed: {response.status_code} - {response.text[:200]}")
+    if on_progress:
+        on_progress(size)
+    return object_name
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Query, HTTPException
+from typing import Optional
+import asyncio
+import time
+from . import catalog_search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("")
+async def search_catalog(
+    q: str = Query(..., min_length=1),
+    type: Optional[str] = Query(None, pattern="^(album|song)$"),
+    genre: Optional[str] = Query(None),
+    year: Optional[int] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Search public albums and songs by title, artist, genre and tags.
+    Accent/case-insensitive, ignores Portuguese stopwords and plurals, and the
+    last word matches as a prefix; results are ranked with BM25. Facets
+    (type, genre, release_year) count every match, before the filters.
+    """
+    try:
+        if not q.strip():
+            raise HTTPException(status_code=400, detail="Query parameter 'q' is required")
+        
+        started = time.perf_counter()
+        if catalog_search.index.ready:
+            found = catalog_search.index.search(q, type, genre, year, limit, offset)
+            source = "index"
+        else:
+            # Index still loading (right after startup): album titles only
+            found = await asyncio.to_thread(catalog_search.search_database, q.strip(), limit, offset)
+            source = "database"
+        
+        return {
+            "query": q,
+            **found,
+            "limit": limit,
+            "offset": offset,
+            "source": source,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,145 @@
+"""Helpers for listing and removing objects in Supabase Storage."""
+from supabase import create_client
+import asyncio
+import os
+from urllib.parse import unquote, urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+STORAGE_BUCKET = "musica"
+
+# Objects removed per storage `remove` call
+REMOVE_BATCH_SIZE = 1000
+
+# Items per storage `list` call (the API returns 100 by default)
+LIST_PAGE_SIZE = 1000
+
+# Pages of one prefix fetched at once by aiter_prefix
+LIST_CONCURRENCY = 4
+
+
+def item_name(item):
+    """Name of an item returned by storage `list` (dict or object)."""
+    if isinstance(item, dict):
+        return item.get("name")
+    return getattr(item, "name", None)
+
+
+def is_folder(item) -> bool:
+    """Storage `list` returns sub-folders as items without an id."""
+    if isinstance(item, dict):
+        return item.get("id") is None
+    return getattr(item, "id", None) is None
+
+
+def object_path(url: str):
+    """Path of an object in the bucket from its public URL or a relative path (None if it is not in the bucket)."""
+    if not url:
+        return None
+    if url.startswith("http"):
+        marker = f"/object/public/{STORAGE_BUCKET}/"
+        path = urlparse(url).path
+        if marker not in path:
+            return None
+        return unquote(path.split(marker, 1)[1])
+    path = url.lstrip("/")
+    if path.startswith(f"{STORAGE_BUCKET}/"):
+        path = path[len(STORAGE_BUCKET) + 1:]
+    return path
+
+
+def list_page(prefix: str, offset: int = 0, limit: int = LIST_PAGE_SIZE) -> list:
+    """One page of the items directly under a storage prefix, sorted by name."""
+    options = {"limit": limit, "offset": offset, "sortBy": {"column": "name", "order": "asc"}}
+    return supabase.storage.from_(STORAGE_BUCKET).list(prefix, options) or []
+
+
+def iter_prefix(prefix: str, page_size: int = LIST_PAGE_SIZE):
+    """Yield every item directly under a storage prefix, one page at a time."""
+    offset = 0
+    while True:
+        page = list_page(prefix, offset, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
+
+async def aiter_prefix(prefix: str, page_size: int = LIST_PAGE_SIZE, concurrency: int = LIST_CONCURRENCY):
+    """
+    Async version of iter_prefix. After the first page, `concurrency` pages
+    are requested at once (by offset); items are yielded in name order.
+    """
+    page = await asyncio.to_thread(list_page, prefix, 0, page_size)
+    for item in page:
+        yield item
+    if len(page) < page_size:
+        return
+
+    offset = page_size
+    while True:
+        offsets = [offset + i * page_size for i in range(concurrency)]
+        pages = await asyncio.gather(*(asyncio.to_thread(list_page, prefix, o, page_size) for o in offsets))
+        for page in pages:
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                return
+        offset += concurrency * page_size
+
+
+def list_prefix(prefix: str) -> list:
+    """List every item directly under a storage prefix (all pages)."""
+    return list(iter_prefix(prefix))
+
+
+def list_prefix_paths(prefix: str) -> list:
+    """Full paths of the objects directly under a storage prefix (all pages)."""
+    return [f"{prefix}/{item_name(item)}" for item in iter_prefix(prefix) if not is_folder(item)]
+
+
+async def alist_prefix_paths(prefix: str) -> list:
+    """Async version of list_prefix_paths, fetching pages concurrently."""
+    return [f"{prefix}/{item_name(item)}" async for item in aiter_prefix(prefix) if not is_folder(item)]
+
+
+def remove_paths(paths: list) -> list:
+    """Remove objects (a single storage call). Returns the removed objects."""
+    return supabase.storage.from_(STORAGE_BUCKET).remove(paths) or []
+
+
+async def remove_objects(paths: list, batch_size: int = REMOVE_BATCH_SIZE, concurrency: int = 4) -> dict:
+    """
+    Remove many objects in batches of `batch_size`, running up to
+    `concurrency` storage calls at once.
+
+    Returns:
+        dict: {"removed": number of paths in successful batches, "failed_paths": [...]}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    async def remove_batch(batch):
+        async with semaphore:
+            await asyncio.to_thread(remove_paths, batch)
+
+    results = await asyncio.gather(*(remove_batch(batch) for batch in batches), return_exceptions=True)
+
+    removed = 0
+    failed_paths = []
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            print(f"[STORAGE] Error removing {len(batch)} objects: {result}")
+            failed_paths.extend(batch)
+        else:
+            removed += len(batch)
+    return {"removed": removed, "failed_paths": failed_paths}
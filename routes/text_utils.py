@@ -0,0 +1,23 @@
+"""Text normalization shared by file names and search (accent/case folding)."""
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def strip_accents(text: str) -> str:
+    """Remove accents (NFD + drop combining marks). "Música" -> "Musica"."""
+    if text.isascii():
+        return text
+    nfd = unicodedata.normalize("NFD", text)
+    return "".join(char for char in nfd if unicodedata.category(char) != "Mn")
+
+
+def normalize(text: str) -> str:
+    """Accent- and case-insensitive form used for search: "Zé Ramalho!" -> "ze ramalho"."""
+    return _NON_ALNUM.sub(" ", strip_accents(text or "").lower()).strip()
+
+
+def tokenize(text: str) -> list:
+    """Words of the normalized text: "Zé Ramalho!" -> ["ze", "ramalho"]."""
+    return normalize(text).split()
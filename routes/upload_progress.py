@@ -1,104 +1,386 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse, Response
 import asyncio
 import json
+import os
+import time
+import jwt
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
-from datetime import datetime, timedelta
+from . import auth_utils
+from .progress_store import create_progress_store
 
 router = APIRouter(prefix="/upload-progress", tags=["upload-progress"])
 
-# Global state for tracking uploads
-# Format: {upload_id: {"progress": 0-100, "step": "...", "start_time": datetime}}
-upload_progress = {}
+# Progress of the uploads. Entries expire after a TTL and the number of
+# tracked uploads is capped, so uploads nobody watches do not leak.
+# PROGRESS_BACKEND=sqlite shares progress between uvicorn workers on the host.
+PROGRESS_TTL_SECONDS = int(os.getenv("PROGRESS_TTL_SECONDS", "3600"))
+PROGRESS_COMPLETED_TTL_SECONDS = int(os.getenv("PROGRESS_COMPLETED_TTL_SECONDS", "600"))
+PROGRESS_MAX_ENTRIES = int(os.getenv("PROGRESS_MAX_ENTRIES", "1000"))
+PROGRESS_SWEEP_INTERVAL = 60
+# How often a shared backend is checked for updates written by other workers
+# (only while this worker has SSE subscribers)
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.25"))
 
-def update_progress(upload_id: str, progress: int, step: str):
-    """Update upload progress"""
+progress_store = create_progress_store(
+    ttl_seconds=PROGRESS_TTL_SECONDS,
+    completed_ttl_seconds=PROGRESS_COMPLETED_TTL_SECONDS,
+    max_entries=PROGRESS_MAX_ENTRIES,
+)
+
+# SSE subscribers waiting for the next update of an upload
+# Format: {upload_id: set of asyncio.Future}
+_waiters = {}
+
+# Callbacks run (on their own event loop) for every published upload_id.
+# Used by the multiplexed stream, which may watch uploads that do not exist yet.
+# Format: {callback: loop}
+_listeners = {}
+
+# Event loop of the subscribers: _waiters and _listeners are only touched on
+# it, publishes from other threads (the writer thread) are handed over to it
+_loop = None
+
+# Limits of the multiplexed stream
+MULTIPLEX_MAX_UPLOADS = 200
+MULTIPLEX_MIN_INTERVAL = 0.25
+
+# Seconds between keep-alive comments on idle SSE streams (keeps proxies open)
+HEARTBEAT_INTERVAL = 15
+
+# Reconnection delay suggested to EventSource clients (SSE "retry:" field)
+SSE_RETRY_MS = 3000
+
+_background_tasks = []
+
+# A shared (SQLite) store can wait on another worker's write lock, so its calls
+# never run on the event loop: writes go through one writer thread (keeps
+# every upload's updates in order, callers never wait) and reads from async
+# code use asyncio.to_thread (see _store_call).
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress-writer") if progress_store.shared else None
+
+
+async def _store_call(method, *args):
+    """Call a progress_store method from async code without blocking the loop on a shared backend."""
+    if progress_store.shared:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+def _write(function, *args):
+    """Run a store write: inline for the memory backend, on the writer thread for a shared one."""
+    if _writer is None:
+        function(*args)
+        return
+    future = _writer.submit(function, *args)
+    future.add_done_callback(_log_write_error)
+
+
+def _log_write_error(future):
+    error = future.exception()
+    if error is not None:
+        print(f"[PROGRESS] Error writing progress: {error}")
+
+
+def wait_for_writes():
+    """Block until every queued progress write is stored (benchmarks and scripts)."""
+    if _writer is not None:
+        _writer.submit(lambda: None).result()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _subscribe_loop():
+    """Remember the running loop as the one subscribers live on."""
+    global _loop
+    _loop = asyncio.get_running_loop()
+
+
+def _notify(upload_id: str):
+    """Wake every subscriber waiting on upload_id (from any thread)."""
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return  # Nobody subscribed yet
     try:
-        loop = asyncio.get_event_loop()
-        now = loop.time()
-    except:
-        import time
-        now = time.time()
-    
-    if upload_id not in upload_progress:
-        upload_progress[upload_id] = {
-            "start_time": now,
-            "updates": []
-        }
-    
-    elapsed = int(now - upload_progress[upload_id]["start_time"])
-    
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        _notify_local(upload_id)
+    else:
+        loop.call_soon_threadsafe(_notify_local, upload_id)
+
+
+def _notify_local(upload_id: str):
+    for callback, loop in list(_listeners.items()):
+        loop.call_soon_threadsafe(callback, upload_id)
+    waiters = _waiters.pop(upload_id, None)
+    if not waiters:
+        return
+    for future in waiters:
+        future.get_loop().call_soon_threadsafe(_wake, future)
+
+
+async def wait_for_update(upload_id: str, timeout: float) -> bool:
+    """
+    Wait until update_progress/complete_progress publishes for upload_id.
+    Returns False if nothing was published within `timeout` seconds.
+    """
+    _subscribe_loop()
+    future = asyncio.get_running_loop().create_future()
+    _waiters.setdefault(upload_id, set()).add(future)
+    try:
+        await asyncio.wait_for(future, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        waiters = _waiters.get(upload_id)
+        if waiters is not None:
+            waiters.discard(future)
+            if not waiters:
+                del _waiters[upload_id]
+
+
+def update_progress(upload_id: str, progress: int, step: str, **details):
+    """
+    Update upload progress.
+    Progress never goes backwards: a lower value keeps the last reported one.
+    Extra keyword arguments (bytes_done, eta_seconds, ...) are stored with the update.
+    """
     # Ensure progress is between 0 and 99 (100 only at the very end)
     progress = min(max(progress, 0), 99)
+    _write(_store_update, upload_id, progress, step, details)
+
+def _store_update(upload_id: str, progress: int, step: str, details: dict):
+    # Keep progress monotonic
+    latest = progress_store.latest(upload_id)
+    if latest:
+        progress = max(progress, latest.progress)
     
-    # Store update
-    upload_progress[upload_id]["updates"].append({
-        "progress": progress,
-        "step": step,
-        "elapsed_seconds": elapsed,
-        "timestamp": datetime.utcnow().isoformat()
-    })
-    
-    # Keep only last 100 updates to prevent memory leak
-    if len(upload_progress[upload_id]["updates"]) > 100:
-        upload_progress[upload_id]["updates"] = upload_progress[upload_id]["updates"][-100:]
+    progress_store.append(upload_id, progress, step, details)
+    _notify(upload_id)
+
+def set_upload_owner(upload_id: str, artist_id: str):
+    """Associate an upload with its artist (used by the multiplexed stream)."""
+    _write(_store_owner, upload_id, artist_id)
+
+def _store_owner(upload_id: str, artist_id: str):
+    progress_store.set_owner(upload_id, artist_id)
+    _notify(upload_id)
 
 def complete_progress(upload_id: str):
     """Mark upload as complete (100%)"""
-    if upload_id in upload_progress:
+    _write(_store_completion, upload_id)
+
+def _store_completion(upload_id: str):
+    if upload_id in progress_store:
+        progress_store.append(upload_id, 100, "completed")
+        _notify(upload_id)
+
+
+async def _sweep_periodically():
+    while True:
+        await asyncio.sleep(PROGRESS_SWEEP_INTERVAL)
         try:
-            loop = asyncio.get_event_loop()
-            now = loop.time()
-        except:
-            import time
-            now = time.time()
-        
-        elapsed = int(now - upload_progress[upload_id]["start_time"])
-        upload_progress[upload_id]["updates"].append({
-            "progress": 100,
-            "step": "completed",
-            "elapsed_seconds": elapsed,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+            removed = await _store_call(progress_store.sweep)
+            if removed:
+                print(f"[PROGRESS] Swept {removed} expired uploads ({await _store_call(progress_store.__len__)} tracked)")
+        except Exception as e:
+            print(f"[PROGRESS] Error sweeping progress store: {e}")
+
+
+async def _watch_shared_store():
+    """Wake local subscribers when other workers publish to the shared store."""
+    while True:
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+        if not _waiters and not _listeners:
+            continue
+        try:
+            for upload_id in await _store_call(progress_store.poll_changes):
+                _notify(upload_id)
+        except Exception as e:
+            print(f"[PROGRESS] Error polling shared progress store: {e}")
+
+
+def start_background_tasks():
+    """Start the sweeper (and the shared store watcher, if the backend is shared)."""
+    if _background_tasks:
+        return
+    loop = asyncio.get_running_loop()
+    _subscribe_loop()
+    _background_tasks.append(loop.create_task(_sweep_periodically()))
+    if progress_store.shared:
+        _background_tasks.append(loop.create_task(_watch_shared_store()))
+
+
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    for task in _background_tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _background_tasks.clear()
+
+# Stages of an album upload and their weight (in %) in the overall progress.
+# Each stage advances by the amount of work done in it (bytes received,
+# bytes extracted, bytes sent to storage), so the percentage follows real work.
+UPLOAD_STAGES = (
+    ("recebendo_arquivo", 10),
+    ("extraindo_arquivo", 20),
+    ("criando_album", 5),
+    ("enviando_musicas", 60),
+    ("finalizando", 5),
+)
+
+
+class UploadProgressTracker:
+    """
+    Computes upload progress from the work done in each stage and publishes it
+    through update_progress, with throughput and ETA fields.
+
+    Reports are throttled: a new update is published when the step changes or,
+    for byte advances, at most once every `min_interval` seconds.
+    """
+
+    def __init__(self, upload_id: str, stages=UPLOAD_STAGES, min_interval: float = 0.25):
+        self.upload_id = upload_id
+        self.min_interval = min_interval
+        self._weights = dict(stages)
+        self._totals = {name: 0 for name in self._weights}
+        self._done = {name: 0 for name in self._weights}
+        self._finished = set()
+        self._stage_started = {}
+        self._started = time.monotonic()
+        self._last_report = 0.0
+        self._last_step = None
+        self._current_stage = None
+
+    def set_total(self, stage: str, total: int):
+        """Set the amount of work (usually bytes) expected in a stage."""
+        self._totals[stage] = max(int(total or 0), 0)
+        self._stage_started.setdefault(stage, time.monotonic())
+        self._current_stage = stage
+
+    def advance(self, stage: str, amount: int, step: Optional[str] = None):
+        """Record `amount` units of work done in a stage and report if due."""
+        self._stage_started.setdefault(stage, time.monotonic())
+        self._current_stage = stage
+        self._done[stage] += amount
+        self.report(step or stage)
+
+    def finish_stage(self, stage: str, step: Optional[str] = None):
+        """Mark a stage as fully done and report it."""
+        self._stage_started.setdefault(stage, time.monotonic())
+        self._current_stage = stage
+        self._finished.add(stage)
+        self.report(step or stage, force=True)
+
+    def percent(self) -> int:
+        total = 0.0
+        for stage, weight in self._weights.items():
+            if stage in self._finished:
+                fraction = 1.0
+            elif self._totals[stage]:
+                fraction = min(self._done[stage] / self._totals[stage], 1.0)
+            else:
+                fraction = 0.0
+            total += weight * fraction
+        return int(total)
+
+    def report(self, step: str, force: bool = False):
+        """Publish the current progress under `step`."""
+        now = time.monotonic()
+        if not force and step == self._last_step and now - self._last_report < self.min_interval:
+            return
+        self._last_report = now
+        self._last_step = step
+        update_progress(self.upload_id, self.percent(), step, **self.details(now))
+
+    def details(self, now: Optional[float] = None) -> dict:
+        """Throughput and ETA fields for the current stage."""
+        now = now or time.monotonic()
+        stage = self._current_stage
+        elapsed = now - self._started
+        percent = self.percent()
+        details = {
+            "stage": stage,
+            "eta_seconds": int(elapsed * (100 - percent) / percent) if percent > 0 else None,
+        }
+        if stage and self._totals.get(stage):
+            stage_elapsed = now - self._stage_started.get(stage, now)
+            done = self._done[stage]
+            details["bytes_done"] = done
+            details["bytes_total"] = self._totals[stage]
+            details["bytes_per_second"] = int(done / stage_elapsed) if stage_elapsed > 0 else None
+        return details
+
+def _parse_event_id(value: Optional[str]) -> int:
+    try:
+        return max(int(value), 0) if value else 0
+    except ValueError:
+        return 0
+
+
+def _format_event(update) -> str:
+    return f"id: {update.seq}\ndata: {json.dumps(update.to_dict())}\n\n"
+
 
 @router.get("/progress/{upload_id}")
-async def get_upload_progress(upload_id: str, token: Optional[str] = Query(None)):
+async def get_upload_progress(
+    upload_id: str,
+    token: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    last_event_id_query: Optional[str] = Query(None, alias="lastEventId"),
+):
     """
     Server-Sent Events endpoint to stream upload progress.
     Sends updates in real-time as they arrive from the backend.
+    Each event carries the update sequence number as its id, so a reconnecting
+    client (Last-Event-ID header, or ?lastEventId=) only receives what it missed.
     """
+    resume_seq = _parse_event_id(last_event_id or last_event_id_query)
+    latest = await _store_call(progress_store.latest, upload_id)
+    if latest is not None and resume_seq > latest.seq:
+        # The upload was restarted under the same id: replay from the start
+        resume_seq = 0
+    if latest is not None and latest.is_final and resume_seq >= latest.seq:
+        # Client already has the final update; 204 tells EventSource to stop reconnecting
+        return Response(status_code=204)
+    
     async def progress_generator():
         """Generate progress updates using SSE format"""
-        last_sent_index = 0
+        last_seq = resume_seq
         max_wait = 120  # 2 minutes max wait for updates
-        wait_iterations = 0
+        loop = asyncio.get_running_loop()
+        last_activity = loop.time()
+        yield f"retry: {SSE_RETRY_MS}\n\n"
         
         while True:
-            # Check if we have new updates
-            if upload_id in upload_progress:
-                updates = upload_progress[upload_id]["updates"]
-                
-                # Send any new updates since last check
-                while last_sent_index < len(updates):
-                    update = updates[last_sent_index]
-                    yield f"data: {json.dumps(update)}\n\n"
-                    last_sent_index += 1
-                    wait_iterations = 0  # Reset wait counter
-                    
-                    # Small delay between updates for streaming effect
-                    await asyncio.sleep(0.01)
+            # Send every update published since the last write, in one chunk
+            pending = await _store_call(progress_store.updates_since, upload_id, last_seq)
+            if pending:
+                last_seq = pending[-1].seq
+                last_activity = loop.time()
+                yield "".join(_format_event(update) for update in pending)
                 
                 # If we've reached 100% or completed, we're done
-                if last_sent_index > 0 and (updates[-1]["progress"] >= 100 or updates[-1].get("step") in ["completed", "concluido"]):
+                if pending[-1].is_final:
                     break
+                # Re-check right away: more updates may have arrived while writing
+                continue
             
-            # Wait a bit before checking again
-            await asyncio.sleep(0.1)
-            wait_iterations += 1
-            
-            # Safety timeout after 2 minutes
-            if wait_iterations > (max_wait * 10):
-                if upload_id in upload_progress:
+            # Sleep until update_progress publishes (or a heartbeat is due)
+            idle = loop.time() - last_activity
+            if idle >= max_wait:
+                # Safety timeout after 2 minutes without updates
+                if await _store_call(progress_store.__contains__, upload_id):
                     # Force completion if stuck
                     final_update = {
                         "progress": 100,
@@ -107,19 +389,10 @@ async def get_upload_progress(upload_id: str, token: Optional[str] = Query(None)
                     }
                     yield f"data: {json.dumps(final_update)}\n\n"
                 break
-        
-        # Cleanup old upload data after 10 minutes
-        if upload_id in upload_progress:
-            try:
-                loop = asyncio.get_event_loop()
-                now = loop.time()
-            except:
-                import time
-                now = time.time()
             
-            start_time = upload_progress[upload_id]["start_time"]
-            if (now - start_time) > 600:  # 600 seconds = 10 minutes
-                del upload_progress[upload_id]
+            published = await wait_for_update(upload_id, min(HEARTBEAT_INTERVAL, max_wait - idle))
+            if not published:
+                yield ": keep-alive\n\n"
     
     return StreamingResponse(
         progress_generator(),
@@ -131,29 +404,138 @@ async def get_upload_progress(upload_id: str, token: Optional[str] = Query(None)
         }
     )
 
+@router.get("/stream")
+async def stream_many_uploads(
+    upload_ids: Optional[str] = Query(None, description="Comma-separated upload ids"),
+    artist_id: Optional[str] = Query(None, description="Also watch every upload of this artist"),
+    interval: float = Query(1.0, description="Minimum seconds between two events"),
+    token: Optional[str] = Query(None),
+):
+    """
+    Multiplexed Server-Sent Events stream for dashboards watching many uploads.
+    One connection follows a list of upload_ids and/or every upload of an artist
+    (including uploads started after connecting). Updates are coalesced: each
+    event carries only the latest update of every upload that changed, and at
+    most one event is sent per `interval` seconds.
+    EventSource cannot send headers, so the access token comes in ?token=; only
+    the caller's own uploads are streamed.
+    """
+    if not token:
+        raise HTTPException(status_code=401, detail="token query parameter required")
+    try:
+        user_id = (await asyncio.to_thread(auth_utils.verify_token, token))["sub"]
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError as e:
+        print(f"[PROGRESS] Invalid stream token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    watched = set(filter(None, (upload_id.strip() for upload_id in (upload_ids or "").split(","))))
+    if not watched and not artist_id:
+        raise HTTPException(status_code=400, detail="upload_ids or artist_id is required")
+    if len(watched) > MULTIPLEX_MAX_UPLOADS:
+        raise HTTPException(status_code=400, detail=f"At most {MULTIPLEX_MAX_UPLOADS} upload_ids per stream")
+    if artist_id and artist_id != user_id:
+        raise HTTPException(status_code=403, detail="You can only stream your own uploads")
+    
+    # Owner of every upload seen by this stream (an upload's owner never changes)
+    owners = {}
+    for upload_id in watched:
+        owner = await _store_call(progress_store.owner_of, upload_id)
+        if owner is not None:
+            if owner != user_id:
+                raise HTTPException(status_code=403, detail="You can only stream your own uploads")
+            owners[upload_id] = owner
+    interval = max(interval, MULTIPLEX_MIN_INTERVAL)
+    
+    async def owned(upload_id: str) -> bool:
+        """True once the upload is known to belong to the caller (unowned uploads are not sent)."""
+        owner = owners.get(upload_id)
+        if owner is None:
+            owner = await _store_call(progress_store.owner_of, upload_id)
+            if owner is None:
+                return False
+            owners[upload_id] = owner
+        return owner == user_id
+    
+    async def multiplex_generator():
+        loop = asyncio.get_running_loop()
+        changed = set(watched)
+        if artist_id:
+            changed.update(await _store_call(progress_store.uploads_of, artist_id))
+        wakeup = asyncio.Event()
+        last_sent = {}
+        
+        def on_publish(upload_id: str):
+            if upload_id in watched or artist_id:
+                changed.add(upload_id)
+                wakeup.set()
+        
+        _subscribe_loop()
+        _listeners[on_publish] = loop
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                batch = {}
+                for upload_id in list(changed):
+                    if not await owned(upload_id):
+                        continue
+                    if upload_id not in watched:
+                        # Upload seen through the artist subscription
+                        if len(watched) >= MULTIPLEX_MAX_UPLOADS:
+                            continue
+                        watched.add(upload_id)
+                    latest = await _store_call(progress_store.latest, upload_id)
+                    if latest is not None and latest.seq > last_sent.get(upload_id, 0):
+                        last_sent[upload_id] = latest.seq
+                        batch[upload_id] = dict(latest.to_dict(), seq=latest.seq)
+                changed.clear()
+                wakeup.clear()
+                
+                if batch:
+                    yield f"event: progress\ndata: {json.dumps({'updates': batch})}\n\n"
+                    # Rate limit: updates published meanwhile are coalesced into the next event
+                    await asyncio.sleep(interval)
+                    if changed:
+                        continue
+                
+                try:
+                    await asyncio.wait_for(wakeup.wait(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            _listeners.pop(on_publish, None)
+    
+    return StreamingResponse(
+        multiplex_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Connection": "keep-alive"
+        }
+    )
+
 @router.get("/status/{upload_id}")
 async def get_upload_status(upload_id: str):
     """Get current upload status"""
     print(f"[STATUS] Getting status for {upload_id}")
-    print(f"[STATUS] Known uploads: {list(upload_progress.keys())}")
+    print(f"[STATUS] Tracked uploads: {await _store_call(progress_store.__len__)}")
     
-    if upload_id not in upload_progress:
+    if not await _store_call(progress_store.__contains__, upload_id):
         print(f"[STATUS] Upload {upload_id} not found")
         return {"status": "not_found", "progress": 0}
     
-    updates = upload_progress[upload_id]["updates"]
-    print(f"[STATUS] Found {len(updates)} updates for {upload_id}")
-    
-    if not updates:
+    latest = await _store_call(progress_store.latest, upload_id)
+    if latest is None:
         print(f"[STATUS] No updates yet for {upload_id}")
         return {"status": "waiting", "progress": 0}
     
-    latest = updates[-1]
     result = {
-        "status": "in_progress" if latest["progress"] < 100 else "completed",
-        "progress": latest["progress"],
-        "step": latest["step"],
-        "elapsed_seconds": latest["elapsed_seconds"]
+        "status": "in_progress" if latest.progress < 100 else "completed",
+        "progress": latest.progress,
+        "step": latest.step,
+        "elapsed_seconds": latest.elapsed_seconds
     }
     print(f"[STATUS] Returning: {result}")
     return result
@@ -161,6 +543,6 @@ async def get_upload_status(upload_id: str):
 @router.delete("/progress/{upload_id}")
 async def clear_progress(upload_id: str):
     """Clear progress for an upload"""
-    if upload_id in upload_progress:
-        del upload_progress[upload_id]
+    if await _store_call(progress_store.delete, upload_id):
+        _notify(upload_id)
     return {"status": "cleared"}
@@ -0,0 +1,323 @@
+"""
+YouTube video metadata (title, author, thumbnail) from the oEmbed endpoint.
+Lookups share one HTTP client, run with bounded concurrency and are cached:
+found videos for OEMBED_CACHE_TTL_SECONDS, unknown/private ids (oEmbed 400,
+401, 403 or 404) for OEMBED_NEGATIVE_TTL_SECONDS, and concurrent lookups of
+the same id share one request.
+
+artist_videos rows are created with metadata_status "pending" and queued
+here; a worker started in the app lifespan resolves queued rows in batches
+off the request path and fills in their title and thumbnail. Rows still
+pending (restarts, transient oEmbed errors) are re-queued by a periodic
+rescan. YOUTUBE_OEMBED_URL can point at a local stand-in for testing.
+"""
+from supabase import create_client
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+import httpx
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in .env")
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+YOUTUBE_OEMBED_URL = os.getenv("YOUTUBE_OEMBED_URL", "https://www.youtube.com/oembed")
+
+STATUS_PENDING = "pending"
+STATUS_RESOLVED = "resolved"
+STATUS_INVALID = "invalid"
+
+# Found videos are cached this long; ids oEmbed rejects are cached for the shorter negative TTL
+OEMBED_CACHE_TTL_SECONDS = int(os.getenv("OEMBED_CACHE_TTL_SECONDS", "86400"))
+OEMBED_NEGATIVE_TTL_SECONDS = int(os.getenv("OEMBED_NEGATIVE_TTL_SECONDS", "3600"))
+OEMBED_CACHE_SIZE = 10000
+
+# oEmbed requests running at once, and how long each may take
+OEMBED_CONCURRENCY = int(os.getenv("OEMBED_CONCURRENCY", "4"))
+OEMBED_TIMEOUT_SECONDS = 5.0
+
+# oEmbed answers these for removed, private or malformed videos
+INVALID_STATUS_CODES = (400, 401, 403, 404)
+
+# Rows resolved per worker batch; wait this long after the first queued row so a burst is resolved together
+METADATA_BATCH_SIZE = 50
+METADATA_BATCH_WAIT = 0.5
+
+# Pending rows are re-read from the database this often (restarts, transient errors)
+METADATA_RESCAN_INTERVAL = int(os.getenv("METADATA_RESCAN_INTERVAL", "300"))
+METADATA_RESCAN_LIMIT = 500
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+_cache = OrderedDict()      # video id -> (metadata or None, expires_at)
+_inflight = {}              # video id -> future shared by concurrent lookups
+_client = None
+_semaphore = None
+_queue = None
+_queued = set()
+_worker_task = None
+_rescan_task = None
+
+
+class OEmbedError(Exception):
+    """oEmbed could not be reached or answered with an unexpected status (not cached)."""
+
+
+def is_valid_video_id(video_id: str) -> bool:
+    return bool(video_id and _VIDEO_ID.match(video_id))
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """
+    Extract video ID from YouTube URL.
+    Supports: youtu.be/xxx, youtube.com/watch?v=xxx, youtube.com/embed/xxx
+    Returns: video_id (11 chars) or None if invalid
+    """
+    if not url:
+        return None
+    
+    pattern = r'^.*(youtu.be\/|v\/|u\/\w\/|embed\/|watch\?v=|&v=)([^#&?]*).*'
+    match = re.match(pattern, url)
+    
+    if match and len(match.group(2)) == 11:
+        return match.group(2)
+    
+    return None
+
+
+def video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def default_thumbnail(video_id: str) -> str:
+    """Thumbnail URL that exists for every public video (used until oEmbed answers)."""
+    return f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
+
+
+def _cached(video_id: str):
+    """(True, metadata or None) if the id is cached and fresh, else (False, None)."""
+    entry = _cache.get(video_id)
+    if entry is None:
+        return False, None
+    metadata, expires_at = entry
+    if expires_at <= time.monotonic():
+        del _cache[video_id]
+        return False, None
+    _cache.move_to_end(video_id)
+    return True, metadata
+
+
+def _remember(video_id: str, metadata: Optional[dict]):
+    ttl = OEMBED_CACHE_TTL_SECONDS if metadata is not None else OEMBED_NEGATIVE_TTL_SECONDS
+    _cache[video_id] = (metadata, time.monotonic() + ttl)
+    _cache.move_to_end(video_id)
+    while len(_cache) > OEMBED_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client, _semaphore
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=OEMBED_TIMEOUT_SECONDS, follow_redirects=True)
+        _semaphore = asyncio.Semaphore(OEMBED_CONCURRENCY)
+    return _client
+
+
+async def _fetch(video_id: str) -> Optional[dict]:
+    client = _get_client()
+    async with _semaphore:
+        try:
+            response = await client.get(YOUTUBE_OEMBED_URL, params={"url": video_url(video_id), "format": "json"})
+        except httpx.HTTPError as e:
+            raise OEmbedError(f"oEmbed request failed: {e}") from e
+    if response.status_code in INVALID_STATUS_CODES:
+        return None
+    if response.status_code != 200:
+        raise OEmbedError(f"oEmbed answered {response.status_code}")
+    data = response.json()
+    return {
+        "title": data.get("title"),
+        "author_name": data.get("author_name"),
+        "thumbnail_url": data.get("thumbnail_url") or default_thumbnail(video_id),
+    }
+
+
+async def resolve(video_id: str) -> Optional[dict]:
+    """
+    Metadata of a video ({"title", "author_name", "thumbnail_url"}), or None
+    if the id is malformed or oEmbed does not know it.
+
+    Raises:
+        OEmbedError: oEmbed unreachable or failing (try again later)
+    """
+    if not is_valid_video_id(video_id):
+        return None
+    found, metadata = _cached(video_id)
+    if found:
+        return metadata
+
+    future = _inflight.get(video_id)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[video_id] = future
+    try:
+        metadata = await _fetch(video_id)
+        _remember(video_id, metadata)
+        future.set_result(metadata)
+        return metadata
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark it retrieved: nobody else may be waiting for this id
+        future.exception()
+        raise
+    finally:
+        del _inflight[video_id]
+
+
+async def resolve_many(video_ids: list) -> dict:
+    """{video id: metadata, None (invalid) or OEmbedError} for every distinct id."""
+    unique = list(dict.fromkeys(video_ids))
+    results = await asyncio.gather(*(resolve(video_id) for video_id in unique), return_exceptions=True)
+    return dict(zip(unique, results))
+
+
+def enqueue(row_id, video_id: str):
+    """Queue an artist_videos row for background resolution (no-op before startup; the rescan picks it up)."""
+    if _queue is None or row_id in _queued:
+        return
+    _queued.add(row_id)
+    _queue.put_nowait((row_id, video_id))
+
+
+async def _next_batch() -> list:
+    """Block until a row is queued, then collect up to METADATA_BATCH_SIZE rows."""
+    batch = [await _queue.get()]
+    deadline = asyncio.get_running_loop().time() + METADATA_BATCH_WAIT
+    while len(batch) < METADATA_BATCH_SIZE:
+        timeout = deadline - asyncio.get_running_loop().time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(_queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    for row_id, _ in batch:
+        _queued.discard(row_id)
+    return batch
+
+
+def _update_rows(row_ids: list, fields: dict):
+    # Only rows still pending: a title set by hand in the meantime is kept
+    supabase.table("artist_videos").update(fields).in_("id", row_ids).eq("metadata_status", STATUS_PENDING).execute()
+
+
+async def _process_batch(batch: list):
+    rows_by_video = {}
+    for row_id, video_id in batch:
+        rows_by_video.setdefault(video_id, []).append(row_id)
+
+    results = await resolve_many(list(rows_by_video))
+    resolved = invalid = failed = 0
+    for video_id, metadata in results.items():
+        row_ids = rows_by_video[video_id]
+        if isinstance(metadata, Exception):
+            # Left pending: the next rescan tries again
+            print(f"[YOUTUBE] Could not resolve {video_id}: {metadata}")
+            failed += len(row_ids)
+            continue
+        if metadata is None:
+            fields = {"metadata_status": STATUS_INVALID}
+            invalid += len(row_ids)
+        else:
+            fields = {
+                "metadata_status": STATUS_RESOLVED,
+                "thumbnail": metadata["thumbnail_url"],
+                "author_name": metadata["author_name"],
+            }
+            if metadata["title"]:
+                fields["title"] = metadata["title"]
+            resolved += len(row_ids)
+        await asyncio.to_thread(_update_rows, row_ids, fields)
+
+    print(f"[YOUTUBE] Batch done: {resolved} resolved, {invalid} invalid, {failed} failed")
+
+
+async def _worker():
+    while True:
+        batch = await _next_batch()
+        try:
+            await _process_batch(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Database errors: the rows stay pending for the rescan
+            print(f"[YOUTUBE] Error processing batch of {len(batch)} videos: {e}")
+
+
+async def enqueue_pending():
+    """Queue artist_videos rows still pending in the database."""
+    response = await asyncio.to_thread(
+        lambda: supabase.table("artist_videos")
+        .select("id, video_id")
+        .eq("metadata_status", STATUS_PENDING)
+        .order("created_at")
+        .limit(METADATA_RESCAN_LIMIT)
+        .execute()
+    )
+    rows = response.data or []
+    for row in rows:
+        enqueue(row["id"], row["video_id"])
+    if rows:
+        print(f"[YOUTUBE] Re-enqueued {len(rows)} pending videos")
+
+
+async def _rescan_loop():
+    while True:
+        try:
+            await enqueue_pending()
+        except Exception as e:
+            print(f"[YOUTUBE] Error scanning pending videos: {e}")
+        await asyncio.sleep(METADATA_RESCAN_INTERVAL)
+
+
+def start_background_tasks():
+    """Start the metadata worker and the pending-row rescan (called from the app lifespan)."""
+    global _queue, _worker_task, _rescan_task
+    if _worker_task is None:
+        _queue = asyncio.Queue()
+        _worker_task = asyncio.create_task(_worker())
+        _rescan_task = asyncio.create_task(_rescan_loop())
+
+
+async def stop_background_tasks():
+    global _queue, _worker_task, _rescan_task, _client, _semaphore
+    for task in (_worker_task, _rescan_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _queue = None
+    _queued.clear()
+    _worker_task = None
+    _rescan_task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _semaphore = None
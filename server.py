@@ -1,9 +1,12 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from routes import album_deleter, archive_jobs, artist_search, catalog_search, release_scheduler, upload_progress, youtube_metadata
 from routes.albums import router as albums_router
 from routes.album_upload import router as album_upload_router
 from routes.upload_progress import router as upload_progress_router
 from routes.artists import router as artists_router
+from routes.search import router as search_router
 from routes.artist_videos import router as artist_videos_router
 from routes.cleanup import router as cleanup_router
 from routes.music_files import router as music_files_router
@@ -11,7 +14,27 @@ from routes.album_download import router as album_download_router
 from routes.admin import router as admin_router
 from routes.auth import router as auth_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background tasks that live as long as the app
+    upload_progress.start_background_tasks()
+    album_deleter.start_background_tasks()
+    artist_search.start_background_tasks()
+    catalog_search.start_background_tasks()
+    youtube_metadata.start_background_tasks()
+    await release_scheduler.start()
+    yield
+    await archive_jobs.stop_background_tasks()
+    await release_scheduler.stop()
+    await youtube_metadata.stop_background_tasks()
+    await catalog_search.stop_background_tasks()
+    await artist_search.stop_background_tasks()
+    await album_deleter.stop_background_tasks()
+    await upload_progress.stop_background_tasks()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Adicionar CORS middleware
 app.add_middleware(
@@ -28,6 +51,7 @@ app.include_router(albums_router, prefix="/api")
 app.include_router(album_upload_router, prefix="/api")
 app.include_router(upload_progress_router, prefix="/api")
 app.include_router(artists_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
 app.include_router(artist_videos_router, prefix="/api")
 app.include_router(cleanup_router, prefix="/api")
 app.include_router(music_files_router, prefix="/api")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Test the in-memory catalog search index (BM25, stemmer, prefixo, facetas e visibilidade)
+# Não precisa de Supabase: o índice é montado direto a partir de linhas em memória
+import os
+import sys
+
+ALBUMS = [
+    {"id": "a1", "title": "Canções de Amor", "artist_name": "Zé Ramalho", "genre": "MPB", "release_year": 1980},
+    {"id": "a2", "title": "Forró Pé de Serra", "artist_name": "Luiz Gonzaga", "genre": "Forró", "release_year": "1975-01-01"},
+    {"id": "a3", "title": "Noites Cariocas", "artist_name": "Jacob do Bandolim", "genre": "Choro", "release_year": 1965},
+    {"id": "a4", "title": "Segredo Guardado", "artist_name": "Banda Oculta", "genre": "Rock", "is_private": True},
+    {"id": "a5", "title": "Lançamento Futuro", "artist_name": "Banda Agendada", "genre": "Rock", "is_scheduled": True},
+]
+
+SONGS = [
+    {"id": "s1", "album_id": "a1", "title": "Admirável Gado Novo", "artist_name": "Zé Ramalho", "album_name": "Canções de Amor", "genre": "MPB"},
+    {"id": "s2", "album_id": "a1", "title": "Avohai", "artist_name": "Zé Ramalho", "album_name": "Canções de Amor", "genre": "MPB"},
+    {"id": "s3", "album_id": "a2", "title": "Asa Branca", "artist_name": "Luiz Gonzaga", "album_name": "Forró Pé de Serra", "genre": "Forró"},
+    {"id": "s4", "album_id": "a3", "title": "Noites de Amor", "artist_name": "Jacob do Bandolim", "album_name": "Noites Cariocas", "genre": "Choro"},
+    {"id": "s5", "album_id": "a4", "title": "Segredo", "artist_name": "Banda Oculta", "album_name": "Segredo Guardado", "genre": "Rock"},
+]
+
+
+def check(name, passed, detail=""):
+    print(f"{name}... [{'OK' if passed else 'ERRO'}] {detail}")
+    return passed
+
+
+def ids(result):
+    return [f"{doc['type']}:{doc['id']}" for doc in result["results"]]
+
+
+def run_checks(catalog_search):
+    ok = True
+    index = catalog_search.CatalogIndex()
+    index.replace_all(ALBUMS, SONGS)
+
+    # 1. Acentos e maiúsculas: "CANCOES" encontra "Canções", "ze ramalho" encontra "Zé Ramalho"
+    result = index.search("CANCOES")
+    ok &= check("Sem acento e maiúsculas", "album:a1" in ids(result), f"{ids(result)}")
+    result = index.search("ze ramalho", doc_type="album")
+    ok &= check("Nome do artista sem acento", ids(result) == ["album:a1"], f"{ids(result)}")
+
+    # 2. Stemmer: singular e plural batem ("cancao" / "canções", "noite" / "Noites")
+    ok &= check("Plural reduzido", catalog_search.stem("cancoes") == "cancao" and catalog_search.stem("amores") == "amor"
+                and catalog_search.analyze("As Noites de Amor") == ("noite", "amor"))
+    result = index.search("noite")
+    ok &= check("Busca no singular", set(ids(result)) == {"album:a3", "song:s4"}, f"{ids(result)}")
+
+    # 3. Stopwords: uma busca só de stopwords não retorna nada
+    ok &= check("Só stopwords", index.search("de da do")["total"] == 0)
+
+    # 4. Prefixo só no último termo (e não depois de um espaço)
+    result = index.search("asa bra")
+    ok &= check("Prefixo no último termo", ids(result) == ["song:s3"], f"{ids(result)}")
+    ok &= check("Sem prefixo depois de espaço", index.search("bra ")["total"] == 0)
+    result = index.search("bra asa")
+    ok &= check("Sem prefixo nos outros termos", result["match"] == "any" and ids(result) == ["song:s3"],
+                f"{result['match']} {ids(result)}")
+
+    # 5. Ranking BM25: título pesa mais que nome do álbum; todos os termos antes de "qualquer termo"
+    result = index.search("amor")
+    scores = {key: doc["score"] for key, doc in zip(ids(result), result["results"])}
+    ok &= check("Título pesa mais que nome do álbum", scores["album:a1"] > scores["song:s2"]
+                and scores["song:s4"] > scores["song:s2"], f"{scores}")
+    ok &= check("Resultados ordenados por score", list(scores.values()) == sorted(scores.values(), reverse=True))
+    result = index.search("asa gonzaga")
+    ok &= check("Todos os termos", result["match"] == "all" and ids(result) == ["song:s3"], f"{ids(result)}")
+    result = index.search("asa choro")
+    ok &= check("Nenhum documento com todos os termos: qualquer termo", result["match"] == "any"
+                and set(ids(result)) >= {"song:s3", "album:a3"}, f"{ids(result)}")
+
+    # 6. Facetas contam todos os resultados; os filtros só reduzem a lista
+    result = index.search("zé", genre="mpb", doc_type="song")
+    facets = {name: {item["value"]: item["count"] for item in values} for name, values in result["facets"].items()}
+    ok &= check("Facetas", facets["type"] == {"album": 1, "song": 2} and facets["genre"] == {"MPB": 3}
+                and result["total"] == 2 and set(ids(result)) == {"song:s1", "song:s2"}, f"{facets}")
+    result = index.search("forro", year=1975)
+    ok &= check("Filtro de ano", set(ids(result)) == {"album:a2"}, f"{ids(result)}")
+
+    # 7. Álbuns privados e agendados (e suas músicas) não aparecem
+    ok &= check("Privado excluído", index.search("segredo")["total"] == 0)
+    ok &= check("Agendado excluído", index.search("lancamento futuro")["total"] == 0)
+    index.update_album({"id": "a4", "is_private": False})
+    ok &= check("Publicado aparece", set(ids(index.search("segredo"))) == {"album:a4", "song:s5"},
+                f"{ids(index.search('segredo'))}")
+    index.update_album({"id": "a4", "is_deleted": True})
+    ok &= check("Na lixeira some", index.search("segredo")["total"] == 0)
+
+    # 8. Paginação
+    page = index.search("ramalho", limit=1, offset=1)
+    full = index.search("ramalho")
+    ok &= check("Paginação", page["total"] == full["total"] and ids(page) == ids(full)[1:2], f"{ids(page)}")
+
+    # 9. Incremental durante um rebuild: mudanças feitas enquanto as linhas carregam sobrevivem à troca
+    index.begin_rebuild()
+    loaded_albums = [dict(album) for album in ALBUMS]   # "lido do banco" antes das mudanças abaixo
+    loaded_songs = [dict(song) for song in SONGS]
+    index.add_album({"id": "a6", "title": "Tropicália Nova", "artist_name": "Gal", "genre": "MPB"},
+                    [{"id": "s6", "title": "Baby", "artist_name": "Gal", "album_name": "Tropicália Nova", "genre": "MPB"}])
+    index.remove_album("a2")
+    ok &= check("Adição incremental", set(ids(index.search("tropicalia"))) == {"album:a6", "song:s6"})
+    ok &= check("Remoção incremental", index.search("asa branca")["total"] == 0)
+    index.replace_all(loaded_albums, loaded_songs)
+    ok &= check("Adição mantida depois da troca", set(ids(index.search("tropicalia"))) == {"album:a6", "song:s6"})
+    ok &= check("Remoção mantida depois da troca", index.search("gonzaga")["total"] == 0)
+    ok &= check("Resto do índice trocado", "album:a1" in ids(index.search("canções"))
+                and index.search("segredo")["total"] == 0, f"{len(index)} documentos")
+    return ok
+
+
+def main():
+    # Configurar antes de importar o índice (lê as variáveis no import; o banco não é usado)
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    # Chave no formato JWT (o cliente do Supabase valida o formato)
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.dGVzdA")
+    from routes import catalog_search
+
+    ok = run_checks(catalog_search)
+    print("Todos os testes passaram" if ok else "Falhas encontradas")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
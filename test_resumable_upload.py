@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Test resumable (TUS) upload against a local storage stand-in
+# Não precisa de Supabase: sobe um servidor local que imita /storage/v1/upload/resumable
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK = 6 * 1024 * 1024
+
+
+class StandIn:
+    """Estado do servidor: uploads em andamento, objetos finalizados e falhas injetadas."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.objects = {}
+        self.patch_count = 0
+        self.patch_bytes = 0
+        self.heads = 0
+        # Lista de falhas para os próximos PATCH: "store" grava e responde 500, "drop" só responde 500
+        self.failures = []
+        self.fail_after = None
+
+
+state = StandIn()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path == "/storage/v1/upload/resumable":
+            upload_id = uuid.uuid4().hex
+            metadata = dict(item.split(" ") for item in self.headers["Upload-Metadata"].split(","))
+            with state.lock:
+                state.uploads[upload_id] = {
+                    "length": int(self.headers["Upload-Length"]),
+                    "data": bytearray(),
+                    "metadata": metadata,
+                }
+            self._reply(201, {"Location": f"/storage/v1/upload/resumable/{upload_id}", "Tus-Resumable": "1.0.0"})
+        elif self.path.startswith("/storage/v1/object/"):
+            with state.lock:
+                state.objects[self.path[len("/storage/v1/object/"):]] = self._body()
+            self._reply(200)
+        else:
+            self._reply(404)
+
+    def do_HEAD(self):
+        upload = state.uploads.get(self.path.rsplit("/", 1)[-1])
+        with state.lock:
+            state.heads += 1
+        if upload is None:
+            self._reply(404)
+            return
+        self._reply(200, {"Upload-Offset": str(len(upload["data"])), "Upload-Length": str(upload["length"])})
+
+    def do_PATCH(self):
+        upload_id = self.path.rsplit("/", 1)[-1]
+        upload = state.uploads.get(upload_id)
+        body = self._body()
+        if upload is None:
+            self._reply(404)
+            return
+        with state.lock:
+            state.patch_count += 1
+            state.patch_bytes += len(body)
+            if state.fail_after is not None and len(upload["data"]) >= state.fail_after:
+                self._reply(500)
+                return
+            failure = state.failures.pop(0) if state.failures else None
+            if int(self.headers["Upload-Offset"]) != len(upload["data"]):
+                self._reply(409)
+                return
+            remaining = upload["length"] - len(upload["data"])
+            if len(body) != CHUNK and len(body) != remaining:
+                self._reply(400)
+                return
+            if failure != "drop":
+                upload["data"].extend(body)
+            if failure:
+                self._reply(500)
+                return
+            if len(upload["data"]) == upload["length"]:
+                state.objects[upload_id] = bytes(upload["data"])
+        self._reply(204, {"Upload-Offset": str(len(upload["data"])), "Tus-Resumable": "1.0.0"})
+
+
+def make_file(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    with open(path, "rb") as f:
+        return path, hashlib.sha256(f.read()).hexdigest()
+
+
+def stored_digest(upload_id_or_path):
+    return hashlib.sha256(state.objects[upload_id_or_path]).hexdigest()
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    work_dir = tempfile.mkdtemp(prefix="tus_test_")
+
+    # Configurar antes de importar o uploader (lê as variáveis no import)
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_SERVICE_KEY"] = "test-key"
+    os.environ["STORAGE_RESUMABLE_URL"] = f"{os.environ['SUPABASE_URL']}/storage/v1/upload/resumable"
+    os.environ["CHECKPOINT_DB_PATH"] = os.path.join(work_dir, "checkpoints.db")
+    from routes import resumable_upload
+    resumable_upload.CHUNK_RETRY_MAX_SECONDS = 0
+
+    ok = True
+
+    # 1. Arquivo de 20MB com falhas em alguns chunks (gravado sem resposta e não gravado)
+    path, digest = make_file(work_dir, "big.zip", 20 * 1024 * 1024 + 123)
+    state.failures = [None, "store", None, "drop"]
+    progress = []
+    print("Upload 20MB com falhas...", end="", flush=True)
+    resumable_upload.upload_file(path, "musica", "test/big.zip", "application/zip", on_progress=progress.append)
+    upload_id = next(iter(state.objects))
+    passed = stored_digest(upload_id) == digest and sum(progress) == os.path.getsize(path)
+    print(f" [{'OK' if passed else 'ERRO'}] {state.patch_count} PATCH, {state.heads} HEAD, progresso={sum(progress)}")
+    ok &= passed
+
+    # 2. Interrupção: o servidor para de aceitar depois de 12MB; a segunda chamada continua de onde parou
+    path, digest = make_file(work_dir, "resume.zip", 25 * 1024 * 1024)
+    state.objects.clear()
+    state.patch_bytes = 0
+    state.fail_after = 2 * CHUNK
+    retries = resumable_upload.CHUNK_MAX_RETRIES
+    resumable_upload.CHUNK_MAX_RETRIES = 1
+    print("Upload interrompido...", end="", flush=True)
+    try:
+        resumable_upload.upload_file(path, "musica", "test/resume.zip", "application/zip")
+        print(" [ERRO] deveria ter falhado")
+        ok = False
+    except resumable_upload.ResumableUploadError:
+        print(" [OK] falhou como esperado")
+    resumable_upload.CHUNK_MAX_RETRIES = retries
+    state.fail_after = None
+    state.patch_bytes = 0
+    print("Retomando...", end="", flush=True)
+    resumable_upload.upload_file(path, "musica", "test/resume.zip", "application/zip")
+    upload_id = next(iter(state.objects))
+    sent = state.patch_bytes
+    passed = stored_digest(upload_id) == digest and sent == os.path.getsize(path) - 2 * CHUNK
+    print(f" [{'OK' if passed else 'ERRO'}] reenviados {sent / 1024 / 1024:.1f}MB de {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+    ok &= passed
+
+    # 3. Arquivo pequeno: uma requisição só
+    path, digest = make_file(work_dir, "small.zip", 100 * 1024)
+    print("Upload pequeno...", end="", flush=True)
+    resumable_upload.upload_object(path, "musica", "test/small.zip", "application/zip")
+    passed = stored_digest("musica/test/small.zip") == digest
+    print(f" [{'OK' if passed else 'ERRO'}]")
+    ok &= passed
+
+    server.shutdown()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print("Todos os testes passaram" if ok else "Falhas encontradas")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
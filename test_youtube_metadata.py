@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# Test the YouTube oEmbed resolver against a local oEmbed stand-in
+# Não precisa de Supabase nem de internet: sobe um servidor local que imita /oembed
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Vídeos conhecidos pelo stand-in; qualquer outro id responde 404
+VIDEOS = {
+    "dQw4w9WgXcQ": {"title": "Never Gonna Give You Up", "author_name": "Rick Astley"},
+    "aaaaaaaaaaa": {"title": "Vídeo A", "author_name": "Artista A"},
+    "bbbbbbbbbbb": {"title": "Vídeo B", "author_name": "Artista B"},
+}
+DELAY = 0.2
+
+
+class StandIn:
+    """Requisições recebidas, pico de concorrência e falhas injetadas."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.fail_next = 0
+
+
+state = StandIn()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        video_id = parse_qs(urlparse(query["url"][0]).query)["v"][0]
+        with state.lock:
+            state.requests.append(video_id)
+            state.active += 1
+            state.max_active = max(state.max_active, state.active)
+            fail = state.fail_next > 0
+            state.fail_next -= 1 if fail else 0
+        time.sleep(DELAY)
+        with state.lock:
+            state.active -= 1
+
+        if fail:
+            status, body = 503, b""
+        elif video_id in VIDEOS:
+            status = 200
+            body = json.dumps({
+                **VIDEOS[video_id],
+                "thumbnail_url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            }).encode()
+        else:
+            status, body = 404, b"Not Found"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def check(name, passed, detail=""):
+    print(f"{name}... [{'OK' if passed else 'ERRO'}] {detail}")
+    return passed
+
+
+async def run_checks(youtube_metadata):
+    ok = True
+
+    # 1. Vídeo existente: título e autor; segunda chamada vem do cache
+    metadata = await youtube_metadata.resolve("dQw4w9WgXcQ")
+    again = await youtube_metadata.resolve("dQw4w9WgXcQ")
+    ok &= check("Vídeo existente", metadata["title"] == "Never Gonna Give You Up" and again == metadata
+                and state.requests.count("dQw4w9WgXcQ") == 1, f"{metadata}")
+
+    # 2. Id inexistente: None e cache negativo
+    missing = await youtube_metadata.resolve("zzzzzzzzzzz")
+    missing_again = await youtube_metadata.resolve("zzzzzzzzzzz")
+    ok &= check("Id inexistente (cache negativo)", missing is None and missing_again is None
+                and state.requests.count("zzzzzzzzzzz") == 1)
+
+    # 3. Id malformado: nem chega ao servidor
+    before = len(state.requests)
+    ok &= check("Id malformado", await youtube_metadata.resolve("curto") is None and len(state.requests) == before)
+
+    # 4. Chamadas simultâneas do mesmo id: uma requisição só
+    results = await asyncio.gather(*(youtube_metadata.resolve("aaaaaaaaaaa") for _ in range(10)))
+    ok &= check("Mesmo id em paralelo", all(result == results[0] for result in results)
+                and state.requests.count("aaaaaaaaaaa") == 1)
+
+    # 5. Lote grande: concorrência limitada
+    state.max_active = 0
+    ids = [f"x{i:010d}" for i in range(12)] + ["bbbbbbbbbbb"]
+    started = time.monotonic()
+    resolved = await youtube_metadata.resolve_many(ids + ids)
+    elapsed = time.monotonic() - started
+    ok &= check("Lote com concorrência limitada", len(resolved) == len(ids) and resolved["bbbbbbbbbbb"]["title"] == "Vídeo B"
+                and state.max_active <= youtube_metadata.OEMBED_CONCURRENCY,
+                f"{len(ids)} ids em {elapsed:.2f}s, pico de {state.max_active} requisições")
+
+    # 6. Erro do servidor: não vai para o cache, a próxima tentativa funciona
+    state.fail_next = 1
+    failed = await youtube_metadata.resolve_many(["dQw4w9WgXcQ", "ccccccccccc"])
+    retried = await youtube_metadata.resolve("ccccccccccc")
+    ok &= check("Erro 503 não é cacheado", isinstance(failed["ccccccccccc"], youtube_metadata.OEmbedError)
+                and retried is None)
+
+    # 7. Worker: linhas enfileiradas são resolvidas em lote e gravadas (banco substituído por uma lista)
+    updates = []
+    youtube_metadata._update_rows = lambda row_ids, fields: updates.append((sorted(row_ids), fields))
+    youtube_metadata.start_background_tasks()
+    youtube_metadata._rescan_task.cancel()
+    for row_id, video_id in ((1, "aaaaaaaaaaa"), (2, "aaaaaaaaaaa"), (3, "yyyyyyyyyyy"), (3, "yyyyyyyyyyy")):
+        youtube_metadata.enqueue(row_id, video_id)
+    await asyncio.sleep(youtube_metadata.METADATA_BATCH_WAIT + DELAY + 0.5)
+    await youtube_metadata.stop_background_tasks()
+    by_rows = {tuple(row_ids): fields for row_ids, fields in updates}
+    ok &= check("Worker em lote", len(updates) == 2
+                and by_rows.get((1, 2), {}).get("title") == "Vídeo A"
+                and by_rows.get((3,), {}).get("metadata_status") == youtube_metadata.STATUS_INVALID, f"{updates}")
+    return ok
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Configurar antes de importar o resolver (lê as variáveis no import)
+    os.environ["YOUTUBE_OEMBED_URL"] = f"http://127.0.0.1:{server.server_address[1]}/oembed"
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    # Chave no formato JWT (o cliente do Supabase valida o formato; o banco não é usado)
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.dGVzdA")
+    from routes import youtube_metadata
+
+    ok = asyncio.run(run_checks(youtube_metadata))
+
+    server.shutdown()
+    print("Todos os testes passaram" if ok else "Falhas encontradas")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())